@@ -38,6 +38,14 @@ api_common_opts = [
                help='Base URL that will be presented to users in links '
                     'to the OpenStack Volume API',
                deprecated_name='osapi_compute_link_prefix'),
+    cfg.BoolOpt('osapi_pagination_cursor',
+                default=False,
+                help='Use opaque cursors holding the sort key values of the '
+                     'last item as the marker of the next links of volume, '
+                     'snapshot and backup listings, so that the next page '
+                     'is found with an index seek instead of first loading '
+                     'the marker item. Item ids are still accepted as '
+                     'markers.'),
 ]
 
 CONF = cfg.CONF
@@ -264,6 +272,10 @@ class ViewBuilder(object):
     """Model API responses as dictionaries."""
 
     _collection_name = None
+    # Whether the listing supports pagination cursors as markers
+    _pagination_cursor = False
+    # API sort keys that map to a differently named attribute of the items
+    _sort_key_attributes = {}
 
     def _get_links(self, request, identifier):
         return [{"rel": "self",
@@ -342,13 +354,35 @@ class ViewBuilder(object):
             last_item_id = last_item[id_key]
         else:
             last_item_id = last_item["id"]
+        marker = self._get_pagination_cursor(request, last_item)
         links.append({
             "rel": "next",
-            "href": self._get_next_link(request, last_item_id,
+            "href": self._get_next_link(request, marker or last_item_id,
                                         collection_name),
         })
         return links
 
+    def _get_pagination_cursor(self, request, item):
+        """Return the cursor of the page following the given item.
+
+        The cursor holds the values of the item for every key the listing
+        is sorted by, including the created_at and id keys the database
+        layer always sorts by last.
+
+        :returns: the cursor, or None if cursors are not used or the item
+                  does not provide all of the sort key values
+        """
+        if not (self._pagination_cursor and CONF.osapi_pagination_cursor):
+            return None
+        sort_keys, __ = get_sort_params(request.GET.copy())
+        keys = [self._sort_key_attributes.get(key, key) for key in sort_keys]
+        keys.extend(key for key in ('created_at', 'id') if key not in keys)
+        try:
+            values = {key: item[key] for key in keys}
+        except (AttributeError, KeyError, NotImplementedError):
+            return None
+        return utils.encode_pagination_cursor(values)
+
     def _update_link_prefix(self, orig_url, prefix):
         if not prefix:
             return orig_url
@@ -0,0 +1,90 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""The image-volume cache extension."""
+
+from oslo_log import log as logging
+import six
+import webob
+from webob import exc
+
+from cinder.api import extensions
+from cinder.api.openstack import wsgi
+from cinder import exception
+from cinder.i18n import _
+from cinder import volume
+
+
+LOG = logging.getLogger(__name__)
+
+
+def authorize(context, action_name):
+    extensions.extension_authorizer('volume',
+                                    'image_volume_cache:%s' % action_name)(
+        context)
+
+
+class ImageVolumeCacheController(wsgi.Controller):
+    """The image-volume cache API controller for the OpenStack API."""
+
+    def __init__(self):
+        self.volume_api = volume.API()
+        super(ImageVolumeCacheController, self).__init__()
+
+    def warm(self, req, body):
+        """Create the image-volume cache entries of images on a backend.
+
+        The entries are created in the background, their progress is
+        reported with image_volume_cache.warm notifications.
+        """
+        context = req.environ['cinder.context']
+        authorize(context, 'warm')
+        self.assert_valid_body(body, 'warm')
+
+        warm = body['warm']
+        host = warm.get('host')
+        if not host or not isinstance(host, six.string_types):
+            msg = _("Missing required element 'host' in request body.")
+            raise exc.HTTPBadRequest(explanation=msg)
+        image_ids = warm.get('image_ids')
+        if (not image_ids or not isinstance(image_ids, list) or
+                not all(isinstance(image_id, six.string_types)
+                        for image_id in image_ids)):
+            msg = _("'image_ids' must be a non-empty list of image IDs.")
+            raise exc.HTTPBadRequest(explanation=msg)
+
+        try:
+            self.volume_api.warm_image_cache(context, host, image_ids)
+        except exception.InvalidHost as error:
+            raise exc.HTTPBadRequest(explanation=error.msg)
+        except exception.ImageNotFound as error:
+            raise exc.HTTPNotFound(explanation=error.msg)
+
+        return webob.Response(status_int=202)
+
+
+class Image_volume_cache(extensions.ExtensionDescriptor):
+    """Image-volume cache management support."""
+
+    name = "ImageVolumeCache"
+    alias = "os-image-volume-cache"
+    namespace = ("http://docs.openstack.org/volume/ext/"
+                 "image-volume-cache/api/v2")
+    updated = "2016-03-01T00:00:00+00:00"
+
+    def get_resources(self):
+        resources = []
+        res = extensions.ResourceExtension(
+            Image_volume_cache.alias, ImageVolumeCacheController(),
+            collection_actions={'warm': 'POST'})
+        resources.append(res)
+        return resources
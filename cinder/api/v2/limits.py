@@ -19,12 +19,16 @@ Module dedicated functions/classes dealing with rate limiting requests.
 
 import collections
 import copy
+import hashlib
 import math
+import os
 import re
 import time
 
+from oslo_config import cfg
 from oslo_serialization import jsonutils
 from oslo_utils import importutils
+import six
 from six.moves import http_client
 import webob.dec
 import webob.exc
@@ -32,10 +36,14 @@ import webob.exc
 from cinder.api.openstack import wsgi
 from cinder.api.views import limits as limits_views
 from cinder.api import xmlutil
+from cinder import context
+from cinder import db
 from cinder.i18n import _
 from cinder import quota
+from cinder import utils
 from cinder.wsgi import common as base_wsgi
 
+CONF = cfg.CONF
 QUOTAS = quota.QUOTAS
 LIMITS_PREFIX = "limits."
 
@@ -369,6 +377,211 @@ class Limiter(object):
         return result
 
 
+class MemoryLimiterStore(object):
+    """Limit buckets kept in memory, shared by the limiters of a process."""
+
+    def __init__(self):
+        self.buckets = {}
+
+    def reserve(self, key, capacity, request_value, requested, returned,
+                now):
+        """Reserve requests from the bucket of a limit.
+
+        :param key: identifier of the limit and user the bucket is for
+        :param capacity: number of units the bucket holds
+        :param request_value: units added to the bucket by a request
+        :param requested: number of requests to reserve
+        :param returned: number of requests reserved earlier and not used
+        :param now: current time
+        :returns: tuple of the number of requests granted, the delay before
+                  one more request would be granted or None, and the number
+                  of requests still available
+        """
+        water_level, last_leak = self.buckets.get(key, (0, None))
+        water_level, granted, delay, remaining = utils.leaky_bucket_reserve(
+            water_level, last_leak, capacity, request_value, requested,
+            returned, now)
+        self.buckets[key] = (water_level, now)
+        return granted, delay, remaining
+
+
+class FileLimiterStore(MemoryLimiterStore):
+    """Limit buckets kept in a file, shared by the API workers of a node.
+
+    The file is protected by an external lock, it can be shared by several
+    nodes if both the file and the lock path are on a shared file system.
+    """
+
+    def __init__(self, path=None):
+        super(FileLimiterStore, self).__init__()
+        self.path = path or os.path.join(CONF.state_path,
+                                         'rate_limit_buckets.json')
+
+    @utils.synchronized('rate-limit-buckets', external=True)
+    def reserve(self, key, capacity, request_value, requested, returned,
+                now):
+        try:
+            with open(self.path) as f:
+                self.buckets = jsonutils.load(f)
+        except (IOError, ValueError):
+            # Missing or torn file, start over with empty buckets
+            self.buckets = {}
+        result = super(FileLimiterStore, self).reserve(
+            key, capacity, request_value, requested, returned, now)
+        with open(self.path, 'w') as f:
+            jsonutils.dump(self.buckets, f)
+        return result
+
+
+class DbLimiterStore(object):
+    """Limit buckets kept in the database, shared by all the API nodes.
+
+    There is a bucket per user and limit, the buckets which are empty are
+    deleted every PURGE_INTERVAL seconds by each API worker.
+    """
+
+    PURGE_INTERVAL = 3600
+
+    def __init__(self):
+        self.context = context.get_admin_context()
+        self.purged_at = None
+
+    def reserve(self, key, capacity, request_value, requested, returned,
+                now):
+        if (self.purged_at is None or
+                now - self.purged_at >= self.PURGE_INTERVAL):
+            self.purged_at = now
+            db.rate_limit_bucket_purge(self.context, now)
+        return db.rate_limit_bucket_reserve(self.context, key, capacity,
+                                            request_value, requested,
+                                            returned, now)
+
+
+class _Lease(object):
+    """Requests a limiter may accept before going back to the store."""
+
+    def __init__(self, tokens, synced_at, retry_at):
+        self.tokens = tokens
+        self.synced_at = synced_at
+        self.retry_at = retry_at
+
+
+class SharedLimiter(Limiter):
+    """Rate-limit checking class which shares limits between API workers.
+
+    Every API worker using the in-memory `Limiter` enforces the limits on
+    its own, so that N workers accept N times as many requests as they
+    should.  This limiter instead keeps the buckets of the limits in a store
+    shared by the workers.
+
+    To avoid going to the store for every request, each worker leases a
+    fraction of the requests allowed by a limit and accepts requests from
+    that lease.  The unused part of the lease is given back to the store and
+    the lease renewed when it is used up or every sync_interval seconds.
+    Rejected requests do not go to the store either until the delay given
+    by the store has expired.
+
+    To use it, set the limiter of the ratelimit filter in api-paste.ini::
+
+        [filter:ratelimit]
+        ...
+        limiter = cinder.api.v2.limits.SharedLimiter
+        store = database
+    """
+
+    STORES = {
+        'memory': MemoryLimiterStore,
+        'file': FileLimiterStore,
+        'database': DbLimiterStore,
+    }
+
+    def __init__(self, limits, store='database', sync_interval=1,
+                 lease_fraction=0.1, **kwargs):
+        """Initialize the new `SharedLimiter`.
+
+        @param limits: List of `Limit` objects
+        @param store: Store of the limit buckets, either memory, file,
+                      database or the class path of a custom store
+        @param sync_interval: Seconds after which a lease is renewed
+        @param lease_fraction: Fraction of the requests allowed by a limit
+                               leased at once
+        """
+        super(SharedLimiter, self).__init__(limits, **kwargs)
+        if isinstance(store, six.string_types):
+            if store in self.STORES:
+                store = self.STORES[store]()
+            else:
+                store = importutils.import_object(store)
+        self.store = store
+        self.sync_interval = float(sync_interval)
+        self.lease_fraction = float(lease_fraction)
+        self.leases = {}
+
+    def check_for_delay(self, verb, url, username=None):
+        """Check the given verb/user/user triplet for limit.
+
+        @return: Tuple of delay (in seconds) and error message (or None, None)
+        """
+        delays = []
+
+        for limit in self.levels[username]:
+            if limit.verb != verb or not re.match(limit.regex, url):
+                continue
+            delay = self._consume(limit, username)
+            if delay:
+                delays.append((delay, limit.error_message))
+
+        if delays:
+            delays.sort()
+            return delays[0]
+
+        return None, None
+
+    def _consume(self, limit, username):
+        """Accept a request from the lease of a limit, renewing it if needed.
+
+        The lease is used without locking: with eventlet the green threads
+        of the worker cannot switch in between.
+
+        @return: Delay before the request would be accepted or None
+        """
+        now = limit._get_time()
+        key = self._get_key(limit, username)
+        lease = self.leases.get(key)
+        if lease is None or now - lease.synced_at >= self.sync_interval:
+            lease = self._renew(key, limit, lease, now)
+        elif lease.tokens <= 0 and now >= lease.retry_at:
+            lease = self._renew(key, limit, lease, now)
+
+        if lease.tokens <= 0:
+            limit.next_request = lease.retry_at
+            return lease.retry_at - now
+
+        lease.tokens -= 1
+        limit.remaining = max(limit.remaining - 1, 0)
+        limit.next_request = now
+        return None
+
+    def _renew(self, key, limit, lease, now):
+        requested = max(int(limit.value * self.lease_fraction), 1)
+        returned = lease.tokens if lease else 0
+        granted, delay, remaining = self.store.reserve(
+            key, limit.capacity, limit.request_value, requested, returned,
+            now)
+        lease = _Lease(granted, now, now + (delay or 0))
+        self.leases[key] = lease
+        limit.remaining = granted + remaining
+        return lease
+
+    @staticmethod
+    def _get_key(limit, username):
+        # Limits are identified by their definition rather than position,
+        # in case API nodes are configured with different limits
+        key = '%s\n%s\n%s\n%s\n%s' % (username, limit.verb, limit.regex,
+                                      limit.value, limit.unit)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
 class WsgiLimiter(object):
     """Rate-limit checking from a WSGI application.
 
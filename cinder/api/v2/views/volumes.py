@@ -26,6 +26,10 @@ class ViewBuilder(common.ViewBuilder):
     """Model a server API response as a python dictionary."""
 
     _collection_name = "volumes"
+    _pagination_cursor = True
+    _sort_key_attributes = {'name': 'display_name'}
+    # Volume columns needed to build the summary view
+    summary_columns = ['id', 'display_name']
 
     def __init__(self):
         """Initialize view builder."""
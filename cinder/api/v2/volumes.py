@@ -241,6 +241,16 @@ class VolumeController(wsgi.Controller):
             del filters['name']
 
         self.volume_api.check_volume_filters(filters)
+        if not is_detail:
+            # The summary only shows a few columns of the volumes, read just
+            # those instead of loading whole volumes with their related data
+            volumes = self.volume_api.get_all(
+                context, marker, limit, sort_keys=sort_keys,
+                sort_dirs=sort_dirs, filters=filters, offset=offset,
+                columns=self._view_builder.summary_columns)
+            req.cache_db_volumes(volumes)
+            return self._view_builder.summary_list(req, volumes)
+
         volumes = self.volume_api.get_all(context, marker, limit,
                                           sort_keys=sort_keys,
                                           sort_dirs=sort_dirs,
@@ -253,11 +263,7 @@ class VolumeController(wsgi.Controller):
 
         req.cache_db_volumes(volumes.objects)
 
-        if is_detail:
-            volumes = self._view_builder.detail_list(req, volumes)
-        else:
-            volumes = self._view_builder.summary_list(req, volumes)
-        return volumes
+        return self._view_builder.detail_list(req, volumes)
 
     def _image_uuid_from_ref(self, image_ref, context):
         # If the image ref was generated by nova api, strip image_ref
@@ -22,11 +22,17 @@
 """
 
 import abc
+import collections
+import functools
 import hashlib
+import itertools
 import json
 import os
+import sys
 
 import eventlet
+from eventlet import semaphore
+from eventlet import tpool
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_service import loopingcall
@@ -46,12 +52,202 @@ LOG = logging.getLogger(__name__)
 chunkedbackup_service_opts = [
     cfg.StrOpt('backup_compression_algorithm',
                default='zlib',
-               help='Compression algorithm (None to disable)'),
+               help='Compression algorithm (None to disable). Supported '
+                    'algorithms are zlib, bz2, zstd and lz4; zstd needs '
+                    'the zstandard library and lz4 the lz4 library.'),
+    cfg.IntOpt('backup_compression_level',
+               help='Compression level passed to the compression '
+                    'algorithm. The default level of the algorithm is '
+                    'used when unset.'),
+    cfg.BoolOpt('backup_compression_adaptive',
+                default=False,
+                help='Compress a sample of every chunk first and store the '
+                     'chunk uncompressed when the sample does not shrink '
+                     'below backup_compression_adaptive_ratio of its size.'),
+    cfg.FloatOpt('backup_compression_adaptive_ratio',
+                 default=0.9,
+                 help='Compressed to original size ratio a chunk sample '
+                      'must reach for the chunk to be compressed when '
+                      'backup_compression_adaptive is enabled.'),
+    cfg.IntOpt('backup_upload_workers',
+               default=2, min=1,
+               help='Number of chunks a chunked backup driver uploads to '
+                    'the backup repository concurrently.'),
+    cfg.IntOpt('backup_pipeline_queue_depth',
+               default=4, min=1,
+               help='Maximum number of chunks read from the volume that '
+                    'may be waiting to be compressed or uploaded. Memory '
+                    'used by a backup is bounded by this value times the '
+                    'chunk size.'),
+    cfg.IntOpt('backup_sha_workers',
+               default=4, min=1,
+               help='Number of native threads used to compute the SHA-256 '
+                    'hashes of the blocks of a backup chunk.'),
+    cfg.BoolOpt('backup_detect_zeros',
+                default=False,
+                help='Record hash blocks made only of zeros as holes in the '
+                     'backup metadata instead of writing them to the backup '
+                     'repository. Backups with holes can only be restored '
+                     'by backup services of this release or later, so only '
+                     'enable it once every backup service is upgraded.'),
+    cfg.IntOpt('backup_restore_prefetch_depth',
+               default=4, min=1,
+               help='Number of backup objects a chunked backup driver '
+                    'downloads and decompresses ahead of the one being '
+                    'written to the volume during a restore.'),
+    cfg.IntOpt('backup_restore_memory_budget_mb',
+               default=256, min=1,
+               help='Maximum amount of restored data, in MiB, that may be '
+                    'held in memory waiting to be written to the volume. '
+                    'At least one object is always fetched regardless of '
+                    'its size.'),
+    cfg.BoolOpt('backup_restore_use_pwrite',
+                default=False,
+                help='Write restored objects with pwrite() at their offset '
+                     'as soon as they are decompressed, instead of in '
+                     'offset order. Only used when the volume file has a '
+                     'file descriptor.'),
+    cfg.BoolOpt('backup_restore_skip_holes',
+                default=False,
+                help='Do not write the holes of a full backup to the volume '
+                     'being restored, leaving it sparse. Only enable this '
+                     'when the volumes backups are restored to read back '
+                     'zeros where they were never written. Holes of '
+                     'incremental backups are always written.'),
+    cfg.BoolOpt('backup_deduplication',
+                default=False,
+                help='Name backup chunks after the SHA-256 of their content '
+                     'so that a chunk shared by several backups in the same '
+                     'container is only stored once. Each backup keeps a '
+                     'reference to the chunks it uses and a chunk is '
+                     'deleted along with the last backup referencing it. '
+                     'Only effective when backups share a container.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(chunkedbackup_service_opts)
 
+# Size and number of the slices of a chunk compressed to decide whether
+# the chunk is worth compressing in adaptive mode.
+_SAMPLE_SLICE_BYTES = 16 * units.Ki
+_SAMPLE_SLICES = 4
+
+
+def _md5_hexdigest(data):
+    return hashlib.md5(data).hexdigest()
+
+
+def _sha256_hexdigest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _sha256_blocks(view, block_size):
+    """Return the SHA-256 of every block_size bytes of a memoryview."""
+    return [hashlib.sha256(view[offset:offset + block_size]).hexdigest()
+            for offset in range(0, len(view), block_size)]
+
+
+def _zero_runs(data, block_size):
+    """Split data in runs of blocks that are all zeros or not.
+
+    Returns a list of (offset, length, is_zero) tuples in offset order.
+    """
+    runs = []
+    data_len = len(data)
+    run_offset = 0
+    run_is_zero = None
+    for offset in range(0, data_len, block_size):
+        end = min(offset + block_size, data_len)
+        is_zero = data.count(b'\0', offset, end) == end - offset
+        if is_zero != run_is_zero:
+            if offset > run_offset:
+                runs.append((run_offset, offset - run_offset, run_is_zero))
+            run_offset = offset
+            run_is_zero = is_zero
+    if data_len > run_offset:
+        runs.append((run_offset, data_len - run_offset, run_is_zero))
+    return runs
+
+
+def _pwrite_all(fd, data, offset):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+class _Codec(object):
+    """Compressor exposing the compress/decompress functions of zlib."""
+
+    def __init__(self, compress, decompress):
+        self.compress = compress
+        self.decompress = decompress
+
+
+class _BackupPipeline(object):
+    """Bounded pipeline used to write backup chunks concurrently.
+
+    The reader submits jobs in volume order. Every job runs in its own green
+    thread; CPU bound work is expected to be pushed to native threads by the
+    job itself. At most ``queue_depth`` jobs are outstanding at any time, and
+    at most ``workers`` of them hold an upload slot at once.
+    """
+
+    def __init__(self, workers, queue_depth):
+        self._pool = eventlet.GreenPool(max(workers, queue_depth))
+        self._upload_slots = semaphore.Semaphore(workers)
+        self._exc_info = None
+        # Entries of the deduplicated chunks submitted by the backup, by
+        # chunk name, and the entries of the later copies of these chunks.
+        self.dedup_chunks = {}
+        self._dedup_copies = []
+        # (chunk name, compression) of the deduplicated chunks found
+        # already stored instead of being written by the backup.
+        self.reused_dedup_chunks = []
+
+    def upload_slot(self):
+        """Semaphore that bounds the number of concurrent uploads."""
+        return self._upload_slots
+
+    def submit(self, func, *args, **kwargs):
+        self.check()
+        self._pool.spawn_n(self._run, func, *args, **kwargs)
+
+    def _run(self, func, *args, **kwargs):
+        # Once a job has failed the backup is going to be aborted, so there
+        # is no point in writing the remaining chunks.
+        if self._exc_info is not None:
+            return
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            if self._exc_info is None:
+                self._exc_info = sys.exc_info()
+
+    def check(self):
+        """Re-raise the first error raised by a job, if any."""
+        if self._exc_info is not None:
+            exc_info = self._exc_info
+            self._exc_info = None
+            six.reraise(*exc_info)
+
+    def add_dedup_copy(self, chunk_name, obj):
+        """Complete obj from the entry of a chunk submitted earlier.
+
+        A chunk seen several times in a backup is only written once, the
+        entries of its other copies are completed once it is written.
+        """
+        self._dedup_copies.append((self.dedup_chunks[chunk_name], obj))
+
+    def wait(self):
+        """Wait for all outstanding jobs and re-raise their first error."""
+        self._pool.waitall()
+        self.check()
+        for first, obj in self._dedup_copies:
+            obj.update((key, first[key]) for key in ('compression', 'md5')
+                       if key in first)
+
 
 @six.add_metaclass(abc.ABCMeta)
 class ChunkedBackupDriver(driver.BackupDriver):
@@ -65,19 +261,51 @@ class ChunkedBackupDriver(driver.BackupDriver):
        Provides abstract methods to be implmented in concrete chunking drivers.
     """
 
-    DRIVER_VERSION = '1.0.0'
-    DRIVER_VERSION_MAPPING = {'1.0.0': '_restore_v1'}
+    # Version 1.1.0 backups may contain holes and deduplicated chunks,
+    # which services of earlier releases would not restore correctly.
+    # Backups which don't use them, nor have a parent using them, are
+    # still written as 1.0.0.
+    DRIVER_VERSION = '1.1.0'
+    DRIVER_VERSION_COMPATIBLE = '1.0.0'
+    DRIVER_VERSION_MAPPING = {'1.0.0': '_restore_v1',
+                              '1.1.0': '_restore_v1'}
+
+    def _get_compressor(self, algorithm, level=None):
+        """Return the compressor for an algorithm, None for no compression.
 
-    def _get_compressor(self, algorithm):
+        The level is only used to compress, it is not needed to decompress.
+        """
         try:
             if algorithm.lower() in ('none', 'off', 'no'):
                 return None
             elif algorithm.lower() in ('zlib', 'gzip'):
                 import zlib as compressor
-                return compressor
+                if level is None:
+                    return compressor
+                return _Codec(lambda data: compressor.compress(data, level),
+                              compressor.decompress)
             elif algorithm.lower() in ('bz2', 'bzip2'):
                 import bz2 as compressor
-                return compressor
+                if level is None:
+                    return compressor
+                return _Codec(lambda data: compressor.compress(data, level),
+                              compressor.decompress)
+            elif algorithm.lower() in ('zstd', 'zstandard'):
+                import zstandard
+                kwargs = {} if level is None else {'level': level}
+                # Compression contexts are not thread safe, and chunks are
+                # compressed concurrently in native threads.
+                return _Codec(
+                    lambda data: zstandard.ZstdCompressor(
+                        **kwargs).compress(data),
+                    lambda data: zstandard.ZstdDecompressor().decompress(
+                        data))
+            elif algorithm.lower() == 'lz4':
+                import lz4.frame
+                kwargs = {} if level is None else {'compression_level': level}
+                return _Codec(
+                    lambda data: lz4.frame.compress(data, **kwargs),
+                    lz4.frame.decompress)
         except ImportError:
             pass
 
@@ -98,8 +326,23 @@ class ChunkedBackupDriver(driver.BackupDriver):
         self.az = CONF.storage_availability_zone
         self.backup_compression_algorithm = CONF.backup_compression_algorithm
         self.compressor = \
-            self._get_compressor(CONF.backup_compression_algorithm)
+            self._get_compressor(CONF.backup_compression_algorithm,
+                                 CONF.backup_compression_level)
+        self.compression_adaptive = CONF.backup_compression_adaptive
+        self.compression_adaptive_ratio = \
+            CONF.backup_compression_adaptive_ratio
+        self.upload_workers = CONF.backup_upload_workers
+        self.pipeline_queue_depth = CONF.backup_pipeline_queue_depth
+        self.sha_workers = CONF.backup_sha_workers
+        self.detect_zeros = CONF.backup_detect_zeros
+        self.restore_prefetch_depth = CONF.backup_restore_prefetch_depth
+        self.restore_memory_budget = \
+            CONF.backup_restore_memory_budget_mb * units.Mi
+        self.restore_use_pwrite = CONF.backup_restore_use_pwrite
+        self.restore_skip_holes = CONF.backup_restore_skip_holes
+        self.deduplication = CONF.backup_deduplication
         self.support_force_delete = True
+        self.support_changed_extents = True
 
     # To create your own "chunked" backup driver, implement the following
     # abstract methods.
@@ -114,6 +357,15 @@ class ChunkedBackupDriver(driver.BackupDriver):
         """Get container entry names."""
         return
 
+    def object_exists(self, container, object_name):
+        """Tell whether an object is stored in the container.
+
+        Drivers should override this with a lookup of the object itself,
+        this default lists the entries starting with its name.
+        """
+        return object_name in self.get_container_entries(container,
+                                                         object_name)
+
     @abc.abstractmethod
     def get_object_writer(self, container, object_name, extra_metadata=None):
         """Returns a writer object which stores the chunk data in backup repository.
@@ -198,13 +450,13 @@ class ChunkedBackupDriver(driver.BackupDriver):
         return filename
 
     def _write_metadata(self, backup, volume_id, container, object_list,
-                        volume_meta, extra_metadata=None):
+                        volume_meta, extra_metadata=None, version=None):
         filename = self._metadata_filename(backup)
         LOG.debug('_write_metadata started, container name: %(container)s,'
                   ' metadata filename: %(filename)s.',
                   {'container': container, 'filename': filename})
         metadata = {}
-        metadata['version'] = self.DRIVER_VERSION
+        metadata['version'] = version or self.DRIVER_VERSION
         metadata['backup_id'] = backup['id']
         metadata['volume_id'] = volume_id
         metadata['backup_name'] = backup['display_name']
@@ -222,13 +474,14 @@ class ChunkedBackupDriver(driver.BackupDriver):
             writer.write(metadata_json)
         LOG.debug('_write_metadata finished. Metadata: %s.', metadata_json)
 
-    def _write_sha256file(self, backup, volume_id, container, sha256_list):
+    def _write_sha256file(self, backup, volume_id, container, sha256_list,
+                          version=None):
         filename = self._sha256_filename(backup)
         LOG.debug('_write_sha256file started, container name: %(container)s,'
                   ' sha256file filename: %(filename)s.',
                   {'container': container, 'filename': filename})
         sha256file = {}
-        sha256file['version'] = self.DRIVER_VERSION
+        sha256file['version'] = version or self.DRIVER_VERSION
         sha256file['backup_id'] = backup['id']
         sha256file['volume_id'] = volume_id
         sha256file['backup_name'] = backup['display_name']
@@ -308,42 +561,261 @@ class ChunkedBackupDriver(driver.BackupDriver):
                 volume_size_bytes)
 
     def _backup_chunk(self, backup, container, data, data_offset,
-                      object_meta, extra_metadata):
-        """Backup data chunk based on the object metadata and offset."""
-        object_prefix = object_meta['prefix']
+                      object_meta, extra_metadata, pipeline=None):
+        """Backup data chunk based on the object metadata and offset.
+
+        The object name and its entry in the object list are allocated here,
+        so the metadata stays in volume order. When a pipeline is given the
+        compression and upload of the chunk are handed over to it. Hash
+        blocks made only of zeros are recorded as holes, no object is
+        written for them.
+        """
+        if not self.detect_zeros:
+            self._backup_segment(backup, container, data, data_offset,
+                                 object_meta, extra_metadata, pipeline)
+            return
+
+        # Scanning a chunk holds the GIL, do it in a native thread so the
+        # hub keeps serving the other green threads.
+        runs = tpool.execute(_zero_runs, data, self.sha_block_size_bytes)
+        for offset, length, is_zero in runs:
+            if is_zero:
+                hole_name = 'hole-%d' % (data_offset + offset)
+                object_meta['list'].append({
+                    hole_name: {'offset': data_offset + offset,
+                                'length': length,
+                                'hole': True}})
+                LOG.debug('Recorded %(length)d zero bytes at offset '
+                          '%(offset)d as a hole.',
+                          {'length': length, 'offset': data_offset + offset})
+            else:
+                self._backup_segment(backup, container,
+                                     data[offset:offset + length],
+                                     data_offset + offset, object_meta,
+                                     extra_metadata, pipeline)
+
+    def _backup_segment(self, backup, container, data, data_offset,
+                        object_meta, extra_metadata, pipeline=None):
+        """Write a segment of a chunk as one backup object."""
         object_list = object_meta['list']
 
-        object_id = object_meta['id']
-        object_name = '%s-%05d' % (object_prefix, object_id)
+        if self.deduplication:
+            object_name = self._dedup_chunk_name(
+                tpool.execute(_sha256_hexdigest, data))
+            if pipeline is not None and object_name in pipeline.dedup_chunks:
+                object_list.append({object_name: {'offset': data_offset,
+                                                  'length': len(data),
+                                                  'dedup': True}})
+                pipeline.add_dedup_copy(object_name,
+                                        object_list[-1][object_name])
+                return
+            reused = (pipeline.reused_dedup_chunks if pipeline is not None
+                      else None)
+            write = functools.partial(self._write_dedup_chunk, backup.id,
+                                      reused=reused)
+        else:
+            object_id = object_meta['id']
+            object_name = '%s-%05d' % (object_meta['prefix'], object_id)
+            object_meta['id'] = object_id + 1
+            write = self._write_chunk
         obj = {}
         obj[object_name] = {}
         obj[object_name]['offset'] = data_offset
         obj[object_name]['length'] = len(data)
-        LOG.debug('Backing up chunk of data from volume.')
-        algorithm, output_data = self._prepare_output_data(data)
-        obj[object_name]['compression'] = algorithm
-        LOG.debug('About to put_object')
-        with self.get_object_writer(
-                container, object_name, extra_metadata=extra_metadata
-        ) as writer:
-            writer.write(output_data)
-        md5 = hashlib.md5(data).hexdigest()
-        obj[object_name]['md5'] = md5
-        LOG.debug('backup MD5 for %(object_name)s: %(md5)s',
-                  {'object_name': object_name, 'md5': md5})
+        if self.deduplication:
+            obj[object_name]['dedup'] = True
+            if pipeline is not None:
+                pipeline.dedup_chunks[object_name] = obj[object_name]
         object_list.append(obj)
-        object_id += 1
         object_meta['list'] = object_list
-        object_meta['id'] = object_id
+
+        if pipeline is None:
+            write(container, object_name, obj[object_name], data,
+                  extra_metadata)
+        else:
+            pipeline.submit(write, container, object_name,
+                            obj[object_name], data, extra_metadata,
+                            upload_slot=pipeline.upload_slot())
 
         LOG.debug('Calling eventlet.sleep(0)')
         eventlet.sleep(0)
 
+    def _write_chunk(self, container, object_name, obj, data, extra_metadata,
+                     upload_slot=None):
+        """Compress a chunk and write it to the backup repository."""
+        LOG.debug('Backing up chunk of data from volume.')
+        algorithm, output_data = self._prepare_output_data(data)
+        obj['compression'] = algorithm
+        md5 = tpool.execute(_md5_hexdigest, data)
+        obj['md5'] = md5
+        if obj.get('dedup'):
+            object_name = self._dedup_object_name(object_name, algorithm)
+        LOG.debug('backup MD5 for %(object_name)s: %(md5)s',
+                  {'object_name': object_name, 'md5': md5})
+        if upload_slot is not None:
+            upload_slot.acquire()
+        try:
+            LOG.debug('About to put_object')
+            with self.get_object_writer(
+                    container, object_name, extra_metadata=extra_metadata
+            ) as writer:
+                writer.write(output_data)
+        finally:
+            if upload_slot is not None:
+                upload_slot.release()
+
+    @staticmethod
+    def _dedup_chunk_name(sha256):
+        return 'dedup-%s' % sha256
+
+    @staticmethod
+    def _dedup_object_name(chunk_name, algorithm):
+        """Name of the object holding a deduplicated chunk.
+
+        The compression algorithm is part of the name so that a backup
+        reusing the chunk knows how it was stored.
+        """
+        return '%s.%s' % (chunk_name, algorithm)
+
+    @staticmethod
+    def _dedup_ref_name(chunk_name, backup_id):
+        return '%s.ref.%s' % (chunk_name, backup_id)
+
+    def _find_dedup_chunk(self, container, chunk_name):
+        """Return the compression of a stored chunk, None if not stored.
+
+        Only the objects the chunk would be written as with the current
+        compression settings are looked up.
+        """
+        algorithms = ['none']
+        if self.compressor is not None:
+            algorithms.insert(0, self.backup_compression_algorithm.lower())
+        for algorithm in algorithms:
+            if self.object_exists(container,
+                                  self._dedup_object_name(chunk_name,
+                                                          algorithm)):
+                return algorithm
+        return None
+
+    def _write_dedup_chunk(self, backup_id, container, chunk_name, obj, data,
+                           extra_metadata, upload_slot=None, reused=None):
+        """Reference a deduplicated chunk, writing it if it is not stored.
+
+        The name and compression of a chunk found already stored are
+        appended to reused, if given, so that the backup can check that
+        they are still stored before it completes.
+        """
+        # The repository is only used while holding an upload slot, some
+        # drivers share a single connection between all their requests.
+        if upload_slot is not None:
+            upload_slot.acquire()
+        try:
+            # The reference is taken before looking for the chunk, so a
+            # backup deletion listing the references after this keeps the
+            # chunk. A deletion which listed them before may still delete
+            # the chunk after it is found here, which the backup checks
+            # for before it completes, see _check_dedup_chunks.
+            with self.get_object_writer(
+                    container, self._dedup_ref_name(chunk_name, backup_id),
+                    extra_metadata=extra_metadata) as writer:
+                writer.write(b'')
+            algorithm = self._find_dedup_chunk(container, chunk_name)
+        finally:
+            if upload_slot is not None:
+                upload_slot.release()
+        if algorithm is not None:
+            LOG.debug('Chunk %s is already stored, skipping upload.',
+                      chunk_name)
+            obj['compression'] = algorithm
+            obj['md5'] = tpool.execute(_md5_hexdigest, data)
+            if reused is not None:
+                reused.append((chunk_name, algorithm))
+            return
+        self._write_chunk(container, chunk_name, obj, data, extra_metadata,
+                          upload_slot=upload_slot)
+
+    def _check_dedup_chunks(self, container, chunks):
+        """Check the deduplicated chunks a backup reused are still stored.
+
+        A backup being deleted while the chunks were looked up may have
+        deleted them since. The check happens once every chunk of the
+        backup is written, so such a deletion would have to have been
+        deleting the chunk for that long to go unnoticed.
+        """
+        for chunk_name, algorithm in chunks:
+            object_name = self._dedup_object_name(chunk_name, algorithm)
+            if not self.object_exists(container, object_name):
+                msg = (_('Deduplicated chunk %s was deleted while backing '
+                         'up the volume.') % object_name)
+                raise exception.BackupDriverException(message=msg)
+
+    def _release_dedup_chunks(self, backup, object_list):
+        """Drop the references a backup holds on deduplicated chunks.
+
+        Chunks no longer referenced by any backup are deleted.
+        """
+        container = backup['container']
+        chunk_names = set()
+        for obj in object_list:
+            for object_name, info in obj.items():
+                if info.get('dedup'):
+                    chunk_names.add(object_name)
+
+        for chunk_name in sorted(chunk_names):
+            ref_name = self._dedup_ref_name(chunk_name, backup['id'])
+            ref_prefix = self._dedup_ref_name(chunk_name, '')
+            entries = self.get_container_entries(container, chunk_name + '.')
+            if ref_name in entries:
+                self.delete_object(container, ref_name)
+                entries.remove(ref_name)
+            if any(entry.startswith(ref_prefix) for entry in entries):
+                continue
+            for object_name in entries:
+                self.delete_object(container, object_name)
+                LOG.debug('deleted unreferenced chunk: %(object_name)s'
+                          ' in container: %(container)s.',
+                          {
+                              'object_name': object_name,
+                              'container': container
+                          })
+            eventlet.sleep(0)
+
+    def _calculate_shas(self, data):
+        """Return the SHA-256 of every hash block in a chunk of data.
+
+        Blocks are hashed from memoryview slices, so they are never copied,
+        in up to sha_workers native threads at once since hashlib releases
+        the GIL while hashing.
+        """
+        view = memoryview(data)
+        block_size = self.sha_block_size_bytes
+        num_blocks = (len(view) + block_size - 1) // block_size
+        workers = min(self.sha_workers, num_blocks)
+        if workers <= 1:
+            return tpool.execute(_sha256_blocks, view, block_size)
+
+        batch_size = (num_blocks + workers - 1) // workers * block_size
+
+        def _hash_batch(offset):
+            return tpool.execute(_sha256_blocks,
+                                 view[offset:offset + batch_size],
+                                 block_size)
+
+        pool = eventlet.GreenPool(workers)
+        return list(itertools.chain.from_iterable(
+            pool.imap(_hash_batch, range(0, len(view), batch_size))))
+
     def _prepare_output_data(self, data):
         if self.compressor is None:
             return 'none', data
         data_size_bytes = len(data)
-        compressed_data = self.compressor.compress(data)
+        if self.compression_adaptive and not self._worth_compressing(data):
+            LOG.debug('Compression of a sample of this chunk was '
+                      'ineffective, using original data for this chunk.')
+            return 'none', data
+        # Compressors release the GIL, so compress in a native thread to
+        # keep the hub responsive and let chunks be compressed in parallel.
+        compressed_data = tpool.execute(self.compressor.compress, data)
         comp_size_bytes = len(compressed_data)
         algorithm = CONF.backup_compression_algorithm.lower()
         if comp_size_bytes >= data_size_bytes:
@@ -363,23 +835,54 @@ class ChunkedBackupDriver(driver.BackupDriver):
                    })
         return algorithm, compressed_data
 
-    def _finalize_backup(self, backup, container, object_meta, object_sha256):
+    def _worth_compressing(self, data):
+        """Tell whether a sample of a chunk compresses well enough.
+
+        The sample is made of slices spread over the chunk. Chunks too
+        small to be sampled are always worth trying.
+        """
+        data_size_bytes = len(data)
+        if data_size_bytes <= _SAMPLE_SLICE_BYTES * _SAMPLE_SLICES:
+            return True
+        step = data_size_bytes // _SAMPLE_SLICES
+        sample = b''.join(
+            bytes(data[offset:offset + _SAMPLE_SLICE_BYTES])
+            for offset in range(0, step * _SAMPLE_SLICES, step))
+        compressed_sample = tpool.execute(self.compressor.compress, sample)
+        return (len(compressed_sample) <
+                len(sample) * self.compression_adaptive_ratio)
+
+    def _backup_version(self, object_list, parent_version=None):
+        """Version of the metadata format needed to restore a backup."""
+        if parent_version not in (None, self.DRIVER_VERSION_COMPATIBLE):
+            return self.DRIVER_VERSION
+        for obj in object_list:
+            for info in obj.values():
+                if info.get('hole') or info.get('dedup'):
+                    return self.DRIVER_VERSION
+        return self.DRIVER_VERSION_COMPATIBLE
+
+    def _finalize_backup(self, backup, container, object_meta, object_sha256,
+                         parent_version=None):
         """Write the backup's metadata to the backup repository."""
         object_list = object_meta['list']
         object_id = object_meta['id']
         volume_meta = object_meta['volume_meta']
         sha256_list = object_sha256['sha256s']
         extra_metadata = object_meta.get('extra_metadata')
+        version = self._backup_version(object_list, parent_version)
         self._write_sha256file(backup,
                                backup.volume_id,
                                container,
-                               sha256_list)
+                               sha256_list,
+                               version=version)
         self._write_metadata(backup,
                              backup.volume_id,
                              container,
                              object_list,
                              volume_meta,
-                             extra_metadata)
+                             extra_metadata,
+                             version=version)
         backup.object_count = object_id
         backup.save()
         LOG.debug('backup %s finished.', backup['id'])
@@ -417,11 +920,42 @@ class ChunkedBackupDriver(driver.BackupDriver):
                                                extra_usage_info=
                                                object_meta)
 
-    def backup(self, backup, volume_file, backup_metadata=True):
+    def _changed_regions(self, changed_extents, volume_size_bytes):
+        """Turn changed extents into the regions to read from the volume.
+
+        Extents are widened to hash block boundaries, merged and split so
+        that no region crosses a chunk boundary. Yields (offset, length).
+        """
+        block_size = self.sha_block_size_bytes
+        merged = []
+        for offset, length in sorted(changed_extents):
+            start = offset - offset % block_size
+            end = min(offset + length + (-(offset + length) % block_size),
+                      volume_size_bytes)
+            if start >= end:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        for start, end in merged:
+            while start < end:
+                chunk_end = start - start % self.chunk_size_bytes + \
+                    self.chunk_size_bytes
+                stop = min(end, chunk_end)
+                yield start, stop - start
+                start = stop
+
+    def backup(self, backup, volume_file, backup_metadata=True,
+               changed_extents=None):
         """Backup the given volume.
 
            If backup['parent_id'] is given, then an incremental backup
-           is performed.
+           is performed. If changed_extents, a list of (offset, length)
+           tuples in bytes, is given along with it then only those parts
+           of the volume are read, everything else is assumed to be the
+           same as in the parent backup.
         """
         if self.chunk_size_bytes % self.sha_block_size_bytes:
             err = _('Chunk size is not multiple of '
@@ -474,88 +1008,131 @@ class ChunkedBackupDriver(driver.BackupDriver):
             timer.start(interval=self.backup_timer_interval)
 
         sha256_list = object_sha256['sha256s']
-        shaindex = 0
         is_backup_canceled = False
-        while True:
-            # First of all, we check the status of this backup. If it
-            # has been changed to delete or has been deleted, we cancel the
-            # backup process to do forcing delete.
-            backup = objects.Backup.get_by_id(self.context, backup.id)
-            if backup.status in (fields.BackupStatus.DELETING,
-                                 fields.BackupStatus.DELETED):
-                is_backup_canceled = True
-                # To avoid the chunk left when deletion complete, need to
-                # clean up the object of chunk again.
-                self.delete(backup)
-                LOG.debug('Cancel the backup process of %s.', backup.id)
-                break
-            data_offset = volume_file.tell()
-            data = volume_file.read(self.chunk_size_bytes)
-            if data == b'':
-                break
-
-            # Calculate new shas with the datablock.
-            shalist = []
-            off = 0
-            datalen = len(data)
-            while off < datalen:
-                chunk_start = off
-                chunk_end = chunk_start + self.sha_block_size_bytes
-                if chunk_end > datalen:
-                    chunk_end = datalen
-                chunk = data[chunk_start:chunk_end]
-                sha = hashlib.sha256(chunk).hexdigest()
-                shalist.append(sha)
-                off += self.sha_block_size_bytes
-            sha256_list.extend(shalist)
-
-            # If parent_backup is not None, that means an incremental
-            # backup will be performed.
-            if parent_backup:
-                # Find the extent that needs to be backed up.
-                extent_off = -1
-                for idx, sha in enumerate(shalist):
-                    if sha != parent_backup_shalist[shaindex]:
-                        if extent_off == -1:
-                            # Start of new extent.
-                            extent_off = idx * self.sha_block_size_bytes
-                    else:
-                        if extent_off != -1:
-                            # We've reached the end of extent.
-                            extent_end = idx * self.sha_block_size_bytes
-                            segment = data[extent_off:extent_end]
-                            self._backup_chunk(backup, container, segment,
-                                               data_offset + extent_off,
-                                               object_meta,
-                                               extra_metadata)
-                            extent_off = -1
-                    shaindex += 1
-
-                # The last extent extends to the end of data buffer.
-                if extent_off != -1:
-                    extent_end = datalen
-                    segment = data[extent_off:extent_end]
-                    self._backup_chunk(backup, container, segment,
-                                       data_offset + extent_off,
-                                       object_meta, extra_metadata)
+        pipeline = _BackupPipeline(self.upload_workers,
+                                   self.pipeline_queue_depth)
+        regions = None
+        if parent_backup and changed_extents is not None:
+            LOG.debug('Backing up only the extents changed since backup %s.',
+                      parent_backup.id)
+            regions = self._changed_regions(changed_extents,
+                                            volume_size_bytes)
+        try:
+            while True:
+                # First of all, we check the status of this backup. If it
+                # has been changed to delete or has been deleted, we cancel
+                # the backup process to do forcing delete.
+                backup = objects.Backup.get_by_id(self.context, backup.id)
+                if backup.status in (fields.BackupStatus.DELETING,
+                                     fields.BackupStatus.DELETED):
+                    is_backup_canceled = True
+                    # Let the chunks already handed to the pipeline land
+                    # before cleaning up, otherwise they would be left
+                    # behind once the deletion completes.
+                    pipeline.wait()
+                    # To avoid the chunk left when deletion complete, need to
+                    # clean up the object of chunk again.
+                    self._release_dedup_chunks(backup, object_meta['list'])
+                    self.delete(backup)
+                    LOG.debug('Cancel the backup process of %s.', backup.id)
+                    break
+                if regions is None:
+                    data_offset = volume_file.tell()
+                    data = volume_file.read(self.chunk_size_bytes)
+                else:
+                    data_offset, length = next(regions, (None, 0))
+                    if data_offset is None:
+                        break
+                    volume_file.seek(data_offset)
+                    data = volume_file.read(length)
+                if data == b'':
+                    break
+
+                # Calculate new shas with the datablock.
+                shalist = self._calculate_shas(data)
+
+                # If parent_backup is not None, that means an incremental
+                # backup will be performed.
+                if parent_backup:
+                    # Blocks skipped since the last region read are
+                    # unchanged, so their hashes are the parent's.
+                    shaindex = data_offset // self.sha_block_size_bytes
+                    sha256_list.extend(
+                        parent_backup_shalist[len(sha256_list):shaindex])
+                sha256_list.extend(shalist)
+
+                if parent_backup:
+                    # Find the extent that needs to be backed up.
+                    datalen = len(data)
                     extent_off = -1
-            else:  # Do a full backup.
-                self._backup_chunk(backup, container, data, data_offset,
-                                   object_meta, extra_metadata)
-
-            # Notifications
-            total_block_sent_num += self.data_block_num
-            counter += 1
-            if counter == self.data_block_num:
-                # Send the notification to Ceilometer when the chunk
-                # number reaches the data_block_num.  The backup percentage
-                # is put in the metadata as the extra information.
-                self._send_progress_notification(self.context, backup,
-                                                 object_meta,
-                                                 total_block_sent_num,
-                                                 volume_size_bytes)
-                # Reset the counter
-                counter = 0
+                    for idx, sha in enumerate(shalist):
+                        if sha != parent_backup_shalist[shaindex]:
+                            if extent_off == -1:
+                                # Start of new extent.
+                                extent_off = idx * self.sha_block_size_bytes
+                        else:
+                            if extent_off != -1:
+                                # We've reached the end of extent.
+                                extent_end = idx * self.sha_block_size_bytes
+                                segment = data[extent_off:extent_end]
+                                self._backup_chunk(backup, container, segment,
+                                                   data_offset + extent_off,
+                                                   object_meta,
+                                                   extra_metadata,
+                                                   pipeline=pipeline)
+                                extent_off = -1
+                        shaindex += 1
+
+                    # The last extent extends to the end of data buffer.
+                    if extent_off != -1:
+                        extent_end = datalen
+                        segment = data[extent_off:extent_end]
+                        self._backup_chunk(backup, container, segment,
+                                           data_offset + extent_off,
+                                           object_meta, extra_metadata,
+                                           pipeline=pipeline)
+                        extent_off = -1
+                else:  # Do a full backup.
+                    self._backup_chunk(backup, container, data, data_offset,
+                                       object_meta, extra_metadata,
+                                       pipeline=pipeline)
+
+                # Notifications
+                total_block_sent_num += self.data_block_num
+                counter += 1
+                if counter == self.data_block_num:
+                    # Send the notification to Ceilometer when the chunk
+                    # number reaches the data_block_num.  The backup
+                    # percentage is put in the metadata as the extra
+                    # information.
+                    self._send_progress_notification(self.context, backup,
+                                                     object_meta,
+                                                     total_block_sent_num,
+                                                     volume_size_bytes)
+                    # Reset the counter
+                    counter = 0
+
+            # Every chunk has to be in the backup repository before the
+            # metadata referencing it is written.
+            pipeline.wait()
+            self._check_dedup_chunks(container, pipeline.reused_dedup_chunks)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                timer.stop()
+                # Do not leave uploads running behind a failed backup.
+                try:
+                    pipeline.wait()
+                except Exception:
+                    LOG.debug('Ignoring chunk upload error of failed '
+                              'backup %s.', backup.id)
+                # No metadata will reference the chunks of this backup,
+                # so they could not be released when it is deleted.
+                try:
+                    self._release_dedup_chunks(backup, object_meta['list'])
+                except Exception:
+                    LOG.warning(_LW('Error while releasing deduplicated '
+                                    'chunks of failed backup %s.'),
+                                backup.id)
 
         # Stop the timer.
         timer.stop()
@@ -563,6 +1140,8 @@ class ChunkedBackupDriver(driver.BackupDriver):
         # but timer.stop().
         if is_backup_canceled:
             return
+        if parent_backup:
+            sha256_list.extend(parent_backup_shalist[len(sha256_list):])
         # All the data have been sent, the backup_percent reaches 100.
         self._send_progress_end(self.context, backup, object_meta)
 
@@ -575,9 +1154,16 @@ class ChunkedBackupDriver(driver.BackupDriver):
                 with excutils.save_and_reraise_exception():
                     LOG.exception(_LE("Backup volume metadata failed: %s."),
                                   err)
+                    self._release_dedup_chunks(backup, object_meta['list'])
                     self.delete(backup)
 
-        self._finalize_backup(backup, container, object_meta, object_sha256)
+        # Services restoring an incremental backup only check its version,
+        # so it must also account for what its parents use.
+        parent_version = None
+        if parent_backup_shafile:
+            parent_version = parent_backup_shafile.get('version')
+        self._finalize_backup(backup, container, object_meta, object_sha256,
+                              parent_version=parent_version)
 
     def _restore_v1(self, backup, volume_id, metadata, volume_file):
         """Restore a v1 volume backup."""
@@ -588,7 +1174,11 @@ class ChunkedBackupDriver(driver.BackupDriver):
         metadata_objects = metadata['objects']
         metadata_object_names = []
         for obj in metadata_objects:
-            metadata_object_names.extend(obj.keys())
+            # Deduplicated chunks are shared and live outside the prefix
+            # of the backup, and holes are not stored at all.
+            metadata_object_names.extend(
+                object_name for object_name, info in obj.items()
+                if not (info.get('dedup') or info.get('hole')))
         LOG.debug('metadata_object_names = %s.', metadata_object_names)
         prune_list = [self._metadata_filename(backup),
                       self._sha256_filename(backup)]
@@ -600,53 +1190,133 @@ class ChunkedBackupDriver(driver.BackupDriver):
                     'does not match object list stored in metadata.')
             raise exception.InvalidBackup(reason=err)
 
-        for metadata_object in metadata_objects:
-            object_name, obj = list(metadata_object.items())[0]
-            LOG.debug('restoring object. backup: %(backup_id)s, '
-                      'container: %(container)s, object name: '
-                      '%(object_name)s, volume: %(volume_id)s.',
-                      {
-                          'backup_id': backup_id,
-                          'container': container,
-                          'object_name': object_name,
-                          'volume_id': volume_id,
-                      })
-
-            with self.get_object_reader(
-                    container, object_name,
-                    extra_metadata=extra_metadata) as reader:
-                body = reader.read()
-            compression_algorithm = metadata_object[object_name]['compression']
-            decompressor = self._get_compressor(compression_algorithm)
-            volume_file.seek(obj['offset'])
-            if decompressor is not None:
-                LOG.debug('decompressing data using %s algorithm',
-                          compression_algorithm)
-                decompressed = decompressor.decompress(body)
-                volume_file.write(decompressed)
-            else:
-                volume_file.write(body)
-
-            # force flush every write to avoid long blocking write on close
-            volume_file.flush()
-
-            # Be tolerant to IO implementations that do not support fileno()
+        volume_fileno = None
+        if self.restore_use_pwrite and hasattr(os, 'pwrite'):
             try:
-                fileno = volume_file.fileno()
-            except IOError:
-                LOG.info(_LI("volume_file does not support "
-                             "fileno() so skipping "
-                             "fsync()"))
+                volume_fileno = volume_file.fileno()
+            except (IOError, AttributeError):
+                LOG.debug('volume_file does not support fileno() so '
+                          'restoring objects in offset order.')
             else:
-                os.fsync(fileno)
-
-            # Restoring a backup to a volume can take some time. Yield so other
-            # threads can run, allowing for among other things the service
-            # status to be updated
+                volume_file.flush()
+
+        # Objects are downloaded and decompressed ahead of the one being
+        # written, bounded both by count and by the amount of restored data
+        # held in memory.
+        pool = eventlet.GreenPool(self.restore_prefetch_depth)
+        pending = collections.deque()
+        pending_bytes = 0
+
+        # Holes of an incremental backup may cover data restored from its
+        # parent, so only those of a full backup can be left unwritten.
+        skip_holes = self.restore_skip_holes and not backup.parent_id
+
+        def _write_next():
+            thread, obj, length = pending.popleft()
+            if thread is None:
+                self._write_zeros(volume_file, obj['offset'], obj['length'])
+                self._sync_volume_file(volume_file)
+            else:
+                data = thread.wait()
+                if data is not None:
+                    volume_file.seek(obj['offset'])
+                    volume_file.write(data)
+                    self._sync_volume_file(volume_file)
+            # Restoring a backup to a volume can take some time. Yield so
+            # other threads can run, allowing for among other things the
+            # service status to be updated
             eventlet.sleep(0)
+            return length
+
+        try:
+            for metadata_object in metadata_objects:
+                object_name, obj = list(metadata_object.items())[0]
+                if obj.get('hole'):
+                    if not skip_holes:
+                        # Zeros are written in order with the objects
+                        # and take no prefetch memory.
+                        pending.append((None, obj, 0))
+                    continue
+                if obj.get('dedup'):
+                    object_name = self._dedup_object_name(
+                        object_name, obj['compression'])
+                length = obj['length']
+                while pending and (
+                        len(pending) >= self.restore_prefetch_depth or
+                        pending_bytes + length > self.restore_memory_budget):
+                    pending_bytes -= _write_next()
+                LOG.debug('restoring object. backup: %(backup_id)s, '
+                          'container: %(container)s, object name: '
+                          '%(object_name)s, volume: %(volume_id)s.',
+                          {
+                              'backup_id': backup_id,
+                              'container': container,
+                              'object_name': object_name,
+                              'volume_id': volume_id,
+                          })
+                thread = pool.spawn(self._restore_object, container,
+                                    object_name, obj, extra_metadata,
+                                    volume_fileno)
+                pending.append((thread, obj, length))
+                pending_bytes += length
+
+            while pending:
+                pending_bytes -= _write_next()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                # Wait for the prefetched objects so nothing touches the
+                # volume after the restore has returned.
+                pool.waitall()
+
+        if volume_fileno is not None:
+            self._sync_volume_file(volume_file)
         LOG.debug('v1 volume backup restore of %s finished.',
                   backup_id)
 
+    def _restore_object(self, container, object_name, obj, extra_metadata,
+                        volume_fileno=None):
+        """Download and decompress one backup object.
+
+        Returns the restored data, or None once it has been written at its
+        offset when a file descriptor for the volume is given.
+        """
+        with self.get_object_reader(
+                container, object_name,
+                extra_metadata=extra_metadata) as reader:
+            body = reader.read()
+        compression_algorithm = obj['compression']
+        decompressor = self._get_compressor(compression_algorithm)
+        if decompressor is not None:
+            LOG.debug('decompressing data using %s algorithm',
+                      compression_algorithm)
+            body = tpool.execute(decompressor.decompress, body)
+        if volume_fileno is None:
+            return body
+        tpool.execute(_pwrite_all, volume_fileno, body, obj['offset'])
+
+    def _write_zeros(self, volume_file, offset, length):
+        zeros = b'\0' * min(length, self.chunk_size_bytes)
+        volume_file.seek(offset)
+        while length:
+            size = min(length, len(zeros))
+            volume_file.write(zeros if size == len(zeros) else zeros[:size])
+            length -= size
+            eventlet.sleep(0)
+
+    def _sync_volume_file(self, volume_file):
+        # force flush every write to avoid long blocking write on close
+        volume_file.flush()
+
+        # Be tolerant to IO implementations that do not support fileno()
+        try:
+            fileno = volume_file.fileno()
+        except IOError:
+            LOG.info(_LI("volume_file does not support "
+                         "fileno() so skipping "
+                         "fsync()"))
+        else:
+            os.fsync(fileno)
+
     def restore(self, backup, volume_id, volume_file):
         """Restore the given volume backup from backup repository."""
         backup_id = backup['id']
@@ -724,6 +1394,16 @@ class ChunkedBackupDriver(driver.BackupDriver):
                 LOG.warning(_LW('Error while listing objects, continuing'
                                 ' with delete.'))
 
+            # The backup may have been taken with deduplication while it
+            # is now disabled, the metadata tells which chunks it uses.
+            if self._metadata_filename(backup) in object_names:
+                try:
+                    metadata = self._read_metadata(backup)
+                    self._release_dedup_chunks(backup, metadata['objects'])
+                except Exception:
+                    LOG.warning(_LW('Error while releasing deduplicated '
+                                    'chunks, continuing with delete.'))
+
             for object_name in object_names:
                 self.delete_object(container, object_name)
                 LOG.debug('deleted object: %(object_name)s'
@@ -327,6 +327,11 @@ class BackupDriver(base.Base):
         # deletion. So it should be set to True if the driver that inherits
         # from BackupDriver supports the force deletion function.
         self.support_force_delete = False
+        # This flag indicates if the backup driver accepts the extents of the
+        # volume changed since the parent backup, passed by the volume driver
+        # as the changed_extents argument of backup(), and only reads those
+        # when doing an incremental backup.
+        self.support_changed_extents = False
 
     def get_metadata(self, volume_id):
         return self.backup_meta_api.get(volume_id)
@@ -139,6 +139,11 @@ class GoogleBackupDriver(chunkeddriver.ChunkedBackupDriver):
                                     http=http_user_agent,
                                     credentials=credentials)
         self.resumable = self.writer_chunk_size != -1
+        # All requests go through a single httplib2.Http object, which can't
+        # serve concurrent requests, so only one object is transferred at a
+        # time. Reading, hashing and compressing are still pipelined.
+        self.upload_workers = 1
+        self.restore_prefetch_depth = 1
 
     def check_gcs_options(self):
         required_options = ('backup_gcs_bucket', 'backup_gcs_credential_file',
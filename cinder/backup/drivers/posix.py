@@ -106,6 +106,10 @@ class PosixBackupDriver(chunkeddriver.ChunkedBackupDriver):
         path = os.path.join(self.backup_path, container)
         return [i for i in os.listdir(path) if i.startswith(prefix)]
 
+    def object_exists(self, container, object_name):
+        return os.path.exists(os.path.join(self.backup_path, container,
+                                           object_name))
+
     def get_object_writer(self, container, object_name, extra_metadata=None):
         path = os.path.join(self.backup_path, container, object_name)
         f = open(path, 'wb')
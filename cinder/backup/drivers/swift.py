@@ -36,7 +36,8 @@
                                     failed Swift operations (default: 10).
 :backup_compression_algorithm: Compression algorithm to use for volume
                                backups. Supported options are:
-                               None (to disable), zlib and bz2 (default: zlib)
+                               None (to disable), zlib, bz2, zstd and lz4
+                               (default: zlib)
 :backup_swift_ca_cert_file: The location of the CA certificate file to use
                             for swift client requests (default: None)
 :backup_swift_auth_insecure: If true, bypass verification of server's
@@ -46,10 +47,12 @@
 import hashlib
 import socket
 
+from eventlet import pools
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import timeutils
 import six
+from six.moves import http_client
 from swiftclient import client as swift
 
 from cinder.backup import chunkeddriver
@@ -204,7 +207,15 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
                               "but %(param)s not set"),
                           {'param': 'backup_swift_user'})
                 raise exception.ParameterNotFound(param='backup_swift_user')
-            self.conn = swift.Connection(
+        self.conn = self._get_connection()
+        # A swift connection can't be shared by concurrent requests, so
+        # chunk uploads and downloads each borrow one from this pool.
+        self.conn_pool = pools.Pool(max_size=self.upload_workers,
+                                    create=self._get_connection)
+
+    def _get_connection(self):
+        if CONF.backup_swift_auth == 'single_user':
+            return swift.Connection(
                 authurl=self.auth_url,
                 auth_version=CONF.backup_swift_auth_version,
                 tenant_name=CONF.backup_swift_tenant,
@@ -214,20 +225,18 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
                 starting_backoff=self.swift_backoff,
                 insecure=self.backup_swift_auth_insecure,
                 cacert=CONF.backup_swift_ca_cert_file)
-        else:
-            self.conn = swift.Connection(retries=self.swift_attempts,
-                                         preauthurl=self.swift_url,
-                                         preauthtoken=self.context.auth_token,
-                                         starting_backoff=self.swift_backoff,
-                                         insecure= (
-                                             self.backup_swift_auth_insecure),
-                                         cacert=CONF.backup_swift_ca_cert_file)
+        return swift.Connection(retries=self.swift_attempts,
+                                preauthurl=self.swift_url,
+                                preauthtoken=self.context.auth_token,
+                                starting_backoff=self.swift_backoff,
+                                insecure=self.backup_swift_auth_insecure,
+                                cacert=CONF.backup_swift_ca_cert_file)
 
     class SwiftObjectWriter(object):
-        def __init__(self, container, object_name, conn):
+        def __init__(self, container, object_name, conn_pool):
             self.container = container
             self.object_name = object_name
-            self.conn = conn
+            self.conn_pool = conn_pool
             self.data = bytearray()
 
         def __enter__(self):
@@ -242,9 +251,10 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
         def close(self):
             reader = six.BytesIO(self.data)
             try:
-                etag = self.conn.put_object(self.container, self.object_name,
-                                            reader,
-                                            content_length=len(self.data))
+                with self.conn_pool.item() as conn:
+                    etag = conn.put_object(self.container, self.object_name,
+                                           reader,
+                                           content_length=len(self.data))
             except socket.error as err:
                 raise exception.SwiftConnectionFailed(reason=err)
             LOG.debug('swift MD5 for %(object_name)s: %(etag)s',
@@ -260,10 +270,10 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
             return md5
 
     class SwiftObjectReader(object):
-        def __init__(self, container, object_name, conn):
+        def __init__(self, container, object_name, conn_pool):
             self.container = container
             self.object_name = object_name
-            self.conn = conn
+            self.conn_pool = conn_pool
 
         def __enter__(self):
             return self
@@ -273,8 +283,9 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
 
         def read(self):
             try:
-                (_resp, body) = self.conn.get_object(self.container,
-                                                     self.object_name)
+                with self.conn_pool.item() as conn:
+                    (_resp, body) = conn.get_object(self.container,
+                                                    self.object_name)
             except socket.error as err:
                 raise exception.SwiftConnectionFailed(reason=err)
             return body
@@ -298,13 +309,27 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
         swift_object_names = [swift_obj['name'] for swift_obj in swift_objects]
         return swift_object_names
 
+    def object_exists(self, container, object_name):
+        """Tell whether an object is stored, with a HEAD of the object."""
+        try:
+            with self.conn_pool.item() as conn:
+                conn.head_object(container, object_name)
+        except swift.ClientException as err:
+            if err.http_status == http_client.NOT_FOUND:
+                return False
+            raise
+        except socket.error as err:
+            raise exception.SwiftConnectionFailed(reason=err)
+        return True
+
     def get_object_writer(self, container, object_name, extra_metadata=None):
         """Return a writer object.
 
         Returns a writer object that stores a chunk of volume data in a
         Swift object store.
         """
-        return self.SwiftObjectWriter(container, object_name, self.conn)
+        return self.SwiftObjectWriter(container, object_name,
+                                      self.conn_pool)
 
     def get_object_reader(self, container, object_name, extra_metadata=None):
         """Return reader object.
@@ -312,7 +337,8 @@ class SwiftBackupDriver(chunkeddriver.ChunkedBackupDriver):
         Returns a reader object that retrieves a chunk of backed-up volume data
         from a Swift object store.
         """
-        return self.SwiftObjectReader(container, object_name, self.conn)
+        return self.SwiftObjectReader(container, object_name,
+                                      self.conn_pool)
 
     def delete_object(self, container, object_name):
         """Deletes a backup object from a Swift object store."""
@@ -20,11 +20,13 @@ LVM class for performing LVM operations.
 import math
 import os
 import re
+from xml.etree import ElementTree
 
 from os_brick import executor
 from oslo_concurrency import processutils as putils
 from oslo_log import log as logging
 from oslo_utils import excutils
+import six
 from six import moves
 
 from cinder import exception
@@ -591,6 +593,68 @@ class LVM(executor.Executor):
             LOG.error(_LE('StdErr  :%s'), err.stderr)
             raise
 
+    def _dm_path(self, name):
+        """Return the device mapper path of a LV of this VG."""
+        return '/dev/mapper/%s-%s' % (self.vg_name.replace('-', '--'),
+                                      name.replace('-', '--'))
+
+    def get_lv_thin_id(self, name):
+        """Return the device id of a thin LV within its thin pool."""
+        cmd = LVM.LVM_CMD_PREFIX + ['lvs', '--noheadings', '-o', 'thin_id',
+                                    '%s/%s' % (self.vg_name, name)]
+        out, _err = self._execute(*cmd,
+                                  root_helper=self._root_helper,
+                                  run_as_root=True)
+        return int(out.strip())
+
+    def get_thin_delta(self, base_name, name):
+        """Return the extents of a thin LV that differ from another one.
+
+        Both LVs must live in the thin pool of this VG, typically a thin
+        snapshot and its origin or a later snapshot of the same origin.
+
+        :param base_name: name of the LV the changes are relative to
+        :param name: name of the LV compared to it
+        :returns: list of (offset, length) tuples in bytes
+        """
+        base_id = self.get_lv_thin_id(base_name)
+        thin_id = self.get_lv_thin_id(name)
+        pool_path = self._dm_path(self.vg_thin_pool) + '-tpool'
+        tmeta_path = self._dm_path(self.vg_thin_pool + '_tmeta')
+
+        # The metadata of an active pool can only be read consistently
+        # through a metadata snapshot, which has to be released afterwards.
+        self._execute('dmsetup', 'message', pool_path, '0',
+                      'reserve_metadata_snap',
+                      root_helper=self._root_helper, run_as_root=True)
+        try:
+            out, _err = self._execute('thin_delta', '--metadata-snap',
+                                      '--snap1', six.text_type(base_id),
+                                      '--snap2', six.text_type(thin_id),
+                                      tmeta_path,
+                                      root_helper=self._root_helper,
+                                      run_as_root=True)
+        finally:
+            self._execute('dmsetup', 'message', pool_path, '0',
+                          'release_metadata_snap',
+                          root_helper=self._root_helper, run_as_root=True)
+
+        superblock = ElementTree.fromstring(out)
+        # data_block_size is in 512 byte sectors, ranges are in data blocks.
+        block_size = int(superblock.get('data_block_size')) * 512
+        extents = []
+        for diff in superblock.iter('diff'):
+            for entry in diff:
+                if entry.tag == 'same':
+                    continue
+                offset = int(entry.get('begin')) * block_size
+                length = int(entry.get('length')) * block_size
+                if extents and extents[-1][0] + extents[-1][1] == offset:
+                    extents[-1] = (extents[-1][0], extents[-1][1] + length)
+                else:
+                    extents.append((offset, length))
+        return extents
+
     def _mangle_lv_name(self, name):
         # Linux LVM reserves name that starts with snapshot, so that
         # such volume name can't be created. Mangle it.
@@ -79,6 +79,7 @@ from cinder import objects
 from cinder import rpc
 from cinder import utils
 from cinder import version
+from cinder import volume
 from cinder.volume import utils as vutils
 
 
@@ -221,14 +222,71 @@ class DbCommands(object):
 
     @args('age_in_days', type=int,
           help='Purge deleted rows older than age in days')
-    def purge(self, age_in_days):
+    @args('--batchsize', type=int, default=None,
+          help='Number of rows deleted per transaction '
+               '(default: db_batch_size)')
+    @args('--sleep', type=float, default=None,
+          help='Seconds to wait between two batches '
+               '(default: db_batch_sleep)')
+    @args('--dryrun', action='store_true', default=False,
+          help='Only count the rows that would be purged')
+    def purge(self, age_in_days, batchsize=None, sleep=None, dryrun=False):
         """Purge deleted rows older than a given age from cinder tables."""
         age_in_days = int(age_in_days)
         if age_in_days <= 0:
             print(_("Must supply a positive, non-zero value for age"))
             sys.exit(1)
+        if batchsize is not None and batchsize <= 0:
+            print(_("Must supply a positive, non-zero value for batch size"))
+            sys.exit(1)
+        if dryrun:
+            message = _("%(table)s: %(rows)d rows would be purged")
+        else:
+            message = _("%(table)s: %(rows)d rows purged")
+
+        def _progress(table, rows):
+            print(message % {'table': table, 'rows': rows})
+
+        ctxt = context.get_admin_context()
+        total = db.purge_deleted_rows(ctxt, age_in_days, batch_size=batchsize,
+                                      batch_sleep=sleep, dry_run=dryrun,
+                                      progress=_progress)
+        print(message % {'table': _('total'), 'rows': total})
+
+    @args('--project_id', default=None,
+          help='Only check the counters of this project')
+    @args('--rebuild', action='store_true', default=False,
+          help='Reset the counters which differ from the actual usage')
+    def usage_counters(self, project_id=None, rebuild=False):
+        """Verify, or rebuild, the usage counters of the quotas."""
         ctxt = context.get_admin_context()
-        db.purge_deleted_rows(ctxt, age_in_days)
+        if rebuild:
+            mismatches = db.usage_counters_rebuild(ctxt, project_id)
+        else:
+            mismatches = db.usage_counters_verify(ctxt, project_id)
+
+        if not mismatches:
+            print(_("The usage counters are correct."))
+            return
+        print_format = "%-32s %-10s %-36s %-16s %-16s"
+        print(print_format % (_('Project'),
+                              _('Resource'),
+                              _('Volume type'),
+                              _('Counted'),
+                              _('Actual')))
+        for mismatch in mismatches:
+            print(print_format % (
+                mismatch['project_id'],
+                mismatch['resource'],
+                mismatch['volume_type_id'] or '-',
+                '%(in_use)d/%(gigabytes)dG' % mismatch,
+                '%(actual_in_use)d/%(actual_gigabytes)dG' % mismatch))
+        if rebuild:
+            print(_("%d usage counters rebuilt.") % len(mismatches))
+        else:
+            print(_("%d usage counters are incorrect, run with --rebuild "
+                    "to fix them.") % len(mismatches))
+            sys.exit(1)
 
 
 class VersionCommands(object):
@@ -414,6 +472,32 @@ class BackupCommands(object):
                          object_count))
 
 
+class ImageCacheCommands(object):
+    """Methods for managing the image-volume cache."""
+
+    @args('host',
+          help='Volume host, as host@backend or host@backend#pool')
+    @args('image_ids', nargs='+', metavar='image_id',
+          help='Images to cache')
+    def warm(self, host, image_ids):
+        """Create the image-volume cache entries of images in the background.
+
+        The progress is reported in the logs of the volume service and with
+        image_volume_cache.warm notifications.
+        """
+        if not rpc.initialized():
+            rpc.init(CONF)
+        ctxt = context.get_admin_context()
+        try:
+            volume.API().warm_image_cache(ctxt, host, image_ids)
+        except (exception.InvalidHost, exception.ImageNotFound) as e:
+            print(e.msg)
+            return 2
+        print(_("Warming the image-volume cache of %(host)s with "
+                "%(count)d images.") % {'host': host,
+                                         'count': len(image_ids)})
+
+
 class ServiceCommands(object):
     """Methods for managing services."""
     def list(self):
@@ -464,6 +548,7 @@ CATEGORIES = {
     'config': ConfigCommands,
     'db': DbCommands,
     'host': HostCommands,
+    'image_cache': ImageCacheCommands,
     'logs': GetLogCommands,
     'service': ServiceCommands,
     'shell': ShellCommands,
@@ -31,7 +31,8 @@ LOG = logging.getLogger(__name__)
 
 # copied from glance/db/sqlalchemy/api.py
 def paginate_query(query, model, limit, sort_keys, marker=None,
-                   sort_dir=None, sort_dirs=None, offset=None):
+                   sort_dir=None, sort_dirs=None, offset=None,
+                   marker_values=None):
     """Returns a query with sorting / pagination criteria added.
 
     Pagination works by requiring a unique sort_key, specified by sort_keys.
@@ -47,7 +48,13 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
 
     Typically, the id of the last row is used as the client-facing pagination
     marker, then the actual marker object must be fetched from the db and
-    passed in to us as marker.
+    passed in to us as marker.  When the sort key values of the last row are
+    already known, e.g. from a pagination cursor, they can be passed in as
+    marker_values instead, saving that extra query.
+
+    The criteria above are also bounded by a plain range condition on the
+    first sort key (k1 >= X1), which lets the database seek into an index
+    on the sort keys instead of evaluating the OR-chain on every row.
 
     :param query: the query object to which we should add paging/sorting
     :param model: the ORM model class
@@ -57,6 +64,10 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
                     results after this value.
     :param sort_dir: direction in which results should be sorted (asc, desc)
     :param sort_dirs: per-column array of sort_dirs, corresponding to sort_keys
+    :param offset: number of items to skip
+    :param marker_values: per-column array of the sort key values of the
+                          last item of the previous page, used instead of
+                          marker
 
     :rtype: sqlalchemy.orm.query.Query
     :return: The query with sorting/pagination added.
@@ -99,6 +110,9 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
             v = getattr(marker, sort_key)
             marker_values.append(v)
 
+    if marker_values is not None:
+        assert(len(marker_values) == len(sort_keys))
+
         # Build up an array of sort criteria as in the docstring
         criteria_list = []
         for i in range(0, len(sort_keys)):
@@ -122,6 +136,16 @@ def paginate_query(query, model, limit, sort_keys, marker=None,
         f = sqlalchemy.sql.or_(*criteria_list)
         query = query.filter(f)
 
+        # The range on the first key is implied by the criteria above but,
+        # unlike them, can be resolved with an index range scan.  Comparing
+        # with NULL would filter out everything, so skip it in that case.
+        if marker_values[0] is not None:
+            model_attr = getattr(model, sort_keys[0])
+            if sort_dirs[0] == 'desc':
+                query = query.filter(model_attr <= marker_values[0])
+            else:
+                query = query.filter(model_attr >= marker_values[0])
+
     if limit is not None:
         query = query.limit(limit)
 
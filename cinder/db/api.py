@@ -55,7 +55,17 @@ db_opts = [
                help='Template string to be used to generate snapshot names'),
     cfg.StrOpt('backup_name_template',
                default='backup-%s',
-               help='Template string to be used to generate backup names'), ]
+               help='Template string to be used to generate backup names'),
+    cfg.IntOpt('db_batch_size',
+               default=1000,
+               min=1,
+               help='Maximum number of rows deleted in a single transaction '
+                    'when purging deleted rows or expiring reservations'),
+    cfg.FloatOpt('db_batch_sleep',
+                 default=0.0,
+                 help='Number of seconds to wait between two batches when '
+                      'purging deleted rows or expiring reservations, to '
+                      'leave room to other database clients'), ]
 
 
 CONF = cfg.CONF
@@ -188,11 +198,11 @@ def volume_get(context, volume_id):
 
 
 def volume_get_all(context, marker, limit, sort_keys=None, sort_dirs=None,
-                   filters=None, offset=None):
+                   filters=None, offset=None, columns=None):
     """Get all volumes."""
     return IMPL.volume_get_all(context, marker, limit, sort_keys=sort_keys,
                                sort_dirs=sort_dirs, filters=filters,
-                               offset=offset)
+                               offset=offset, columns=columns)
 
 
 def volume_get_all_by_host(context, host, filters=None):
@@ -207,13 +217,14 @@ def volume_get_all_by_group(context, group_id, filters=None):
 
 def volume_get_all_by_project(context, project_id, marker, limit,
                               sort_keys=None, sort_dirs=None, filters=None,
-                              offset=None):
+                              offset=None, columns=None):
     """Get all volumes belonging to a project."""
     return IMPL.volume_get_all_by_project(context, project_id, marker, limit,
                                           sort_keys=sort_keys,
                                           sort_dirs=sort_dirs,
                                           filters=filters,
-                                          offset=offset)
+                                          offset=offset,
+                                          columns=columns)
 
 
 def volume_update(context, volume_id, values):
@@ -826,10 +837,26 @@ def quota_usage_get_all_by_project(context, project_id):
 
 
 def quota_reserve(context, resources, quotas, deltas, expire,
-                  until_refresh, max_age, project_id=None):
-    """Check quotas and create appropriate reservations."""
+                  until_refresh, max_age, project_id=None,
+                  async_refresh=False):
+    """Check quotas and create appropriate reservations.
+
+    With async_refresh, usages due for a refresh because of until_refresh
+    or max_age are left for quota_usage_refresh instead of being counted
+    again while the usages are locked.
+    """
     return IMPL.quota_reserve(context, resources, quotas, deltas, expire,
-                              until_refresh, max_age, project_id=project_id)
+                              until_refresh, max_age, project_id=project_id,
+                              async_refresh=async_refresh)
+
+
+def quota_usage_refresh(context, resources, until_refresh, max_age):
+    """Refresh the quota usages due for a refresh.
+
+    :returns: The number of usages refreshed.
+    """
+    return IMPL.quota_usage_refresh(context, resources, until_refresh,
+                                    max_age)
 
 
 def reservation_commit(context, reservations, project_id=None):
@@ -849,9 +876,16 @@ def quota_destroy_by_project(context, project_id):
     return IMPL.quota_destroy_by_project(context, project_id)
 
 
-def reservation_expire(context):
-    """Roll back any expired reservations."""
-    return IMPL.reservation_expire(context)
+def reservation_expire(context, batch_size=None, batch_sleep=None):
+    """Roll back any expired reservations.
+
+    Reservations are rolled back db_batch_size at a time, waiting
+    db_batch_sleep seconds between batches, unless overridden.
+
+    :returns: number of reservations rolled back
+    """
+    return IMPL.reservation_expire(context, batch_size=batch_size,
+                                   batch_sleep=batch_sleep)
 
 
 ###################
@@ -1031,13 +1065,41 @@ def cgsnapshot_destroy(context, cgsnapshot_id):
     return IMPL.cgsnapshot_destroy(context, cgsnapshot_id)
 
 
-def purge_deleted_rows(context, age_in_days):
+def purge_deleted_rows(context, age_in_days, batch_size=None,
+                       batch_sleep=None, dry_run=False, progress=None):
     """Purge deleted rows older than given age from cinder tables
 
+    Rows are deleted db_batch_size at a time, waiting db_batch_sleep
+    seconds between batches, unless overridden. With dry_run, rows are only
+    counted. progress, if given, is called with a table name and the number
+    of its rows purged (or counted) so far.
+
     Raises InvalidParameterValue if age_in_days is incorrect.
     :returns: number of deleted rows
     """
-    return IMPL.purge_deleted_rows(context, age_in_days=age_in_days)
+    return IMPL.purge_deleted_rows(context, age_in_days=age_in_days,
+                                   batch_size=batch_size,
+                                   batch_sleep=batch_sleep,
+                                   dry_run=dry_run, progress=progress)
+
+
+def usage_counters_verify(context, project_id=None):
+    """Compare the usage counters with the volumes, snapshots and backups.
+
+    :returns: list of dicts describing the counters which differ from the
+              usage, with the counted in_use and gigabytes and the
+              actual_in_use and actual_gigabytes.
+    """
+    return IMPL.usage_counters_verify(context, project_id=project_id)
+
+
+def usage_counters_rebuild(context, project_id=None):
+    """Reset the usage counters which differ from the actual usage.
+
+    :returns: list of the counters which were reset, as returned by
+              usage_counters_verify.
+    """
+    return IMPL.usage_counters_rebuild(context, project_id=project_id)
 
 
 def get_booleans_for_table(table_name):
@@ -1094,6 +1156,41 @@ def image_volume_cache_get_all_for_host(context, host):
     return IMPL.image_volume_cache_get_all_for_host(context, host)
 
 
+def image_volume_cache_get_totals_for_host(context, host):
+    """Get the number, size and inflation of the cache entries of a host."""
+    return IMPL.image_volume_cache_get_totals_for_host(context, host)
+
+
+def image_volume_cache_update_inflation_for_host(context, host, inflation):
+    """Raise the inflation of the image volume cache of a host."""
+    return IMPL.image_volume_cache_update_inflation_for_host(context, host,
+                                                             inflation)
+
+
+###################
+
+
+def rate_limit_bucket_reserve(context, key, capacity, request_value,
+                              requested, returned, now):
+    """Reserve requests from a shared API rate limit bucket.
+
+    :returns: tuple of the number of requests granted, the delay before one
+              more request would be granted or None, and the number of
+              requests still available
+    """
+    return IMPL.rate_limit_bucket_reserve(context, key, capacity,
+                                          request_value, requested, returned,
+                                          now)
+
+
+def rate_limit_bucket_purge(context, now):
+    """Delete the API rate limit buckets which are empty by now.
+
+    :returns: number of buckets deleted
+    """
+    return IMPL.rate_limit_bucket_purge(context, now)
+
+
 ###################
 
 
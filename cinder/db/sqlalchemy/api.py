@@ -40,8 +40,11 @@ import six
 import sqlalchemy
 from sqlalchemy import MetaData
 from sqlalchemy import or_, and_, case
+from sqlalchemy.orm import attributes
+from sqlalchemy.orm import ColumnProperty
 from sqlalchemy.orm import joinedload, joinedload_all
 from sqlalchemy.orm import RelationshipProperty
+from sqlalchemy.orm import subqueryload
 from sqlalchemy.schema import Table
 from sqlalchemy import sql
 from sqlalchemy.sql.expression import desc
@@ -57,6 +60,7 @@ from cinder.db.sqlalchemy import models
 from cinder import exception
 from cinder.i18n import _, _LW, _LE, _LI
 from cinder.objects import fields
+from cinder import utils
 
 
 CONF = cfg.CONF
@@ -344,6 +348,192 @@ QUOTA_SYNC_FUNCTIONS = {
 ###################
 
 
+# Resources counted in usage_counters, by model: the name of the resource
+# and the names of the size and volume type attributes of the model.
+USAGE_COUNTED_MODELS = {
+    models.Volume: ('volumes', 'size', 'volume_type_id'),
+    models.Snapshot: ('snapshots', 'volume_size', 'volume_type_id'),
+    models.Backup: ('backups', 'size', None),
+}
+
+
+def _usage_key(model, values):
+    """Return the (project_id, volume_type_id, size) a row is counted as.
+
+    Deleted rows, and rows without a project, are not counted.
+    """
+    _resource, size_attr, type_attr = USAGE_COUNTED_MODELS[model]
+    if values is None or values.get('deleted') or \
+            not values.get('project_id'):
+        return None
+    volume_type_id = values.get(type_attr) if type_attr else None
+    return (values['project_id'], volume_type_id or '',
+            int(values.get(size_attr) or 0))
+
+
+def _usage_counter_add(session, resource, project_id, volume_type_id,
+                       in_use, gigabytes):
+    table = models.UsageCounter.__table__
+    update = table.update().\
+        where(and_(table.c.project_id == project_id,
+                   table.c.resource == resource,
+                   table.c.volume_type_id == volume_type_id)).\
+        values(in_use=table.c.in_use + in_use,
+               gigabytes=table.c.gigabytes + gigabytes)
+    if session.execute(update).rowcount:
+        return
+
+    try:
+        with session.begin_nested():
+            session.execute(table.insert().values(
+                project_id=project_id, resource=resource,
+                volume_type_id=volume_type_id, in_use=in_use,
+                gigabytes=gigabytes))
+    except db_exc.DBDuplicateEntry:
+        # The counter was created by a concurrent transaction
+        session.execute(update)
+
+
+def _usage_counters_track(session, model, old, new):
+    """Count a volume, snapshot or backup changing from old to new.
+
+    old and new are the values of the row before and after the change, None
+    when the row is created or did not exist.
+    """
+    old_key = _usage_key(model, old)
+    new_key = _usage_key(model, new)
+    if old_key == new_key:
+        return
+
+    resource = USAGE_COUNTED_MODELS[model][0]
+    if old_key and new_key and old_key[:2] == new_key[:2]:
+        _usage_counter_add(session, resource, old_key[0], old_key[1],
+                           0, new_key[2] - old_key[2])
+        return
+    if old_key:
+        _usage_counter_add(session, resource, old_key[0], old_key[1],
+                           -1, -old_key[2])
+    if new_key:
+        _usage_counter_add(session, resource, new_key[0], new_key[1],
+                           1, new_key[2])
+
+
+def _usage_counters_update(session, model, row_id, values):
+    """Count an update of a volume, snapshot or backup about to be made."""
+    _resource, size_attr, type_attr = USAGE_COUNTED_MODELS[model]
+    attrs = [attr for attr in ('project_id', type_attr, size_attr, 'deleted')
+             if attr]
+    if not any(attr in values for attr in attrs):
+        return
+
+    # Lock the row so that concurrent updates are counted one at a time
+    row = session.query(*[getattr(model, attr) for attr in attrs]).\
+        filter_by(id=row_id).\
+        with_lockmode('update').\
+        first()
+    if row is None:
+        return
+    old = dict(zip(attrs, row))
+    new = dict(old)
+    new.update((attr, values[attr]) for attr in attrs if attr in values)
+    _usage_counters_track(session, model, old, new)
+
+
+def _usage_counters_get(resource, project_id, volume_type_id=None,
+                        session=None):
+    session = session or get_session()
+    query = session.query(func.sum(models.UsageCounter.in_use),
+                          func.sum(models.UsageCounter.gigabytes)).\
+        filter_by(project_id=project_id, resource=resource)
+    if volume_type_id:
+        query = query.filter_by(volume_type_id=volume_type_id)
+
+    result = query.first()
+    return (int(result[0] or 0), int(result[1] or 0))
+
+
+def _usage_counters_count(session, project_id=None):
+    """Count the usage of the projects from their resources."""
+    usages = collections.defaultdict(lambda: (0, 0))
+    for model, (resource, size_attr, type_attr) in (
+            USAGE_COUNTED_MODELS.items()):
+        group_by = [model.project_id]
+        if type_attr:
+            group_by.append(getattr(model, type_attr))
+        query = session.query(func.count(model.id),
+                              func.sum(getattr(model, size_attr)),
+                              *group_by).\
+            filter(~model.deleted).\
+            filter(model.project_id != None).\
+            group_by(*group_by)  # noqa
+        if project_id:
+            query = query.filter(model.project_id == project_id)
+        for row in query:
+            volume_type_id = row[3] if type_attr else None
+            key = (row[2], resource, volume_type_id or '')
+            in_use, gigabytes = usages[key]
+            usages[key] = (in_use + row[0], gigabytes + int(row[1] or 0))
+    return usages
+
+
+def _usage_counters_check(session, project_id=None, lock=False):
+    usages = _usage_counters_count(session, project_id)
+    query = session.query(models.UsageCounter)
+    if project_id:
+        query = query.filter_by(project_id=project_id)
+    if lock:
+        query = query.with_lockmode('update')
+    counters = {(counter.project_id, counter.resource,
+                 counter.volume_type_id): counter
+                for counter in query}
+
+    mismatches = []
+    for key in sorted(set(usages) | set(counters)):
+        actual = usages.get(key, (0, 0))
+        counter = counters.get(key)
+        counted = (counter.in_use, counter.gigabytes) if counter else (0, 0)
+        if counted != actual:
+            mismatches.append({'project_id': key[0],
+                               'resource': key[1],
+                               'volume_type_id': key[2],
+                               'in_use': counted[0],
+                               'gigabytes': counted[1],
+                               'actual_in_use': actual[0],
+                               'actual_gigabytes': actual[1]})
+    return mismatches, counters
+
+
+@require_admin_context
+def usage_counters_verify(context, project_id=None):
+    session = get_session()
+    with session.begin():
+        return _usage_counters_check(session, project_id)[0]
+
+
+@require_admin_context
+@_retry_on_deadlock
+def usage_counters_rebuild(context, project_id=None):
+    session = get_session()
+    with session.begin():
+        mismatches, counters = _usage_counters_check(session, project_id,
+                                                     lock=True)
+        for mismatch in mismatches:
+            key = (mismatch['project_id'], mismatch['resource'],
+                   mismatch['volume_type_id'])
+            counter = counters.get(key)
+            if counter is None:
+                counter = models.UsageCounter(project_id=key[0],
+                                              resource=key[1],
+                                              volume_type_id=key[2])
+                session.add(counter)
+            counter.in_use = mismatch['actual_in_use']
+            counter.gigabytes = mismatch['actual_gigabytes']
+    return mismatches
+
+
+###################
+
+
 @require_admin_context
 def service_destroy(context, service_id):
     session = get_session()
@@ -751,21 +941,55 @@ def _reservation_create(context, uuid, usage, project_id, resource, delta,
 # code always acquires the lock on quota_usages before acquiring the lock
 # on reservations.
 
-def _get_quota_usages(context, session, project_id):
+def _get_quota_usages(context, session, project_id, resources=None):
     # Broken out for testability
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
-        filter_by(project_id=project_id).\
-        with_lockmode('update').\
-        all()
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
+        filter_by(project_id=project_id)
+    if resources is not None:
+        # Only lock the rows we are going to update, always in the same
+        # order so concurrent reservations don't deadlock each other.
+        query = query.filter(models.QuotaUsage.resource.in_(resources)).\
+            order_by(models.QuotaUsage.id)
+    rows = query.with_lockmode('update').all()
     return {row.resource: row for row in rows}
 
 
+def _quota_usage_sync(context, session, resources, resource, project_id):
+    """Count the current usage of a resource with its sync routine."""
+    sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
+    volume_type_id = getattr(resources[resource], 'volume_type_id', None)
+    volume_type_name = getattr(resources[resource], 'volume_type_name', None)
+    return sync(context, project_id,
+                volume_type_id=volume_type_id,
+                volume_type_name=volume_type_name,
+                session=session)
+
+
+def _quota_usage_add_reserved(session, usages, increments):
+    """Add reserved quantities to usages with a single UPDATE."""
+    if not increments:
+        return
+    table = models.QuotaUsage.__table__
+    deltas = {usages[resource].id: delta
+              for resource, delta in increments.items()}
+    session.execute(
+        table.update().
+        where(table.c.id.in_(list(deltas))).
+        values(reserved=table.c.reserved + case(deltas, value=table.c.id)))
+    for resource, delta in increments.items():
+        # The rows are already updated, keep the loaded usages in sync
+        # without flushing them again.
+        attributes.set_committed_value(usages[resource], 'reserved',
+                                       usages[resource].reserved + delta)
+
+
 @require_context
 @_retry_on_deadlock
 def quota_reserve(context, resources, quotas, deltas, expire,
-                  until_refresh, max_age, project_id=None):
+                  until_refresh, max_age, project_id=None,
+                  async_refresh=False):
     elevated = context.elevated()
     session = get_session()
     with session.begin():
@@ -773,7 +997,8 @@ def quota_reserve(context, resources, quotas, deltas, expire,
             project_id = context.project_id
 
         # Get the current usages
-        usages = _get_quota_usages(context, session, project_id)
+        usages = _get_quota_usages(context, session, project_id,
+                                   resources=list(deltas))
 
         # Handle usage refresh
         work = set(deltas.keys())
@@ -795,27 +1020,29 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                 # heal from that...
                 refresh = True
             elif usages[resource].until_refresh is not None:
-                usages[resource].until_refresh -= 1
+                # NOTE: when refreshing asynchronously, a usage due for a
+                # refresh stays flagged with until_refresh <= 0 until
+                # quota_usage_refresh picks it up.
+                if usages[resource].until_refresh > 0 or not async_refresh:
+                    usages[resource].until_refresh -= 1
                 if usages[resource].until_refresh <= 0:
-                    refresh = True
-            elif max_age and usages[resource].updated_at is not None and (
-                (usages[resource].updated_at -
-                    timeutils.utcnow()).seconds >= max_age):
+                    refresh = not async_refresh
+            elif not async_refresh and max_age and (
+                    usages[resource].updated_at is not None) and (
+                    (usages[resource].updated_at -
+                        timeutils.utcnow()).seconds >= max_age):
                 refresh = True
 
             # OK, refresh the usage
             if refresh:
-                # Grab the sync routine
-                sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
-                volume_type_id = getattr(resources[resource],
-                                         'volume_type_id', None)
-                volume_type_name = getattr(resources[resource],
-                                           'volume_type_name', None)
-                updates = sync(elevated, project_id,
-                               volume_type_id=volume_type_id,
-                               volume_type_name=volume_type_name,
-                               session=session)
+                updates = _quota_usage_sync(elevated, session, resources,
+                                            resource, project_id)
                 for res, in_use in updates.items():
+                    # Only the usages we locked can be updated, others are
+                    # refreshed when they are reserved themselves.
+                    if res not in deltas:
+                        continue
+
                     # Make sure we have a destination for the usage!
                     if res not in usages:
                         usages[res] = _quota_usage_create(
@@ -875,20 +1102,21 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                                                   session=session)
                 reservations.append(reservation.uuid)
 
-                # Also update the reserved quantity
-                # NOTE(Vek): Again, we are only concerned here about
-                #            positive increments.  Here, though, we're
-                #            worried about the following scenario:
-                #
-                #            1) User initiates resize down.
-                #            2) User allocates a new instance.
-                #            3) Resize down fails or is reverted.
-                #            4) User is now over quota.
-                #
-                #            To prevent this, we only update the
-                #            reserved value if the delta is positive.
-                if delta > 0:
-                    usages[resource].reserved += delta
+            # Also update the reserved quantity
+            # NOTE(Vek): Again, we are only concerned here about
+            #            positive increments.  Here, though, we're
+            #            worried about the following scenario:
+            #
+            #            1) User initiates resize down.
+            #            2) User allocates a new instance.
+            #            3) Resize down fails or is reverted.
+            #            4) User is now over quota.
+            #
+            #            To prevent this, we only update the
+            #            reserved value if the delta is positive.
+            _quota_usage_add_reserved(
+                session, usages,
+                {r: delta for r, delta in deltas.items() if delta > 0})
 
     if unders:
         LOG.warning(_LW("Change will make usage less than 0 for the following "
@@ -902,6 +1130,52 @@ def quota_reserve(context, resources, quotas, deltas, expire,
     return reservations
 
 
+@require_admin_context
+def quota_usage_refresh(context, resources, until_refresh, max_age):
+    """Refresh the usages quota_reserve flagged as due for a refresh."""
+    due = or_(models.QuotaUsage.until_refresh <= 0,
+              models.QuotaUsage.in_use < 0)
+    if max_age:
+        cutoff = timeutils.utcnow() - dt.timedelta(seconds=max_age)
+        due = or_(due, models.QuotaUsage.updated_at < cutoff)
+    rows = model_query(context, models.QuotaUsage.project_id,
+                       models.QuotaUsage.resource, read_deleted="no").\
+        filter(due).\
+        all()
+
+    projects = collections.defaultdict(set)
+    for project_id, resource in rows:
+        if resource in resources and resources[resource].sync:
+            projects[project_id].add(resource)
+
+    # Each project is refreshed in its own short transaction, reservations
+    # only wait for the usages of a single project at a time.
+    for project_id, names in projects.items():
+        _quota_usage_refresh_project(context, resources, project_id, names,
+                                     until_refresh)
+    return sum(len(names) for names in projects.values())
+
+
+@_retry_on_deadlock
+def _quota_usage_refresh_project(context, resources, project_id, names,
+                                 until_refresh):
+    session = get_session()
+    with session.begin():
+        usages = _get_quota_usages(context, session, project_id,
+                                   resources=list(names))
+        work = set(usages)
+        while work:
+            updates = _quota_usage_sync(context, session, resources,
+                                        work.pop(), project_id)
+            for res, in_use in updates.items():
+                if res in usages:
+                    usages[res].in_use = in_use
+                    usages[res].until_refresh = until_refresh or None
+                    # Restart max_age even if nothing changed.
+                    usages[res].updated_at = timeutils.utcnow()
+                    work.discard(res)
+
+
 def _quota_reservations(session, context, reservations):
     """Return the relevant reservations."""
 
@@ -997,16 +1271,25 @@ def quota_destroy_all_by_project(context, project_id, only_quotas=False):
 
 @require_admin_context
 @_retry_on_deadlock
-def reservation_expire(context):
+def reservation_expire(context, batch_size=None, batch_sleep=None):
+    batch_size = batch_size or CONF.db_batch_size
+    if batch_sleep is None:
+        batch_sleep = CONF.db_batch_sleep
     session = get_session()
-    with session.begin():
-        current_time = timeutils.utcnow()
-        results = model_query(context, models.Reservation, session=session,
-                              read_deleted="no").\
-            filter(models.Reservation.expire < current_time).\
-            all()
+    current_time = timeutils.utcnow()
+    expired = 0
+    last_id = None
+    while True:
+        with session.begin():
+            query = model_query(context, models.Reservation,
+                                session=session, read_deleted="no").\
+                filter(models.Reservation.expire < current_time)
+            if last_id is not None:
+                query = query.filter(models.Reservation.id > last_id)
+            results = query.order_by(models.Reservation.id).\
+                limit(batch_size).\
+                all()
 
-        if results:
             for reservation in results:
                 if reservation.delta >= 0:
                     reservation.usage.reserved -= reservation.delta
@@ -1014,6 +1297,12 @@ def reservation_expire(context):
 
                 reservation.delete(session=session)
 
+        expired += len(results)
+        if len(results) < batch_size:
+            return expired
+        last_id = results[-1].id
+        time.sleep(batch_sleep)
+
 
 ###################
 
@@ -1087,6 +1376,7 @@ def volume_create(context, values):
     try:
         with session.begin():
             session.add(volume_ref)
+            _usage_counters_track(session, models.Volume, None, values)
     except db_exc.DBDataError:
         raise exception.Invalid()
 
@@ -1128,39 +1418,16 @@ def volume_data_get_for_host(context, host, count_only=False):
 @require_admin_context
 def _volume_data_get_for_project(context, project_id, volume_type_id=None,
                                  session=None):
-    query = model_query(context,
-                        func.count(models.Volume.id),
-                        func.sum(models.Volume.size),
-                        read_deleted="no",
-                        session=session).\
-        filter_by(project_id=project_id)
-
-    if volume_type_id:
-        query = query.filter_by(volume_type_id=volume_type_id)
-
-    result = query.first()
-
-    # NOTE(vish): convert None to 0
-    return (result[0] or 0, result[1] or 0)
+    return _usage_counters_get('volumes', project_id,
+                               volume_type_id=volume_type_id,
+                               session=session)
 
 
 @require_admin_context
 def _backup_data_get_for_project(context, project_id, volume_type_id=None,
                                  session=None):
-    query = model_query(context,
-                        func.count(models.Backup.id),
-                        func.sum(models.Backup.size),
-                        read_deleted="no",
-                        session=session).\
-        filter_by(project_id=project_id)
-
-    if volume_type_id:
-        query = query.filter_by(volume_type_id=volume_type_id)
-
-    result = query.first()
-
-    # NOTE(vish): convert None to 0
-    return (result[0] or 0, result[1] or 0)
+    # Backups are not counted by volume type
+    return _usage_counters_get('backups', project_id, session=session)
 
 
 @require_admin_context
@@ -1174,6 +1441,8 @@ def volume_destroy(context, volume_id):
     session = get_session()
     now = timeutils.utcnow()
     with session.begin():
+        _usage_counters_update(session, models.Volume, volume_id,
+                               {'deleted': True})
         model_query(context, models.Volume, session=session).\
             filter_by(id=volume_id).\
             update({'status': 'deleted',
@@ -1251,7 +1520,7 @@ def volume_detached(context, volume_id, attachment_id):
 
 @require_context
 def _volume_get_query(context, session=None, project_only=False,
-                      joined_load=True):
+                      joined_load=True, collection_load=joinedload):
     """Get the query to retrieve the volume.
 
     :param context: the context used to run the method _volume_get_query
@@ -1263,6 +1532,9 @@ def _volume_get_query(context, session=None, project_only=False,
                         the database. Currently, the False value for this
                         parameter is specially for the case of updating
                         database during volume migration
+    :param collection_load: the loader option used for the one-to-many
+                            relationships of the volume, joinedload or
+                            subqueryload
     :returns: updated query or None
     """
     if not joined_load:
@@ -1271,20 +1543,31 @@ def _volume_get_query(context, session=None, project_only=False,
     if is_admin_context(context):
         return model_query(context, models.Volume, session=session,
                            project_only=project_only).\
-            options(joinedload('volume_metadata')).\
-            options(joinedload('volume_admin_metadata')).\
+            options(collection_load('volume_metadata')).\
+            options(collection_load('volume_admin_metadata')).\
             options(joinedload('volume_type')).\
-            options(joinedload('volume_attachment')).\
+            options(collection_load('volume_attachment')).\
             options(joinedload('consistencygroup'))
     else:
         return model_query(context, models.Volume, session=session,
                            project_only=project_only).\
-            options(joinedload('volume_metadata')).\
+            options(collection_load('volume_metadata')).\
             options(joinedload('volume_type')).\
-            options(joinedload('volume_attachment')).\
+            options(collection_load('volume_attachment')).\
             options(joinedload('consistencygroup'))
 
 
+def _volume_get_list_query(context, session=None):
+    """Get the query to retrieve a page of volumes.
+
+    Joining the metadata and attachments of the volumes multiplies the rows
+    the database has to sort and return for a page, so they are loaded with
+    one secondary query each instead.
+    """
+    return _volume_get_query(context, session=session,
+                             collection_load=subqueryload)
+
+
 @require_context
 def _volume_get(context, volume_id, session=None, joined_load=True):
     result = _volume_get_query(context, session=session, project_only=True,
@@ -1354,7 +1637,7 @@ def volume_get(context, volume_id):
 
 @require_admin_context
 def volume_get_all(context, marker, limit, sort_keys=None, sort_dirs=None,
-                   filters=None, offset=None):
+                   filters=None, offset=None, columns=None):
     """Retrieves all volumes.
 
     If no sort parameters are specified then the returned volumes are sorted
@@ -1373,17 +1656,22 @@ def volume_get_all(context, marker, limit, sort_keys=None, sort_dirs=None,
                     or sets cause an 'IN' operation, while exact matching
                     is used for other values, see _process_volume_filters
                     function for more information
+    :param offset: number of items to skip
+    :param columns: list of volume columns to read, when given the volumes
+                    are returned as dicts holding only these columns and the
+                    sort keys, without loading their related models
     :returns: list of matching volumes
     """
     session = get_session()
     with session.begin():
         # Generate the query
         query = _generate_paginate_query(context, session, marker, limit,
-                                         sort_keys, sort_dirs, filters, offset)
+                                         sort_keys, sort_dirs, filters, offset,
+                                         columns=columns)
         # No volumes would match, return empty list
         if query is None:
             return []
-        return query.all()
+        return _paginate_results(query, columns)
 
 
 @require_admin_context
@@ -1445,7 +1733,7 @@ def volume_get_all_by_group(context, group_id, filters=None):
 @require_context
 def volume_get_all_by_project(context, project_id, marker, limit,
                               sort_keys=None, sort_dirs=None, filters=None,
-                              offset=None):
+                              offset=None, columns=None):
     """Retrieves all volumes in a project.
 
     If no sort parameters are specified then the returned volumes are sorted
@@ -1465,6 +1753,10 @@ def volume_get_all_by_project(context, project_id, marker, limit,
                     or sets cause an 'IN' operation, while exact matching
                     is used for other values, see _process_volume_filters
                     function for more information
+    :param offset: number of items to skip
+    :param columns: list of volume columns to read, when given the volumes
+                    are returned as dicts holding only these columns and the
+                    sort keys, without loading their related models
     :returns: list of matching volumes
     """
     session = get_session()
@@ -1475,16 +1767,17 @@ def volume_get_all_by_project(context, project_id, marker, limit,
         filters['project_id'] = project_id
         # Generate the query
         query = _generate_paginate_query(context, session, marker, limit,
-                                         sort_keys, sort_dirs, filters, offset)
+                                         sort_keys, sort_dirs, filters, offset,
+                                         columns=columns)
         # No volumes would match, return empty list
         if query is None:
             return []
-        return query.all()
+        return _paginate_results(query, columns)
 
 
 def _generate_paginate_query(context, session, marker, limit, sort_keys,
                              sort_dirs, filters, offset=None,
-                             paginate_type=models.Volume):
+                             paginate_type=models.Volume, columns=None):
     """Generate the query to include the filters and the paginate options.
 
     Returns a query with sorting / pagination criteria added or None
@@ -1505,6 +1798,9 @@ def _generate_paginate_query(context, session, marker, limit, sort_keys,
                     function for more information
     :param offset: number of items to skip
     :param paginate_type: type of pagination to generate
+    :param columns: list of columns of paginate_type to read, the query then
+                    returns rows of these columns and of the sort keys
+                    instead of model instances
     :returns: updated query or None
     """
     get_query, process_filters, get = PAGINATION_HELPERS[paginate_type]
@@ -1512,7 +1808,12 @@ def _generate_paginate_query(context, session, marker, limit, sort_keys,
     sort_keys, sort_dirs = process_sort_params(sort_keys,
                                                sort_dirs,
                                                default_dir='desc')
-    query = get_query(context, session=session)
+    if columns:
+        columns = list(columns)
+        columns.extend(key for key in sort_keys if key not in columns)
+        query = _projection_query(context, session, paginate_type, columns)
+    else:
+        query = get_query(context, session=session)
 
     if filters:
         query = process_filters(query, filters)
@@ -1520,14 +1821,64 @@ def _generate_paginate_query(context, session, marker, limit, sort_keys,
             return None
 
     marker_object = None
+    marker_values = None
     if marker is not None:
-        marker_object = get(context, marker, session)
+        cursor = utils.decode_pagination_cursor(marker)
+        if cursor is not None:
+            marker_values = _get_cursor_values(cursor, sort_keys)
+        else:
+            marker_object = get(context, marker, session)
 
     return sqlalchemyutils.paginate_query(query, paginate_type, limit,
                                           sort_keys,
                                           marker=marker_object,
                                           sort_dirs=sort_dirs,
-                                          offset=offset)
+                                          offset=offset,
+                                          marker_values=marker_values)
+
+
+def _projection_query(context, session, model, columns):
+    """Get the query reading only the given columns of a model.
+
+    :raise exception.InvalidInput: If a column is not a column of the model,
+                                   e.g. a relationship
+    """
+    column_attrs = []
+    for column in columns:
+        column_attr = getattr(model, column, None)
+        prop = getattr(column_attr, 'property', None)
+        if not isinstance(prop, ColumnProperty):
+            msg = _("Invalid column %s.") % column
+            raise exception.InvalidInput(reason=msg)
+        column_attrs.append(column_attr)
+    return model_query(context, *column_attrs, session=session)
+
+
+def _paginate_results(query, columns):
+    """Run a query built by _generate_paginate_query.
+
+    :returns: list of model instances, or of dicts if columns were projected
+    """
+    if columns:
+        return [row._asdict() for row in query.all()]
+    return query.all()
+
+
+def _get_cursor_values(cursor, sort_keys):
+    """Get the marker values of the sort keys from a pagination cursor.
+
+    :param cursor: dict of sort key to value decoded from the cursor
+    :param sort_keys: list of attributes by which results are sorted
+    :returns: list of values, paired with corresponding item in sort_keys
+    :raise exception.InvalidInput: If the cursor misses any of the sort keys,
+                                   i.e. it was built for a different sort
+    """
+    missing = [key for key in sort_keys if key not in cursor]
+    if missing:
+        msg = (_("Pagination marker does not match the sort keys %s.") %
+               ', '.join(sort_keys))
+        raise exception.InvalidInput(reason=msg)
+    return [cursor[key] for key in sort_keys]
 
 
 def _process_volume_filters(query, filters):
@@ -1703,6 +2054,7 @@ def volume_update(context, volume_id, values):
                                           delete=True,
                                           session=session)
 
+        _usage_counters_update(session, models.Volume, volume_id, values)
         volume_ref = _volume_get(context, volume_id, session=session)
         volume_ref.update(values)
 
@@ -1993,6 +2345,7 @@ def snapshot_create(context, values):
         snapshot_ref = models.Snapshot()
         snapshot_ref.update(values)
         session.add(snapshot_ref)
+        _usage_counters_track(session, models.Snapshot, None, values)
 
         return _snapshot_get(context, values['id'], session=session)
 
@@ -2002,6 +2355,8 @@ def snapshot_create(context, values):
 def snapshot_destroy(context, snapshot_id):
     session = get_session()
     with session.begin():
+        _usage_counters_update(session, models.Snapshot, snapshot_id,
+                               {'deleted': True})
         model_query(context, models.Snapshot, session=session).\
             filter_by(id=snapshot_id).\
             update({'status': 'deleted',
@@ -2070,10 +2425,16 @@ def snapshot_get_all(context, filters=None, marker=None, limit=None,
     return query.all()
 
 
-def _snaps_get_query(context, session=None, project_only=False):
+def _snaps_get_query(context, session=None, project_only=False,
+                     collection_load=joinedload):
     return model_query(context, models.Snapshot, session=session,
                        project_only=project_only).\
-        options(joinedload('snapshot_metadata'))
+        options(collection_load('snapshot_metadata'))
+
+
+def _snaps_get_list_query(context, session=None):
+    return _snaps_get_query(context, session=session,
+                            collection_load=subqueryload)
 
 
 def _process_snaps_filters(query, filters):
@@ -2182,20 +2543,9 @@ def snapshot_get_all_by_project(context, project_id, filters=None, marker=None,
 def _snapshot_data_get_for_project(context, project_id, volume_type_id=None,
                                    session=None):
     authorize_project_context(context, project_id)
-    query = model_query(context,
-                        func.count(models.Snapshot.id),
-                        func.sum(models.Snapshot.volume_size),
-                        read_deleted="no",
-                        session=session).\
-        filter_by(project_id=project_id)
-
-    if volume_type_id:
-        query = query.join('volume').filter_by(volume_type_id=volume_type_id)
-
-    result = query.first()
-
-    # NOTE(vish): convert None to 0
-    return (result[0] or 0, result[1] or 0)
+    return _usage_counters_get('snapshots', project_id,
+                               volume_type_id=volume_type_id,
+                               session=session)
 
 
 @require_context
@@ -2224,6 +2574,7 @@ def snapshot_get_active_by_window(context, begin, end=None, project_id=None):
 def snapshot_update(context, snapshot_id, values):
     session = get_session()
     with session.begin():
+        _usage_counters_update(session, models.Snapshot, snapshot_id, values)
         snapshot_ref = _snapshot_get(context, snapshot_id, session=session)
         snapshot_ref.update(values)
         return snapshot_ref
@@ -3604,6 +3955,7 @@ def backup_create(context, values):
     session = get_session()
     with session.begin():
         backup.save(session)
+        _usage_counters_track(session, models.Backup, None, values)
         return backup
 
 
@@ -3619,6 +3971,7 @@ def backup_update(context, backup_id, values):
             raise exception.BackupNotFound(
                 _("No backup with id %s") % backup_id)
 
+        _usage_counters_update(session, models.Backup, backup_id, values)
         backup.update(values)
 
     return backup
@@ -3626,12 +3979,16 @@ def backup_update(context, backup_id, values):
 
 @require_admin_context
 def backup_destroy(context, backup_id):
-    model_query(context, models.Backup).\
-        filter_by(id=backup_id).\
-        update({'status': fields.BackupStatus.DELETED,
-                'deleted': True,
-                'deleted_at': timeutils.utcnow(),
-                'updated_at': literal_column('updated_at')})
+    session = get_session()
+    with session.begin():
+        _usage_counters_update(session, models.Backup, backup_id,
+                               {'deleted': True})
+        model_query(context, models.Backup, session=session).\
+            filter_by(id=backup_id).\
+            update({'status': fields.BackupStatus.DELETED,
+                    'deleted': True,
+                    'deleted_at': timeutils.utcnow(),
+                    'updated_at': literal_column('updated_at')})
 
 
 ###############################
@@ -3756,6 +4113,8 @@ def transfer_accept(context, transfer_id, user_id, project_id):
             LOG.error(msg)
             raise exception.InvalidVolume(reason=msg)
 
+        _usage_counters_update(session, models.Volume, volume_id,
+                               {'project_id': project_id})
         volume_ref['status'] = 'available'
         volume_ref['user_id'] = user_id
         volume_ref['project_id'] = project_id
@@ -4057,7 +4416,8 @@ def cgsnapshot_destroy(context, cgsnapshot_id):
 
 
 @require_admin_context
-def purge_deleted_rows(context, age_in_days):
+def purge_deleted_rows(context, age_in_days, batch_size=None,
+                       batch_sleep=None, dry_run=False, progress=None):
     """Purge deleted rows older than age from cinder tables."""
     try:
         age_in_days = int(age_in_days)
@@ -4069,6 +4429,13 @@ def purge_deleted_rows(context, age_in_days):
         msg = _('Must supply a positive value for age')
         LOG.error(msg)
         raise exception.InvalidParameterValue(msg)
+    batch_size = batch_size or CONF.db_batch_size
+    if batch_size <= 0:
+        msg = _('Must supply a positive value for batch size')
+        LOG.error(msg)
+        raise exception.InvalidParameterValue(msg)
+    if batch_sleep is None:
+        batch_sleep = CONF.db_batch_sleep
 
     engine = get_engine()
     session = get_session()
@@ -4084,25 +4451,64 @@ def purge_deleted_rows(context, age_in_days):
     # Reorder the list so the volumes table is last to avoid FK constraints
     tables.remove("volumes")
     tables.append("volumes")
+    deleted_age = timeutils.utcnow() - dt.timedelta(days=age_in_days)
+    total_purged = 0
     for table in tables:
         t = Table(table, metadata, autoload=True)
+        if dry_run:
+            rows_purged = session.execute(
+                sql.select([func.count()]).select_from(t).
+                where(t.c.deleted_at < deleted_age)).scalar()
+            if progress:
+                progress(table, rows_purged)
+            total_purged += rows_purged
+            continue
+
         LOG.info(_LI('Purging deleted rows older than age=%(age)d days '
                      'from table=%(table)s'), {'age': age_in_days,
                                                'table': table})
-        deleted_age = timeutils.utcnow() - dt.timedelta(days=age_in_days)
+        rows_purged = _purge_table(session, t, deleted_age, batch_size,
+                                   batch_sleep, progress)
+        LOG.info(_LI("Deleted %(row)d rows from table=%(table)s"),
+                 {'row': rows_purged, 'table': table})
+        total_purged += rows_purged
+    return total_purged
+
+
+def _purge_table(session, t, deleted_age, batch_size, batch_sleep,
+                 progress):
+    """Delete the rows of a table deleted before deleted_age by batches.
+
+    Every batch is deleted in its own transaction, looking rows up by
+    primary key so no batch holds locks on the whole table.
+    """
+    pk = list(t.primary_key.columns)[0]
+    rows_purged = 0
+    last_id = None
+    while True:
+        query = sql.select([pk]).where(t.c.deleted_at < deleted_age)
+        if last_id is not None:
+            query = query.where(pk > last_id)
+        ids = [row[0] for row in
+               session.execute(query.order_by(pk).limit(batch_size))]
+        if not ids:
+            break
         try:
             with session.begin():
-                result = session.execute(
-                    t.delete()
-                    .where(t.c.deleted_at < deleted_age))
+                result = session.execute(t.delete().where(pk.in_(ids)))
         except db_exc.DBReferenceError:
             LOG.exception(_LE('DBError detected when purging from '
-                              'table=%(table)s'), {'table': table})
+                              'table=%(table)s'), {'table': t.name})
             raise
 
-        rows_purged = result.rowcount
-        LOG.info(_LI("Deleted %(row)d rows from table=%(table)s"),
-                 {'row': rows_purged, 'table': table})
+        rows_purged += result.rowcount
+        if progress:
+            progress(t.name, rows_purged)
+        if len(ids) < batch_size:
+            break
+        last_id = ids[-1]
+        time.sleep(batch_sleep)
+    return rows_purged
 
 
 ###############################
@@ -4154,8 +4560,10 @@ def driver_initiator_data_get(context, initiator, namespace):
 
 
 PAGINATION_HELPERS = {
-    models.Volume: (_volume_get_query, _process_volume_filters, _volume_get),
-    models.Snapshot: (_snaps_get_query, _process_snaps_filters, _snapshot_get),
+    models.Volume: (_volume_get_list_query, _process_volume_filters,
+                    _volume_get),
+    models.Snapshot: (_snaps_get_list_query, _process_snaps_filters,
+                      _snapshot_get),
     models.Backup: (_backups_get_query, _process_backups_filters, _backup_get),
     models.QualityOfServiceSpecs: (_qos_specs_get_query,
                                    _process_qos_specs_filters, _qos_specs_get),
@@ -4170,18 +4578,45 @@ PAGINATION_HELPERS = {
 ###############################
 
 
+def _image_volume_cache_host_get(session, host):
+    return session.query(models.ImageVolumeCacheHost).\
+        filter_by(host=host).\
+        first()
+
+
+def _image_volume_cache_host_add(session, host, count, size):
+    table = models.ImageVolumeCacheHost.__table__
+    update = table.update().\
+        where(table.c.host == host).\
+        values(count=table.c.count + count,
+               size=table.c.size + size)
+    if session.execute(update).rowcount:
+        return
+
+    try:
+        with session.begin_nested():
+            session.execute(table.insert().values(
+                host=host, count=count, size=size, inflation=0))
+    except db_exc.DBDuplicateEntry:
+        # The totals were created by a concurrent transaction
+        session.execute(update)
+
+
 @require_context
 def image_volume_cache_create(context, host, image_id, image_updated_at,
                               volume_id, size):
     session = get_session()
     with session.begin():
+        totals = _image_volume_cache_host_get(session, host)
         cache_entry = models.ImageVolumeCacheEntry()
         cache_entry.host = host
         cache_entry.image_id = image_id
         cache_entry.image_updated_at = image_updated_at
         cache_entry.volume_id = volume_id
         cache_entry.size = size
+        cache_entry.inflation = totals.inflation if totals else 0
         session.add(cache_entry)
+        _image_volume_cache_host_add(session, host, 1, size)
         return cache_entry
 
 
@@ -4189,9 +4624,14 @@ def image_volume_cache_create(context, host, image_id, image_updated_at,
 def image_volume_cache_delete(context, volume_id):
     session = get_session()
     with session.begin():
-        session.query(models.ImageVolumeCacheEntry).\
+        entries = session.query(models.ImageVolumeCacheEntry).\
             filter_by(volume_id=volume_id).\
-            delete()
+            with_lockmode('update').\
+            all()
+        for entry in entries:
+            _image_volume_cache_host_add(session, entry.host, -1,
+                                         -entry.size)
+            session.delete(entry)
 
 
 @require_context
@@ -4205,7 +4645,10 @@ def image_volume_cache_get_and_update_last_used(context, image_id, host):
             first()
 
         if entry:
+            totals = _image_volume_cache_host_get(session, host)
             entry.last_used = timeutils.utcnow()
+            entry.hits += 1
+            entry.inflation = totals.inflation if totals else 0
             entry.save(session=session)
         return entry
 
@@ -4229,6 +4672,79 @@ def image_volume_cache_get_all_for_host(context, host):
             all()
 
 
+@require_context
+def image_volume_cache_get_totals_for_host(context, host):
+    session = get_session()
+    with session.begin():
+        totals = _image_volume_cache_host_get(session, host)
+        if not totals:
+            return {'host': host, 'count': 0, 'size': 0, 'inflation': 0}
+        return {'host': host,
+                'count': totals.count,
+                'size': totals.size,
+                'inflation': totals.inflation}
+
+
+@require_context
+def image_volume_cache_update_inflation_for_host(context, host, inflation):
+    session = get_session()
+    with session.begin():
+        table = models.ImageVolumeCacheHost.__table__
+        # The inflation never decreases, whatever the order of the updates
+        session.execute(table.update().
+                        where(and_(table.c.host == host,
+                                   table.c.inflation < inflation)).
+                        values(inflation=inflation))
+
+
+###############################
+
+
+@require_context
+@_retry_on_deadlock
+def rate_limit_bucket_reserve(context, key, capacity, request_value,
+                              requested, returned, now):
+    try:
+        return _rate_limit_bucket_reserve(key, capacity, request_value,
+                                          requested, returned, now)
+    except db_exc.DBDuplicateEntry:
+        # Another API worker created the bucket first, use that one
+        return _rate_limit_bucket_reserve(key, capacity, request_value,
+                                          requested, returned, now)
+
+
+def _rate_limit_bucket_reserve(key, capacity, request_value, requested,
+                               returned, now):
+    session = get_session()
+    with session.begin():
+        bucket = session.query(models.RateLimitBucket).\
+            filter_by(key=key).\
+            with_lockmode('update').\
+            first()
+        if bucket is None:
+            bucket = models.RateLimitBucket(key=key, water_level=0,
+                                            last_leak=now)
+            session.add(bucket)
+
+        water_level, granted, delay, remaining = utils.leaky_bucket_reserve(
+            bucket.water_level, bucket.last_leak, capacity, request_value,
+            requested, returned, now)
+        bucket.water_level = water_level
+        bucket.last_leak = now
+        return granted, delay, remaining
+
+
+@require_admin_context
+def rate_limit_bucket_purge(context, now):
+    session = get_session()
+    with session.begin():
+        # A bucket which leaked all its water is the same as a new one
+        return session.query(models.RateLimitBucket).\
+            filter(models.RateLimitBucket.last_leak +
+                   models.RateLimitBucket.water_level <= now).\
+            delete(synchronize_session=False)
+
+
 ###############################
 
 
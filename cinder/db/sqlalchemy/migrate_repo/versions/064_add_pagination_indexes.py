@@ -0,0 +1,40 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+
+# Based on the default sort keys of the paginated listings
+# from: cinder/db/sqlalchemy/api.py
+INDEX_COLUMNS = ('deleted', 'created_at', 'id')
+TABLES = ('volumes', 'snapshots', 'backups')
+
+
+def _get_index(table):
+    members = list(INDEX_COLUMNS)
+    for idx in table.indexes:
+        if idx.columns.keys() == members:
+            return idx
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name in TABLES:
+        table = Table(table_name, meta, autoload=True)
+        if _get_index(table):
+            continue
+
+        index = Index('%s_deleted_created_at_id_idx' % table_name,
+                      *[table.c[column] for column in INDEX_COLUMNS])
+        index.create(migrate_engine)
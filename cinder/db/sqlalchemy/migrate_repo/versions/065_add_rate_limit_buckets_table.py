@@ -0,0 +1,32 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, Float, MetaData, String, Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    # New table
+    rate_limit_buckets = Table(
+        'rate_limit_buckets', meta,
+        Column('key', String(length=255), primary_key=True, nullable=False),
+        # Double precision, MySQL makes single precision FLOAT columns
+        # otherwise, which can't hold timestamps to the second.
+        Column('water_level', Float(precision=53), nullable=False),
+        Column('last_leak', Float(precision=53), nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+
+    rate_limit_buckets.create()
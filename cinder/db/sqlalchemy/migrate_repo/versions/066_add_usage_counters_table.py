@@ -0,0 +1,77 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, func, Integer, MetaData, select, String
+from sqlalchemy import Table, UniqueConstraint
+
+
+def _count(table, size_column, volume_type_column=None):
+    columns = [table.c.project_id,
+               func.count(table.c.id),
+               func.sum(size_column)]
+    group_by = [table.c.project_id]
+    if volume_type_column is not None:
+        columns.append(volume_type_column)
+        group_by.append(volume_type_column)
+    query = select(columns).\
+        where(table.c.deleted == False).\
+        where(table.c.project_id != None).\
+        group_by(*group_by)  # noqa
+    for row in query.execute():
+        yield {'project_id': row[0],
+               'volume_type_id': row[3] if len(row) > 3 else '',
+               'in_use': row[1],
+               'gigabytes': int(row[2] or 0)}
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    # New table
+    usage_counters = Table(
+        'usage_counters', meta,
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('project_id', String(length=255), nullable=False),
+        Column('resource', String(length=255), nullable=False),
+        Column('volume_type_id', String(length=36), nullable=False),
+        Column('in_use', Integer, nullable=False),
+        Column('gigabytes', Integer, nullable=False),
+        UniqueConstraint('project_id', 'resource', 'volume_type_id'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+
+    usage_counters.create()
+
+    # Count the existing volumes, snapshots and backups
+    volumes = Table('volumes', meta, autoload=True)
+    snapshots = Table('snapshots', meta, autoload=True)
+    backups = Table('backups', meta, autoload=True)
+    counted = (('volumes', volumes, volumes.c.size,
+                volumes.c.volume_type_id),
+               ('snapshots', snapshots, snapshots.c.volume_size,
+                snapshots.c.volume_type_id),
+               ('backups', backups, backups.c.size, None))
+    for resource, table, size_column, volume_type_column in counted:
+        counters = {}
+        for counter in _count(table, size_column, volume_type_column):
+            # Volumes without a type are counted with an empty type
+            key = (counter['project_id'], counter['volume_type_id'] or '')
+            if key in counters:
+                counters[key]['in_use'] += counter['in_use']
+                counters[key]['gigabytes'] += counter['gigabytes']
+            else:
+                counter.update(resource=resource, volume_type_id=key[1])
+                counters[key] = counter
+        if counters:
+            usage_counters.insert().execute(list(counters.values()))
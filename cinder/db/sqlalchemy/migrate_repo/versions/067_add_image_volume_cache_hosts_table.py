@@ -0,0 +1,55 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, Float, func, Integer, MetaData, select, String
+from sqlalchemy import Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    # Add the hits and inflation of the cache entries
+    entries = Table('image_volume_cache_entries', meta, autoload=True)
+    hits = Column('hits', Integer, nullable=False, default=0,
+                  server_default='0')
+    entries.create_column(hits)
+    # GDSF priorities are compared by small differences, which single
+    # precision, the default of MySQL, would lose.
+    inflation = Column('inflation', Float(precision=53), nullable=False,
+                       default=0, server_default='0')
+    entries.create_column(inflation)
+
+    # New table
+    hosts = Table(
+        'image_volume_cache_hosts', meta,
+        Column('host', String(length=255), primary_key=True, nullable=False),
+        Column('count', Integer, nullable=False),
+        Column('size', Integer, nullable=False),
+        Column('inflation', Float(precision=53), nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+
+    hosts.create()
+
+    # Count the existing cache entries
+    query = select([entries.c.host,
+                    func.count(entries.c.id),
+                    func.sum(entries.c.size)]).\
+        group_by(entries.c.host)
+    totals = [{'host': row[0],
+               'count': row[1],
+               'size': int(row[2] or 0),
+               'inflation': 0} for row in query.execute()]
+    if totals:
+        hosts.insert().execute(totals)
@@ -24,7 +24,7 @@ from oslo_db.sqlalchemy import models
 from oslo_utils import timeutils
 from sqlalchemy import Column, Integer, String, Text, schema
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import ForeignKey, DateTime, Boolean
+from sqlalchemy import ForeignKey, DateTime, Boolean, Float
 from sqlalchemy.orm import relationship, backref, validates
 
 
@@ -597,6 +597,53 @@ class ImageVolumeCacheEntry(BASE, models.ModelBase):
     volume_id = Column(String(36), nullable=False)
     size = Column(Integer, nullable=False)
     last_used = Column(DateTime, default=lambda: timeutils.utcnow())
+    hits = Column(Integer, nullable=False, default=0)
+    # Inflation of the cache of the host when the entry was last used
+    inflation = Column(Float(precision=53), nullable=False, default=0)
+
+
+class ImageVolumeCacheHost(BASE, models.ModelBase):
+    """Represents the totals of the image volume cache of a host
+
+    The number and size of the entries are counted as they are created and
+    deleted, so that the cache can tell whether it is full without loading
+    its entries.  The inflation is the priority of the last entry evicted by
+    the Greedy-Dual-Size-Frequency policy, by which entries age.
+    """
+    __tablename__ = 'image_volume_cache_hosts'
+    host = Column(String(255), primary_key=True, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    size = Column(Integer, nullable=False, default=0)
+    inflation = Column(Float(precision=53), nullable=False, default=0)
+
+
+class RateLimitBucket(BASE, models.ModelBase):
+    """Represents the shared state of an API rate limit"""
+    __tablename__ = 'rate_limit_buckets'
+    key = Column(String(255), primary_key=True, nullable=False)
+    water_level = Column(Float(precision=53), nullable=False, default=0)
+    last_leak = Column(Float(precision=53), nullable=False)
+
+
+class UsageCounter(BASE, models.ModelBase):
+    """Represents the usage of a resource by a project and volume type
+
+    Volumes, snapshots and backups are counted as they are created, deleted,
+    extended or moved between projects or volume types, so that quota syncs
+    don't have to scan them.  Resources without a volume type, and all the
+    backups, are counted with an empty volume_type_id.
+    """
+    __tablename__ = 'usage_counters'
+    __table_args__ = (
+        schema.UniqueConstraint("project_id", "resource", "volume_type_id"),
+        {'mysql_engine': 'InnoDB'}
+    )
+    id = Column(Integer, primary_key=True, nullable=False)
+    project_id = Column(String(255), nullable=False)
+    resource = Column(String(255), nullable=False)
+    volume_type_id = Column(String(36), nullable=False, default='')
+    in_use = Column(Integer, nullable=False, default=0)
+    gigabytes = Column(Integer, nullable=False, default=0)
 
 
 def register_models():
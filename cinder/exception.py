@@ -235,6 +235,11 @@ class ImageUnacceptable(Invalid):
     message = _("Image %(image_id)s is unacceptable: %(reason)s")
 
 
+class ImageNotRaw(ImageUnacceptable):
+    message = _("Image %(image_id)s is reported as raw but its format is "
+                "%(image_format)s.")
+
+
 class DeviceUnavailable(Invalid):
     message = _("The device in the path %(path)s is unavailable: %(reason)s")
 
@@ -12,6 +12,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from eventlet import greenpool
 from pytz import timezone
 import six
 
@@ -19,21 +20,33 @@ from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import timeutils
 
-from cinder.i18n import _LW
+from cinder import exception
+from cinder.i18n import _, _LE, _LW
 from cinder import rpc
 
 CONF = cfg.CONF
 
 LOG = logging.getLogger(__name__)
 
+# Maximum number of image-volumes deleted at the same time to make room in
+# the cache.
+MAX_CONCURRENT_EVICTIONS = 8
+
 
 class ImageVolumeCache(object):
+    EVICTION_POLICIES = ('lru', 'lfu', 'gdsf')
+
     def __init__(self, db, volume_api, max_cache_size_gb=0,
-                 max_cache_size_count=0):
+                 max_cache_size_count=0, eviction_policy='lru'):
         self.db = db
         self.volume_api = volume_api
         self.max_cache_size_gb = int(max_cache_size_gb)
         self.max_cache_size_count = int(max_cache_size_count)
+        if eviction_policy not in self.EVICTION_POLICIES:
+            raise exception.InvalidInput(
+                reason=_('Invalid image-volume cache eviction policy '
+                         '%s.') % eviction_policy)
+        self.eviction_policy = eviction_policy
         self.notifier = rpc.get_notifier('volume', CONF.host)
 
     def get_by_image_volume(self, context, volume_id):
@@ -72,6 +85,23 @@ class ImageVolumeCache(object):
                                     volume_ref['host'])
         return cache_entry
 
+    def has_entry(self, context, host, image_id, image_meta):
+        """Check whether an image is cached on a host.
+
+        Unlike get_entry this doesn't count as a use of the cache entry, but
+        out-dated entries are evicted all the same.
+        """
+        entries = self.db.image_volume_cache_get_all_for_host(context, host)
+        for cache_entry in entries:
+            if cache_entry['image_id'] != image_id:
+                continue
+            if not self._should_update_entry(cache_entry, image_meta):
+                return True
+            LOG.debug('Image-volume cache entry is out-dated, evicting: '
+                      '%(entry)s.', {'entry': self._entry_to_str(cache_entry)})
+            self._delete_image_volume(context, cache_entry)
+        return False
+
     def create_cache_entry(self, context, volume_ref, image_id, image_meta):
         """Create a new cache entry for an image.
 
@@ -122,18 +152,13 @@ class ImageVolumeCache(object):
                 space_required > self.max_cache_size_gb):
             return False
 
-        # Assume the entries are ordered by most recently used to least used.
-        entries = self.db.image_volume_cache_get_all_for_host(context, host)
-
-        current_count = len(entries)
-
-        current_size = 0
-        for entry in entries:
-            current_size += entry['size']
+        # The totals are kept up to date by the database, the entries are
+        # only loaded when some of them have to be evicted.
+        totals = self.db.image_volume_cache_get_totals_for_host(context, host)
 
         # Add values for the entry we intend to create.
-        current_size += space_required
-        current_count += 1
+        current_size = totals['size'] + space_required
+        current_count = totals['count'] + 1
 
         LOG.debug('Image-volume cache for host %(host)s current_size (GB) = '
                   '%(size_gb)s (max = %(max_gb)s), current count = %(count)s '
@@ -144,33 +169,113 @@ class ImageVolumeCache(object):
                    'count': current_count,
                    'max_count': self.max_cache_size_count})
 
-        while ((current_size > self.max_cache_size_gb
-               or current_count > self.max_cache_size_count)
-               and len(entries)):
-            entry = entries.pop()
-            LOG.debug('Reclaiming image-volume cache space; removing cache '
-                      'entry %(entry)s.', {'entry': self._entry_to_str(entry)})
-            self._delete_image_volume(context, entry)
-            current_size -= entry['size']
-            current_count -= 1
-            LOG.debug('Image-volume cache for host %(host)s new size (GB) = '
-                      '%(size_gb)s, new count = %(count)s.',
-                      {'host': host,
-                       'size_gb': current_size,
-                       'count': current_count})
-
-        # It is only possible to not free up enough gb, we will always be able
-        # to free enough count. This is because 0 means unlimited which means
-        # it is guaranteed to be >0 if limited, and we can always delete down
-        # to 0.
-        if self.max_cache_size_gb > 0:
-            if current_size > self.max_cache_size_gb > 0:
-                LOG.warning(_LW('Image-volume cache for host %(host)s does '
-                                'not have enough space (GB).'), {'host': host})
-                return False
+        if not self._is_full(current_size, current_count):
+            return True
+
+        entries = self.db.image_volume_cache_get_all_for_host(context, host)
+        candidates = iter(self._eviction_order(entries))
+        evicted = []
+        while self._is_full(current_size, current_count):
+            victims = []
+            for entry in candidates:
+                LOG.debug('Reclaiming image-volume cache space; removing '
+                          'cache entry %(entry)s.',
+                          {'entry': self._entry_to_str(entry)})
+                victims.append(entry)
+                current_size -= entry['size']
+                current_count -= 1
+                if not self._is_full(current_size, current_count):
+                    break
+            if not victims:
+                break
+
+            failed = self._delete_image_volumes(context, victims)
+            for entry in failed:
+                # The volumes which could not be deleted are still in the
+                # cache, the next entries are evicted in their place.
+                current_size += entry['size']
+                current_count += 1
+            evicted.extend(entry for entry in victims if entry not in failed)
+
+        if evicted and self.eviction_policy == 'gdsf':
+            # The entries left in the cache age, as the entries used from now
+            # on get at least the priority of the entries evicted.
+            inflation = max([totals['inflation']] +
+                            [self._gdsf_priority(entry) for entry in evicted])
+            self.db.image_volume_cache_update_inflation_for_host(
+                context, host, inflation)
+
+        LOG.debug('Image-volume cache for host %(host)s new size (GB) = '
+                  '%(size_gb)s, new count = %(count)s.',
+                  {'host': host,
+                   'size_gb': current_size,
+                   'count': current_count})
+
+        if self._is_full(current_size, current_count):
+            LOG.warning(_LW('Image-volume cache for host %(host)s does '
+                            'not have enough space.'), {'host': host})
+            return False
 
         return True
 
+    def _is_full(self, size, count):
+        """Check whether a cache of size GB and count entries is too big.
+
+        0 means unlimited for both limits.
+        """
+        return ((self.max_cache_size_gb and
+                 size > self.max_cache_size_gb) or
+                (self.max_cache_size_count and
+                 count > self.max_cache_size_count))
+
+    def _eviction_order(self, entries):
+        """Sort cache entries in the order they should be evicted.
+
+        The entries are ordered by most recently used to least used, ties
+        are broken by evicting the least recently used entry first.
+        """
+        entries = list(reversed(entries))
+        if self.eviction_policy == 'lfu':
+            return sorted(entries, key=lambda entry: entry['hits'])
+        if self.eviction_policy == 'gdsf':
+            return sorted(entries, key=self._gdsf_priority)
+        return entries
+
+    @staticmethod
+    def _gdsf_priority(entry):
+        """Greedy-Dual-Size-Frequency priority of a cache entry.
+
+        The creation of the entry counts as a use, every use being worth the
+        same whatever the size of the image, so that large images are
+        evicted before small ones which are used as often.  The inflation of
+        the cache when the entry was last used is added, so that the entries
+        which have not been used for long end up being evicted.
+        """
+        return (entry['inflation'] +
+                float(entry['hits'] + 1) / max(entry['size'], 1))
+
+    def _delete_image_volumes(self, context, entries):
+        """Delete the volumes of cache entries concurrently.
+
+        Returns the entries whose volume could not be deleted.
+        """
+        def delete(entry):
+            try:
+                self._delete_image_volume(context, entry)
+            except Exception:
+                LOG.exception(_LE('Failed to delete image-volume cache '
+                                  'entry %(entry)s.'),
+                              {'entry': self._entry_to_str(entry)})
+                return False
+            return True
+
+        if not entries:
+            return []
+        pool = greenpool.GreenPool(min(len(entries),
+                                       MAX_CONCURRENT_EVICTIONS))
+        deleted = list(pool.imap(delete, entries))
+        return [entry for entry, ok in zip(entries, deleted) if not ok]
+
     def _notify_cache_hit(self, context, image_id, host):
         self._notify_cache_action(context, image_id, host, 'hit')
 
@@ -180,6 +285,14 @@ class ImageVolumeCache(object):
     def _notify_cache_eviction(self, context, image_id, host):
         self._notify_cache_action(context, image_id, host, 'evict')
 
+    def notify_warm(self, context, host, event, **data):
+        """Notify about the progress of the warming of the cache of host."""
+        data['host'] = host
+        LOG.debug('ImageVolumeCache notification: action=warm.%(event)s'
+                  ' data=%(data)s.', {'event': event, 'data': data})
+        self.notifier.info(context, 'image_volume_cache.warm.%s' % event,
+                           data)
+
     def _notify_cache_action(self, context, image_id, host, action):
         data = {
             'image_id': image_id,
@@ -222,4 +335,5 @@ class ImageVolumeCache(object):
             'size': cache_entry['size'],
             'image_updated_at': cache_entry['image_updated_at'],
             'last_used': cache_entry['last_used'],
+            'hits': cache_entry['hits'],
         })
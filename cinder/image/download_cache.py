@@ -0,0 +1,192 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Cache of the image files downloaded by the volume services of a host.
+
+The images are kept in image_download_cache_dir under their id and Glance
+checksum, so that a new version of an image is never mistaken for the old
+one, and are shared by all the backends of the host: each process locks the
+entries it downloads, links or evicts with external locks.
+
+Cached images are hard linked to the path they are requested at, which
+keeps them valid if they get evicted while they are used, and copied when
+the cache and the path are on different file systems.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+
+from oslo_concurrency import lockutils
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import fileutils
+from oslo_utils import units
+
+from cinder import exception
+from cinder.i18n import _, _LI, _LW
+from cinder import utils
+
+LOG = logging.getLogger(__name__)
+
+image_download_cache_opts = [
+    cfg.StrOpt('image_download_cache_dir',
+               help='Directory where the images downloaded from Glance are '
+                    'kept to be reused by all the backends of the host. The '
+                    'cache is disabled when this is not set.'),
+    cfg.IntOpt('image_download_cache_max_size_gb',
+               default=10,
+               help='Max size of the image download cache in GB. '
+                    '0 => unlimited.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(image_download_cache_opts)
+
+PART_SUFFIX = '.part'
+
+
+def get_cache():
+    """Return the image download cache of the host, None if disabled."""
+    if not CONF.image_download_cache_dir:
+        return None
+    return ImageDownloadCache(CONF.image_download_cache_dir,
+                              CONF.image_download_cache_max_size_gb)
+
+
+def _lock(name):
+    return lockutils.lock('image-download-cache-%s' % name,
+                          lock_file_prefix='cinder-', external=True)
+
+
+class _ChecksumWriter(object):
+    """File-like object computing the checksum of the data it writes."""
+
+    def __init__(self, image_file):
+        self.image_file = image_file
+        self.checksum = hashlib.md5()
+
+    def write(self, data):
+        self.checksum.update(data)
+        self.image_file.write(data)
+
+
+class ImageDownloadCache(object):
+    def __init__(self, path, max_size_gb=0):
+        self.path = path
+        self.max_size = int(max_size_gb) * units.Gi
+
+    def fetch(self, context, image_service, image_id, image_meta, dest):
+        """Put the image at dest, downloading it to the cache if needed.
+
+        Returns False, without touching dest, if the image can't be cached,
+        either because Glance doesn't give its checksum or because it doesn't
+        fit in the cache.
+        """
+        checksum = image_meta.get('checksum')
+        size = image_meta.get('size') or 0
+        if not checksum or (self.max_size and size > self.max_size):
+            return False
+
+        name = '%s-%s' % (image_id, checksum)
+        path = os.path.join(self.path, name)
+        with _lock(name):
+            if self._link(path, dest):
+                LOG.debug('Image %(image_id)s found in the download cache '
+                          'at %(path)s.', {'image_id': image_id,
+                                           'path': path})
+                return True
+
+        fileutils.ensure_tree(self.path)
+        if not self._ensure_space(size):
+            LOG.warning(_LW('Image download cache %(path)s does not have '
+                            'enough space for image %(image_id)s.'),
+                        {'path': self.path, 'image_id': image_id})
+            return False
+
+        with _lock(name):
+            # The image may have been downloaded by another process while
+            # space was made for it.
+            if not os.path.exists(path):
+                self._download(context, image_service, image_id, checksum,
+                               path)
+            self._link(path, dest)
+        return True
+
+    def _link(self, path, dest):
+        """Link or copy a cached image to dest, False if it isn't cached."""
+        link = dest + '.link'
+        try:
+            os.link(path, link)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.copyfile(path, link)
+        os.rename(link, dest)
+        # The modification time of the entries is the time they were last
+        # used, the least recently used ones are evicted first.
+        os.utime(path, None)
+        return True
+
+    def _download(self, context, image_service, image_id, checksum, path):
+        # The entry is locked, a partial download with the same name can
+        # only have been left over by a dead process.
+        part = path + PART_SUFFIX
+        with fileutils.remove_path_on_error(part):
+            with open(part, 'wb') as image_file:
+                writer = _ChecksumWriter(image_file)
+                image_service.download(context, image_id, writer)
+            if writer.checksum.hexdigest() != checksum:
+                reason = (_('Downloaded image checksum %(actual)s does not '
+                            'match the checksum %(expected)s reported by '
+                            'Glance.') %
+                          {'actual': writer.checksum.hexdigest(),
+                           'expected': checksum})
+                raise exception.ImageUnacceptable(image_id=image_id,
+                                                  reason=reason)
+            os.rename(part, path)
+        LOG.info(_LI('Image %(image_id)s added to the download cache at '
+                     '%(path)s.'), {'image_id': image_id, 'path': path})
+
+    @utils.synchronized('image-download-cache', external=True)
+    def _ensure_space(self, size):
+        """Evict the least recently used images to make room for size bytes.
+
+        Returns False if not enough space can be freed.
+        """
+        if not self.max_size:
+            return True
+
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(PART_SUFFIX):
+                # Downloads in progress are not counted.
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        current_size = sum(entry[1] for entry in entries) + size
+        for _mtime, entry_size, name in sorted(entries):
+            if current_size <= self.max_size:
+                break
+            with _lock(name):
+                LOG.debug('Evicting %(name)s from the image download cache.',
+                          {'name': name})
+                fileutils.delete_if_exists(os.path.join(self.path, name))
+            current_size -= entry_size
+        return current_size <= self.max_size
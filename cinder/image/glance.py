@@ -19,24 +19,30 @@
 
 from __future__ import absolute_import
 
+import contextlib
 import copy
+import hashlib
 import itertools
+import os
 import random
 import shutil
 import sys
 import time
 
+from eventlet import greenpool
 import glanceclient.exc
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_utils import timeutils
+from oslo_utils import units
+import requests
 import six
 from six.moves import range
 from six.moves import urllib
 
 from cinder import exception
-from cinder.i18n import _LE, _LW
+from cinder.i18n import _, _LE, _LI, _LW
 
 
 glance_opts = [
@@ -45,6 +51,12 @@ glance_opts = [
                 help='A list of url schemes that can be downloaded directly '
                      'via the direct_url.  Currently supported schemes: '
                      '[file].'),
+    cfg.IntOpt('glance_download_connections',
+               default=1,
+               help='Number of connections used to download an image from '
+                    'glance with ranged requests, when its size and '
+                    'checksum are known and the glance server supports '
+                    'them. 1 downloads images with a single request.'),
 ]
 glance_core_properties_opts = [
     cfg.ListOpt('glance_core_properties',
@@ -60,6 +72,10 @@ CONF.import_opt('glance_api_version', 'cinder.common.config')
 
 LOG = logging.getLogger(__name__)
 
+# Size of the ranges of images downloaded with several connections.
+DOWNLOAD_RANGE_SIZE = 64 * units.Mi
+DOWNLOAD_CHUNK_SIZE = units.Mi
+
 
 def _parse_image_ref(image_href):
     """Parse an image href into composite parts.
@@ -155,6 +171,15 @@ class GlanceClientWrapper(object):
                                      self.netloc,
                                      self.use_ssl, version)
 
+    def get_endpoint(self):
+        """Return the URL of the glance server the next call is sent to."""
+        if self.client is None:
+            if self.api_servers is None:
+                self.api_servers = get_api_servers()
+            self.netloc, self.use_ssl = next(self.api_servers)
+        scheme = 'https' if self.use_ssl else 'http'
+        return '%s://%s' % (scheme, self.netloc)
+
     def call(self, context, method, *args, **kwargs):
         """Call a glance client method.
 
@@ -312,6 +337,11 @@ class GlanceImageService(object):
                         shutil.copyfileobj(f, data)
                     return
 
+        if (data and CONF.glance_download_connections > 1 and
+                hasattr(data, 'fileno') and hasattr(data, 'name')):
+            if self._download_ranges(context, image_id, data):
+                return
+
         try:
             image_chunks = self._client.call(context, 'data', image_id)
         except Exception:
@@ -323,6 +353,53 @@ class GlanceImageService(object):
             for chunk in image_chunks:
                 data.write(chunk)
 
+    def _download_ranges(self, context, image_id, data):
+        """Download an image to a file with several ranged requests.
+
+        Returns False if the image can't be downloaded that way, because its
+        size or checksum is unknown or glance doesn't support ranges.
+        """
+        image_meta = self.show(context, image_id)
+        size = image_meta.get('size')
+        checksum = image_meta.get('checksum')
+        if not size or not checksum or size <= DOWNLOAD_RANGE_SIZE:
+            return False
+
+        version = self._client.version or CONF.glance_api_version
+        path = ('/v1/images/%s' if version == 1 else '/v2/images/%s/file')
+        url = self._client.get_endpoint() + path % image_id
+        downloader = _RangedDownloader(context, image_id, url, size)
+        if not downloader.ranges_supported():
+            LOG.debug('Glance at %s does not support ranged requests.', url)
+            return False
+
+        start_time = timeutils.utcnow()
+        data.flush()
+        downloader.download(data.fileno(), CONF.glance_download_connections)
+        data.seek(size)
+        duration = max(timeutils.delta_seconds(start_time, timeutils.utcnow()),
+                       1)
+
+        image_checksum = hashlib.md5()
+        with open(data.name, 'rb') as image_file:
+            for chunk in iter(lambda: image_file.read(DOWNLOAD_CHUNK_SIZE),
+                              b''):
+                image_checksum.update(chunk)
+        if image_checksum.hexdigest() != checksum:
+            reason = (_('Downloaded image checksum %(actual)s does not match '
+                        'the checksum %(expected)s reported by Glance.') %
+                      {'actual': image_checksum.hexdigest(),
+                       'expected': checksum})
+            raise exception.ImageUnacceptable(image_id=image_id,
+                                              reason=reason)
+
+        LOG.info(_LI('Image %(image_id)s downloaded with %(connections)d '
+                     'connections at %(mbps).2f MB/s.'),
+                 {'image_id': image_id,
+                  'connections': CONF.glance_download_connections,
+                  'mbps': float(size) / units.Mi / duration})
+        return True
+
     def create(self, context, image_meta, data=None):
         """Store the image data and return the new image object."""
         sent_service_image_meta = self._translate_to_glance(image_meta)
@@ -454,6 +531,120 @@ class GlanceImageService(object):
         return str(user_id) == str(context.user_id)
 
 
+def _pwrite(fd, data, offset):
+    """Write all of data to fd at offset."""
+    view = memoryview(data)
+    written = 0
+    while written < len(view):
+        if hasattr(os, 'pwrite'):
+            written += os.pwrite(fd, view[written:], offset + written)
+        else:
+            # Green threads don't switch between the seek and the write.
+            os.lseek(fd, offset + written, os.SEEK_SET)
+            written += os.write(fd, view[written:])
+    return written
+
+
+class _RangedDownloader(object):
+    """Download an image from glance with several ranged requests."""
+
+    def __init__(self, context, image_id, url, size):
+        self.image_id = image_id
+        self.url = url
+        self.size = size
+        self.headers = {}
+        if CONF.auth_strategy == 'keystone':
+            self.headers['X-Auth-Token'] = context.auth_token
+        self.verify = (CONF.glance_ca_certificates_file or
+                       not CONF.glance_api_insecure)
+        self.timeout = CONF.glance_request_timeout
+        self._failed = False
+
+    def _get(self, start, end):
+        headers = dict(self.headers, Range='bytes=%d-%d' % (start, end))
+        return requests.get(self.url, headers=headers, stream=True,
+                            verify=self.verify, timeout=self.timeout)
+
+    def ranges_supported(self):
+        try:
+            response = self._get(0, 0)
+        except requests.RequestException:
+            return False
+        response.close()
+        return response.status_code == 206
+
+    def download(self, fd, connections):
+        """Download the image to fd, writing each range at its offset.
+
+        When a range fails no other range is started, and the ranges being
+        downloaded are stopped before the error is raised, so that nothing
+        writes to fd once the caller gets it back.
+        """
+        os.ftruncate(fd, self.size)
+        pool = greenpool.GreenPool(connections)
+        workers = []
+        for start in range(0, self.size, DOWNLOAD_RANGE_SIZE):
+            end = min(start + DOWNLOAD_RANGE_SIZE, self.size) - 1
+            if self._failed:
+                break
+            workers.append(pool.spawn(self._download_range, fd, start, end))
+        errors = []
+        for worker in workers:
+            try:
+                worker.wait()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def _download_range(self, fd, start, end):
+        try:
+            self._download_range_attempts(fd, start, end)
+        except Exception:
+            self._failed = True
+            raise
+
+    def _download_range_attempts(self, fd, start, end):
+        offset = start
+        num_attempts = 1 + CONF.glance_num_retries
+        for attempt in range(1, num_attempts + 1):
+            if self._failed:
+                # Another range failed, the download is over.
+                return
+            # Each attempt resumes the range where the previous one stopped.
+            try:
+                response = self._get(offset, end)
+                if response.status_code != 206:
+                    response.close()
+                    raise requests.HTTPError(
+                        'Unexpected status %s' % response.status_code)
+                with contextlib.closing(response):
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        if self._failed:
+                            return
+                        offset += _pwrite(fd, chunk, offset)
+            except requests.RequestException as e:
+                error = e
+            else:
+                if offset > end:
+                    return
+                error = _('short read')
+            if attempt == num_attempts:
+                LOG.error(_LE("Error downloading bytes %(start)d-%(end)d of "
+                              "image %(image_id)s from %(url)s: %(error)s."),
+                          {'start': offset, 'end': end,
+                           'image_id': self.image_id, 'url': self.url,
+                           'error': error})
+                raise exception.GlanceConnectionFailed(reason=error)
+            LOG.warning(_LW("Error downloading bytes %(start)d-%(end)d of "
+                            "image %(image_id)s from %(url)s, retrying: "
+                            "%(error)s."),
+                        {'start': offset, 'end': end,
+                         'image_id': self.image_id, 'url': self.url,
+                         'error': error})
+            time.sleep(1)
+
+
 def _convert_timestamps_to_datetimes(image_meta):
     """Returns image with timestamp fields converted to datetime objects."""
     for attr in ['created_at', 'updated_at', 'deleted_at']:
@@ -29,7 +29,11 @@ import math
 import os
 import re
 import tempfile
+import time
 
+import eventlet
+from eventlet import queue
+from eventlet import tpool
 from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -39,7 +43,9 @@ from oslo_utils import units
 
 from cinder import exception
 from cinder.i18n import _, _LI, _LW
+from cinder.image import download_cache
 from cinder.openstack.common import imageutils
+from cinder import rpc
 from cinder import utils
 from cinder.volume import throttling
 from cinder.volume import utils as volume_utils
@@ -49,11 +55,54 @@ LOG = logging.getLogger(__name__)
 image_helper_opts = [cfg.StrOpt('image_conversion_dir',
                                 default='$state_path/conversion',
                                 help='Directory used for temporary storage '
-                                'during image conversion'), ]
+                                'during image conversion'),
+                     cfg.BoolOpt('image_stream_raw_images',
+                                 default=False,
+                                 help='Write the images Glance reports as '
+                                 'raw straight to the volumes they are '
+                                 'copied to as they are downloaded, '
+                                 'instead of downloading them to '
+                                 'image_conversion_dir first. Images whose '
+                                 'header is the one of another format are '
+                                 'still downloaded and converted, as are '
+                                 'all images while volume copies are '
+                                 'throttled.'), ]
 
 CONF = cfg.CONF
 CONF.register_opts(image_helper_opts)
 
+# Size of the beginning of an image which is checked for the header of an
+# image format before writing it to a volume as raw data.
+RAW_IMAGE_HEADER_SIZE = 64 * units.Ki
+# Raw images are written to volumes in multiples of this size, at offsets
+# aligned on it.
+RAW_IMAGE_WRITE_SIZE = 4 * units.Mi
+
+# Volumes are uploaded to images in chunks of UPLOAD_CHUNK_SIZE, read up to
+# UPLOAD_READ_AHEAD chunks ahead of the upload.
+UPLOAD_CHUNK_SIZE = 4 * units.Mi
+UPLOAD_READ_AHEAD = 4
+# Minimum number of seconds between two notifications of the progress of an
+# upload.
+UPLOAD_PROGRESS_INTERVAL = 10
+
+# Magic numbers of the image formats probed by qemu-img, with their offset.
+IMAGE_FORMAT_MAGICS = (
+    ('qcow2', 0, b'QFI\xfb'),
+    ('qed', 0, b'QED\x00'),
+    ('vmdk', 0, b'KDMV'),
+    ('vmdk', 0, b'COWD'),
+    ('vmdk', 0, b'# Disk DescriptorFile'),
+    ('vdi', 0x40, b'\x7f\x10\xda\xbe'),
+    ('vhdx', 0, b'vhdxfile'),
+    ('vpc', 0, b'conectix'),
+    ('parallels', 0, b'WithoutFreeSpace'),
+    ('parallels', 0, b'WithouFreSpacExt'),
+    ('bochs', 0, b'Bochs Virtual HD Image'),
+    ('cloop', 0, b'#!/bin/sh\n#V2.0 Format\n'),
+    ('luks', 0, b'LUKS\xba\xbe'),
+)
+
 
 def qemu_img_info(path, run_as_root=True):
     """Return an object containing the parsed output from qemu-img info."""
@@ -190,6 +239,136 @@ def fetch(context, image_service, image_id, path, _user_id, _project_id):
     LOG.info(msg, {"sz": fsz_mb, "mbps": mbps})
 
 
+def fetch_cached(context, image_service, image_id, path, user_id=None,
+                 project_id=None, image_meta=None):
+    """Fetch an image through the image download cache of the host.
+
+    The image is downloaded as usual when the cache is disabled or the
+    image can't be cached.
+    """
+    cache = download_cache.get_cache()
+    if (cache and image_meta and
+            cache.fetch(context, image_service, image_id, image_meta, path)):
+        return
+    fetch(context, image_service, image_id, path, user_id, project_id)
+
+
+def probe_image_format(header):
+    """Return the format of an image from its header, None if raw."""
+    for fmt, offset, magic in IMAGE_FORMAT_MAGICS:
+        if header[offset:offset + len(magic)] == magic:
+            return fmt
+    return None
+
+
+class RawImageWriter(object):
+    """File-like object writing a raw image to a volume.
+
+    The data is written in multiples of RAW_IMAGE_WRITE_SIZE, once its
+    header has been checked not to be the one of another image format, in
+    which case ImageNotRaw is raised before anything is written.
+    """
+
+    def __init__(self, image_id, fd, max_size=None):
+        self.image_id = image_id
+        self.fd = fd
+        self.max_size = max_size
+        self.size = 0
+        self._buffer = bytearray()
+        self._checked = False
+
+    def write(self, data):
+        self._buffer += data
+        if not self._checked:
+            if len(self._buffer) < RAW_IMAGE_HEADER_SIZE:
+                return
+            self._check_header()
+        length = len(self._buffer)
+        if length >= RAW_IMAGE_WRITE_SIZE:
+            self._flush(length - length % RAW_IMAGE_WRITE_SIZE)
+
+    def close(self):
+        if not self._checked:
+            self._check_header()
+        self._flush(len(self._buffer))
+        tpool.execute(os.fsync, self.fd)
+
+    def _check_header(self):
+        fmt = probe_image_format(bytes(self._buffer[:RAW_IMAGE_HEADER_SIZE]))
+        if fmt is not None:
+            raise exception.ImageNotRaw(image_id=self.image_id,
+                                        image_format=fmt)
+        self._checked = True
+
+    def _flush(self, length):
+        if self.max_size is not None and self.size + length > self.max_size:
+            reason = (_("Image is bigger than the volume of size "
+                        "%(volume_size)dGB.") %
+                      {'volume_size': self.max_size / units.Gi})
+            raise exception.ImageUnacceptable(image_id=self.image_id,
+                                              reason=reason)
+        # Writes to the volume block, keep them off the hub.
+        tpool.execute(self._write_buffer, length)
+        del self._buffer[:length]
+        self.size += length
+
+    def _write_buffer(self, length):
+        view = memoryview(self._buffer)
+        offset = 0
+        while offset < length:
+            offset += os.write(self.fd, view[offset:length])
+        # The buffer can't be resized while it is viewed.
+        del view
+
+
+def fetch_raw_to_volume(context, image_service, image_id, dest, size=None):
+    """Download a raw image straight to a volume.
+
+    ImageNotRaw is raised if the image is in another format, before the
+    volume is written to.
+    """
+    max_size = size * units.Gi if size is not None else None
+    start_time = timeutils.utcnow()
+
+    def _write():
+        fd = os.open(dest, os.O_WRONLY)
+        try:
+            writer = RawImageWriter(image_id, fd, max_size)
+            image_service.download(context, image_id, writer)
+            writer.close()
+        finally:
+            os.close(fd)
+        return writer.size
+
+    if os.name == 'nt' or os.access(dest, os.W_OK):
+        image_size = _write()
+    else:
+        with utils.temporary_chown(dest):
+            image_size = _write()
+
+    duration = max(timeutils.delta_seconds(start_time, timeutils.utcnow()), 1)
+    fsz_mb = float(image_size) / units.Mi
+    LOG.debug("Image fetch details: dest %(dest)s, size %(sz).2f MB, "
+              "duration %(duration).2f sec",
+              {"dest": dest, "sz": fsz_mb, "duration": duration})
+    LOG.info(_LI("Image download %(sz).2f MB at %(mbps).2f MB/s"),
+             {"sz": fsz_mb, "mbps": fsz_mb / duration})
+
+
+def _volume_copies_throttled():
+    """Whether copies to volumes are throttled with a command prefix."""
+    throttle = throttling.Throttle.get_default()
+    # BlkioCgroup only builds its prefix for the devices of each copy.
+    return (isinstance(throttle, throttling.BlkioCgroup) or
+            bool(throttle.prefix))
+
+
+def _is_streamable_raw_image(image_meta):
+    return (image_meta is not None and
+            image_meta.get('disk_format') == 'raw' and
+            image_meta.get('container_format') in (None, 'bare'))
+
+
 def fetch_verify_image(context, image_service, image_id, dest,
                        user_id=None, project_id=None, size=None,
                        run_as_root=True):
@@ -244,6 +423,31 @@ def fetch_to_volume_format(context, image_service,
     qemu_img = True
     image_meta = image_service.show(context, image_id)
 
+    # Streamed images are written by the service itself, which the
+    # throttling of the commands converting images to volumes can't limit.
+    if (volume_format == 'raw' and CONF.image_stream_raw_images and
+            _is_streamable_raw_image(image_meta) and
+            not _volume_copies_throttled() and
+            not TemporaryImages.for_image_service(image_service).get(
+                context, image_id)):
+        image_size = image_meta.get('size')
+        if size is not None and image_size and image_size > size * units.Gi:
+            params = {'image_size': image_size / units.Gi,
+                      'volume_size': size}
+            reason = _("Size is %(image_size)dGB and doesn't fit in a "
+                       "volume of size %(volume_size)dGB.") % params
+            raise exception.ImageUnacceptable(image_id=image_id, reason=reason)
+        try:
+            fetch_raw_to_volume(context, image_service, image_id, dest,
+                                size=size)
+            return
+        except exception.ImageNotRaw as e:
+            LOG.warning(_LW("Image %(image_id)s is reported as raw but its "
+                            "format is %(fmt)s, downloading it again to "
+                            "convert it."),
+                        {'image_id': image_id,
+                         'fmt': e.kwargs['image_format']})
+
     # NOTE(avishay): I'm not crazy about creating temp files which may be
     # large and cause disk full errors which would confuse users.
     # Unfortunately it seems that you can't pipe to 'qemu-img convert' because
@@ -280,7 +484,8 @@ def fetch_to_volume_format(context, image_service,
         if tmp_image:
             tmp = tmp_image
         else:
-            fetch(context, image_service, image_id, tmp, user_id, project_id)
+            fetch_cached(context, image_service, image_id, tmp, user_id,
+                         project_id, image_meta=image_meta)
 
         if is_xenserver_image(context, image_service, image_id):
             replace_xenserver_image_with_coalesced_vhd(tmp)
@@ -352,6 +557,108 @@ def _validate_file_format(image_data, expected_format):
     return False
 
 
+class ImageUploadReader(object):
+    """File-like object reading an image file ahead of its upload.
+
+    The file is read in chunks of UPLOAD_CHUNK_SIZE in a native thread, up to
+    UPLOAD_READ_AHEAD chunks ahead of the image service, so that reading the
+    volume overlaps with sending it.  The throughput of the upload is
+    reported with image_upload.progress and image_upload.end notifications.
+
+    Other file methods are passed to the file, they can be used to get the
+    size of the image before it is read.
+    """
+
+    def __init__(self, context, image_id, image_file):
+        self.context = context
+        self.image_id = image_id
+        self.image_file = image_file
+        self.size = 0
+        self.notifier = rpc.get_notifier('volume', CONF.host)
+        self._chunks = None
+        self._read_ahead_thread = None
+        self._chunk = b''
+        self._offset = 0
+        self._eof = False
+        self._start_time = None
+        self._notified_at = None
+
+    def __getattr__(self, name):
+        return getattr(self.image_file, name)
+
+    def _read_ahead(self):
+        while True:
+            try:
+                chunk = tpool.execute(self.image_file.read, UPLOAD_CHUNK_SIZE)
+            except Exception as e:
+                self._chunks.put(e)
+                return
+            self._chunks.put(chunk)
+            if not chunk:
+                return
+
+    def _next_chunk(self):
+        if self._chunks is None:
+            self._start_time = self._notified_at = time.time()
+            self._chunks = queue.LightQueue(UPLOAD_READ_AHEAD)
+            self._read_ahead_thread = eventlet.spawn(self._read_ahead)
+        chunk = self._chunks.get()
+        if isinstance(chunk, Exception):
+            raise chunk
+        return chunk
+
+    def read(self, size=-1):
+        data = []
+        while not self._eof and (size is None or size < 0 or size > 0):
+            if self._offset == len(self._chunk):
+                self._chunk = self._next_chunk()
+                self._offset = 0
+                if not self._chunk:
+                    self._eof = True
+                    break
+            end = len(self._chunk)
+            if size is not None and size >= 0:
+                end = min(end, self._offset + size)
+                size -= end - self._offset
+            data.append(self._chunk[self._offset:end])
+            self._offset = end
+        data = b''.join(data)
+        self.size += len(data)
+
+        if (self._notified_at is not None and
+                time.time() - self._notified_at >= UPLOAD_PROGRESS_INTERVAL):
+            self._notified_at = time.time()
+            self.notify('progress')
+        return data
+
+    def close(self):
+        """Stop reading ahead, the file itself is left open."""
+        if self._read_ahead_thread is not None:
+            self._read_ahead_thread.kill()
+            self._read_ahead_thread = None
+
+    def notify(self, event):
+        duration = 0
+        if self._start_time is not None:
+            duration = time.time() - self._start_time
+        payload = {'image_id': self.image_id,
+                   'size': self.size,
+                   'duration': duration,
+                   'mbps': float(self.size) / units.Mi / max(duration, 1)}
+        LOG.debug('Image upload notification: event=%(event)s '
+                  'data=%(data)s.', {'event': event, 'data': payload})
+        self.notifier.info(self.context, 'image_upload.%s' % event, payload)
+
+
+def _upload_image(context, image_service, image_id, image_file):
+    reader = ImageUploadReader(context, image_id, image_file)
+    try:
+        image_service.update(context, image_id, {}, reader)
+    finally:
+        reader.close()
+    reader.notify('end')
+
+
 def upload_volume(context, image_service, image_meta, volume_path,
                   volume_format='raw', run_as_root=True):
     image_id = image_meta['id']
@@ -360,11 +667,12 @@ def upload_volume(context, image_service, image_meta, volume_path,
                   image_id, volume_format, image_meta['disk_format'])
         if os.name == 'nt' or os.access(volume_path, os.R_OK):
             with open(volume_path, 'rb') as image_file:
-                image_service.update(context, image_id, {}, image_file)
+                _upload_image(context, image_service, image_id, image_file)
         else:
             with utils.temporary_chown(volume_path):
                 with open(volume_path) as image_file:
-                    image_service.update(context, image_id, {}, image_file)
+                    _upload_image(context, image_service, image_id,
+                                  image_file)
         return
 
     with temporary_file() as tmp:
@@ -395,7 +703,7 @@ def upload_volume(context, image_service, image_meta, volume_path,
                 {'f1': image_meta['disk_format'], 'f2': data.file_format})
 
         with open(tmp, 'rb') as image_file:
-            image_service.update(context, image_id, {}, image_file)
+            _upload_image(context, image_service, image_id, image_file)
 
 
 def is_xenserver_image(context, image_service, image_id):
@@ -39,6 +39,7 @@ from cinder import coordination as cinder_coordination
 from cinder.db import api as cinder_db_api
 from cinder.db import base as cinder_db_base
 from cinder import exception as cinder_exception
+from cinder.image import download_cache as cinder_image_downloadcache
 from cinder.image import glance as cinder_image_glance
 from cinder.image import image_utils as cinder_image_imageutils
 import cinder.keymgr
@@ -313,6 +314,7 @@ def list_opts():
                 cinder_volume_drivers_disco_disco.disco_opts,
                 cinder_volume_drivers_hgst.hgst_opts,
                 cinder_image_imageutils.image_helper_opts,
+                cinder_image_downloadcache.image_download_cache_opts,
                 cinder_compute_nova.nova_opts,
                 cinder_volume_drivers_ibm_flashsystemfc.flashsystem_fc_opts,
                 cinder_volume_drivers_prophetstor_options.DPL_OPTS,
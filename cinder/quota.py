@@ -64,6 +64,17 @@ quota_opts = [
     cfg.IntOpt('max_age',
                default=0,
                help='Number of seconds between subsequent usage refreshes'),
+    cfg.BoolOpt('quota_usage_refresh_async',
+                default=False,
+                help='Refresh the usages due for a refresh because of '
+                     'until_refresh or max_age from a periodic task of the '
+                     'scheduler, instead of while reserving quota.'),
+    cfg.IntOpt('quota_usage_refresh_interval',
+               default=60,
+               min=1,
+               help='Number of seconds between two runs of the quota usage '
+                    'refresh task, when quota_usage_refresh_async is '
+                    'enabled.'),
     cfg.StrOpt('quota_driver',
                default='cinder.quota.DbQuotaDriver',
                help='Default driver to use for quota checks'),
@@ -396,7 +407,8 @@ class DbQuotaDriver(object):
         #            have to do the work there.
         return db.quota_reserve(context, resources, quotas, deltas, expire,
                                 CONF.until_refresh, CONF.max_age,
-                                project_id=project_id)
+                                project_id=project_id,
+                                async_refresh=CONF.quota_usage_refresh_async)
 
     def commit(self, context, reservations, project_id=None):
         """Commit reservations.
@@ -451,6 +463,17 @@ class DbQuotaDriver(object):
 
         db.reservation_expire(context)
 
+    def refresh_usages(self, context, resources):
+        """Refresh the usages due for a refresh.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        :returns: The number of usages refreshed.
+        """
+
+        return db.quota_usage_refresh(context, resources, CONF.until_refresh,
+                                      CONF.max_age)
+
 
 class BaseResource(object):
     """Describe a single resource for quota checking."""
@@ -873,6 +896,17 @@ class QuotaEngine(object):
 
         self._driver.expire(context)
 
+    def refresh_usages(self, context):
+        """Refresh the usages due for a refresh.
+
+        Counts the usages quota reservations left flagged for a refresh
+        when quota_usage_refresh_async is enabled.
+
+        :param context: The request context, for access checks.
+        """
+
+        return self._driver.refresh_usages(context, self.resources)
+
     def add_volume_type_opts(self, context, opts, volume_type_id):
         """Add volume type resource options.
 
@@ -35,6 +35,14 @@ scheduler_driver_opts = [
     cfg.IntOpt('scheduler_max_attempts',
                default=3,
                help='Maximum number of attempts to schedule a volume'),
+    cfg.StrOpt('scheduler_batch_placement',
+               default='spread',
+               choices=['spread', 'pack'],
+               help='How volumes scheduled in a single batch are placed on '
+                    'the hosts passing the filters: "spread" weighs the '
+                    'hosts again before placing every volume, "pack" keeps '
+                    'placing volumes on the same host while it passes the '
+                    'filters.'),
 ]
 
 CONF = cfg.CONF
@@ -106,6 +114,26 @@ class Scheduler(object):
         """Must override schedule method for scheduler to work."""
         raise NotImplementedError(_("Must implement schedule_create_volume"))
 
+    def schedule_create_volumes(self, context, request_spec_list,
+                                filter_properties_list):
+        """Schedule a batch of volumes.
+
+        Schedulers able to place several volumes at once should override
+        this, the default schedules the volumes one by one.
+
+        :returns: A list holding, for every request, the host chosen or the
+                  exception raised while scheduling it.
+        """
+        placements = []
+        for request_spec, filter_properties in zip(request_spec_list,
+                                                   filter_properties_list):
+            try:
+                placements.append(self.schedule_create_volume(
+                    context, request_spec, filter_properties))
+            except Exception as e:
+                placements.append(e)
+        return placements
+
     def schedule_create_consistencygroup(self, context, group,
                                          request_spec_list,
                                          filter_properties_list):
@@ -20,8 +20,11 @@ You can customize this scheduler by specifying your own volume Filters and
 Weighing Functions.
 """
 
+import collections
+
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 
 from cinder import exception
 from cinder.i18n import _, _LE, _LW
@@ -87,6 +90,11 @@ class FilterScheduler(driver.Scheduler):
         if not weighed_host:
             raise exception.NoValidHost(reason=_("No weighed hosts available"))
 
+        return self._create_volume_on_host(context, request_spec,
+                                           filter_properties, weighed_host)
+
+    def _create_volume_on_host(self, context, request_spec, filter_properties,
+                               weighed_host):
         host = weighed_host.obj.host
         volume_id = request_spec['volume_id']
 
@@ -100,6 +108,105 @@ class FilterScheduler(driver.Scheduler):
         self.volume_rpcapi.create_volume(context, updated_volume, host,
                                          request_spec, filter_properties,
                                          allow_reschedule=True)
+        return host
+
+    def schedule_create_volumes(self, context, request_spec_list,
+                                filter_properties_list):
+        """Place a batch of volumes.
+
+        Requests that filters cannot tell apart are filtered together, once.
+        Their volumes are then placed one after the other on the candidates,
+        consuming capacity in place, following scheduler_batch_placement:
+        'spread' weighs the candidates again before placing every volume,
+        'pack' keeps placing volumes on the same host while it passes the
+        filters.
+        """
+        placements = [None] * len(request_spec_list)
+        batches = collections.OrderedDict()
+        for index, request_spec in enumerate(request_spec_list):
+            key = self._batch_key(request_spec,
+                                  filter_properties_list[index])
+            batches.setdefault(key, []).append(index)
+
+        for indexes in batches.values():
+            self._schedule_batch(context, request_spec_list,
+                                 filter_properties_list, indexes, placements)
+        return placements
+
+    def _batch_key(self, request_spec, filter_properties):
+        """Return what filters look at in a request, as a hashable value."""
+        volume_properties = request_spec['volume_properties']
+        volume_type = request_spec.get('volume_type') or {}
+        return jsonutils.dumps(
+            [volume_type.get('id'),
+             volume_properties.get('size'),
+             volume_properties.get('availability_zone'),
+             volume_properties.get('multiattach', False),
+             volume_properties.get('metadata'),
+             volume_properties.get('qos_specs'),
+             request_spec.get('CG_backend'),
+             (filter_properties or {}).get('scheduler_hints')],
+            sort_keys=True)
+
+    def _schedule_batch(self, context, request_spec_list,
+                        filter_properties_list, indexes, placements):
+        first = indexes[0]
+        if filter_properties_list[first] is None:
+            filter_properties_list[first] = {}
+        try:
+            weighed_hosts = self._get_weighted_candidates(
+                context, request_spec_list[first],
+                filter_properties_list[first])
+            weighed_hosts = self._filter_cg_backend(
+                weighed_hosts, request_spec_list[first])
+        except Exception as e:
+            for index in indexes:
+                placements[index] = e
+            return
+        candidates = [weighed_host.obj for weighed_host in weighed_hosts]
+
+        last_host = None
+        for index in indexes:
+            request_spec = request_spec_list[index]
+            filter_properties = filter_properties_list[index]
+            try:
+                if index != first:
+                    if filter_properties is None:
+                        filter_properties = filter_properties_list[index] = {}
+                    self._prepare_filter_properties(context, request_spec,
+                                                    filter_properties)
+                weighed_host = None
+                if (last_host is not None and
+                        CONF.scheduler_batch_placement == 'pack'):
+                    weighed_host = self._batch_candidate(
+                        [last_host], filter_properties)
+                if weighed_host is None:
+                    weighed_host = self._batch_candidate(
+                        self.host_manager.get_weighed_hosts(
+                            candidates, filter_properties),
+                        filter_properties)
+                if weighed_host is None:
+                    raise exception.NoValidHost(
+                        reason=_("No weighed hosts available"))
+                self._choose_top_host([weighed_host], request_spec)
+                last_host = weighed_host
+                placements[index] = self._create_volume_on_host(
+                    context, request_spec, filter_properties, weighed_host)
+            except Exception as e:
+                placements[index] = e
+
+    def _batch_candidate(self, weighed_hosts, filter_properties):
+        """Return the first weighed host still passing the filters.
+
+        Candidates were filtered before any volume of the batch was placed,
+        only the host a volume is about to be placed on is filtered again
+        to account for what the previous volumes consumed.
+        """
+        for weighed_host in weighed_hosts:
+            if self.host_manager.get_filtered_hosts([weighed_host.obj],
+                                                    filter_properties):
+                return weighed_host
+        return None
 
     def host_passes_filters(self, context, host, request_spec,
                             filter_properties):
@@ -257,6 +364,35 @@ class FilterScheduler(driver.Scheduler):
         """
         elevated = context.elevated()
 
+        if filter_properties is None:
+            filter_properties = {}
+        self._prepare_filter_properties(context, request_spec,
+                                        filter_properties)
+
+        # Find our local list of acceptable hosts by filtering and
+        # weighing our options. we virtually consume resources on
+        # it so subsequent selections can adjust accordingly.
+
+        # Note: remember, we are using an iterator here. So only
+        # traverse this list once.
+        hosts = self.host_manager.get_all_host_states(elevated)
+
+        # Filter local hosts based on requirements ...
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                                                     filter_properties)
+        if not hosts:
+            return []
+
+        LOG.debug("Filtered %s", hosts)
+        # weighted_host = WeightedHost() ... the best
+        # host for the job.
+        weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
+                                                            filter_properties)
+        return weighed_hosts
+
+    def _prepare_filter_properties(self, context, request_spec,
+                                   filter_properties):
+        """Fill in the filter properties of a volume create request."""
         volume_properties = request_spec['volume_properties']
         # Since Cinder is using mixed filters from Oslo and it's own, which
         # takes 'resource_XX' and 'volume_XX' as input respectively, copying
@@ -268,8 +404,6 @@ class FilterScheduler(driver.Scheduler):
 
         config_options = self._get_configuration_options()
 
-        if filter_properties is None:
-            filter_properties = {}
         self._populate_retry(filter_properties, resource_properties)
 
         if resource_type is None:
@@ -297,27 +431,6 @@ class FilterScheduler(driver.Scheduler):
             resource_type['extra_specs'].update(
                 multiattach='<is> True')
 
-        # Find our local list of acceptable hosts by filtering and
-        # weighing our options. we virtually consume resources on
-        # it so subsequent selections can adjust accordingly.
-
-        # Note: remember, we are using an iterator here. So only
-        # traverse this list once.
-        hosts = self.host_manager.get_all_host_states(elevated)
-
-        # Filter local hosts based on requirements ...
-        hosts = self.host_manager.get_filtered_hosts(hosts,
-                                                     filter_properties)
-        if not hosts:
-            return []
-
-        LOG.debug("Filtered %s", hosts)
-        # weighted_host = WeightedHost() ... the best
-        # host for the job.
-        weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
-                                                            filter_properties)
-        return weighed_hosts
-
     def _get_weighted_candidates_group(self, context, request_spec_list,
                                        filter_properties_list=None):
         """Finds hosts that supports the consistencygroup.
@@ -410,9 +523,7 @@ class FilterScheduler(driver.Scheduler):
 
         return weighed_hosts
 
-    def _schedule(self, context, request_spec, filter_properties=None):
-        weighed_hosts = self._get_weighted_candidates(context, request_spec,
-                                                      filter_properties)
+    def _filter_cg_backend(self, weighed_hosts, request_spec):
         # When we get the weighed_hosts, we clear those hosts whose backend
         # is not same as consistencygroup's backend.
         CG_backend = request_spec.get('CG_backend')
@@ -423,6 +534,12 @@ class FilterScheduler(driver.Scheduler):
                 backend = utils.extract_host(host.obj.host)
                 if backend != CG_backend:
                     weighed_hosts.remove(host)
+        return weighed_hosts
+
+    def _schedule(self, context, request_spec, filter_properties=None):
+        weighed_hosts = self._get_weighted_candidates(context, request_spec,
+                                                      filter_properties)
+        weighed_hosts = self._filter_cg_backend(weighed_hosts, request_spec)
         if not weighed_hosts:
             LOG.warning(_LW('No weighed hosts found for volume '
                             'with properties: %s'),
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import logging
 
 import six
@@ -22,43 +23,95 @@ from cinder.scheduler.filters import extra_specs_ops
 
 LOG = logging.getLogger(__name__)
 
+_MATCHER_CACHE_SIZE = 256
+# Volume type id -> ExtraSpecsMatcher, least recently used first.
+_matcher_cache = collections.OrderedDict()
 
-class CapabilitiesFilter(filters.BaseHostFilter):
-    """HostFilter to work with resource (instance & volume) type records."""
 
-    def _satisfies_extra_specs(self, capabilities, resource_type):
-        """Check if capabilities satisfy resource type requirements.
-
-        Check that the capabilities provided by the services satisfy
-        the extra specs associated with the resource type.
-        """
-        extra_specs = resource_type.get('extra_specs', [])
-        if not extra_specs:
-            return True
+class ExtraSpecsMatcher(object):
+    """Extra specs of a resource type parsed once for many capabilities."""
 
-        for key, req in six.iteritems(extra_specs):
+    def __init__(self, extra_specs, updated_at=None):
+        self.extra_specs = dict(extra_specs)
+        self.updated_at = updated_at
+        self._requirements = []
+        for key, req in six.iteritems(self.extra_specs):
             # Either not scope format, or in capabilities scope
             scope = key.split(':')
             if len(scope) > 1 and scope[0] != "capabilities":
                 continue
             elif scope[0] == "capabilities":
                 del scope[0]
+            self._requirements.append(
+                (tuple(scope), req, extra_specs_ops.get_matcher(req)))
 
+    def matches(self, capabilities):
+        """Check if capabilities satisfy the extra specs."""
+        for scope, req, match in self._requirements:
             cap = capabilities
-            for index in range(len(scope)):
+            for key in scope:
                 try:
-                    cap = cap.get(scope[index])
+                    cap = cap.get(key)
                 except AttributeError:
                     return False
                 if cap is None:
                     return False
-            if not extra_specs_ops.match(cap, req):
+            if not match(cap):
                 LOG.debug("extra_spec requirement '%(req)s' "
                           "does not match '%(cap)s'",
                           {'req': req, 'cap': cap})
                 return False
         return True
 
+
+def get_matcher(resource_type):
+    """Return the matcher of a resource type's extra specs.
+
+    Matchers are cached by resource type id and updated_at. The extra specs
+    are compared as well since the scheduler adds some to the resource type
+    of a request, e.g. for multiattach.
+    """
+    extra_specs = resource_type.get('extra_specs') or {}
+    type_id = resource_type.get('id')
+    updated_at = resource_type.get('updated_at')
+    if type_id is None:
+        return ExtraSpecsMatcher(extra_specs)
+
+    matcher = _matcher_cache.pop(type_id, None)
+    if (matcher is None or matcher.updated_at != updated_at or
+            matcher.extra_specs != extra_specs):
+        matcher = ExtraSpecsMatcher(extra_specs, updated_at)
+    _matcher_cache[type_id] = matcher
+    if len(_matcher_cache) > _MATCHER_CACHE_SIZE:
+        _matcher_cache.popitem(last=False)
+    return matcher
+
+
+class CapabilitiesFilter(filters.BaseHostFilter):
+    """HostFilter to work with resource (instance & volume) type records."""
+
+    def __init__(self):
+        self._resource_type = None
+        self._matcher = None
+
+    def _get_matcher(self, resource_type):
+        # Filters are instantiated for every request, look the matcher up
+        # once rather than for every host.
+        if resource_type is not self._resource_type:
+            self._matcher = get_matcher(resource_type)
+            self._resource_type = resource_type
+        return self._matcher
+
+    def _satisfies_extra_specs(self, capabilities, resource_type):
+        """Check if capabilities satisfy resource type requirements.
+
+        Check that the capabilities provided by the services satisfy
+        the extra specs associated with the resource type.
+        """
+        if not resource_type.get('extra_specs'):
+            return True
+        return self._get_matcher(resource_type).matches(capabilities)
+
     def host_passes(self, host_state, filter_properties):
         """Return a list of hosts that can create resource_type."""
         # Note(zhiteng) Currently only Cinder and Nova are using
@@ -18,6 +18,7 @@ Manage hosts in the current zone.
 """
 
 import collections
+import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -46,7 +47,15 @@ host_manager_opts = [
                 default=[
                     'CapacityWeigher'
                 ],
-                help='Which weigher class names to use for weighing hosts.')
+                help='Which weigher class names to use for weighing hosts.'),
+    cfg.IntOpt('scheduler_service_refresh_interval',
+               default=10, min=0,
+               help='Number of seconds the scheduler keeps using the list '
+                    'of volume services it read from the database before '
+                    'reading it again. Service liveness is still checked '
+                    'on every request against the last heartbeat read, so '
+                    'keep this well below service_down_time. 0 reads the '
+                    'list on every request.'),
 ]
 
 CONF = cfg.CONF
@@ -347,6 +356,13 @@ class HostManager(object):
         self.weight_classes = self.weight_handler.get_all_classes()
 
         self._no_capabilities_hosts = set()  # Hosts having no capabilities
+        # Volume services read from the DB, and when to read them again.
+        self._volume_services = []
+        self._volume_services_expire = 0
+        # Capabilities last applied to each host state.
+        self._applied_capabilities = {}
+        # Pools of all active hosts, rebuilt only when a host changes.
+        self._pool_snapshot = None
         self._update_host_state_map(cinder_context.get_admin_context())
 
     def _choose_host_filters(self, filter_cls_names):
@@ -439,20 +455,42 @@ class HostManager(object):
                    'cap': capabilities})
 
         self._no_capabilities_hosts.discard(host)
+        if not any(service.host == host
+                   for service in self._volume_services):
+            # A service we have not seen yet, read the services again on
+            # the next request so it can be scheduled to right away.
+            self._volume_services_expire = 0
 
     def has_all_capabilities(self):
         return len(self._no_capabilities_hosts) == 0
 
-    def _update_host_state_map(self, context):
-
-        # Get resource usage across the available volume nodes:
+    def _refresh_volume_services(self, context):
         topic = CONF.volume_topic
         volume_services = objects.ServiceList.get_all_by_topic(context,
                                                                topic,
                                                                disabled=False)
+        self._volume_services = volume_services.objects
+        self._volume_services_expire = (
+            time.time() + CONF.scheduler_service_refresh_interval)
+        # Host states hold a copy of their service, have them updated.
+        self._applied_capabilities = {}
+
+    def _update_host_state_map(self, context):
+        """Bring host states up to date with services and capabilities.
+
+        The volume services are only read from the DB once they have been
+        cached for scheduler_service_refresh_interval seconds, or while no
+        host can be scheduled to. Host states are only updated when their
+        service or capabilities changed, and the pool snapshot is only
+        rebuilt when a host state was.
+        """
+        if (not self.host_state_map or
+                time.time() >= self._volume_services_expire):
+            self._refresh_volume_services(context)
+
         active_hosts = set()
         no_capabilities_hosts = set()
-        for service in volume_services.objects:
+        for service in self._volume_services:
             host = service.host
             if not utils.service_is_up(service):
                 LOG.warning(_LW("volume service is down. (host: %s)"), host)
@@ -462,6 +500,9 @@ class HostManager(object):
                 no_capabilities_hosts.add(host)
                 continue
 
+            active_hosts.add(host)
+            if self._applied_capabilities.get(host) is capabilities:
+                continue
             host_state = self.host_state_map.get(host)
             if not host_state:
                 host_state = self.host_state_cls(host,
@@ -473,7 +514,8 @@ class HostManager(object):
             host_state.update_from_volume_capability(capabilities,
                                                      service=
                                                      dict(service))
-            active_hosts.add(host)
+            self._applied_capabilities[host] = capabilities
+            self._pool_snapshot = None
 
         self._no_capabilities_hosts = no_capabilities_hosts
 
@@ -483,6 +525,22 @@ class HostManager(object):
             LOG.info(_LI("Removing non-active host: %(host)s from "
                          "scheduler cache."), {'host': host})
             del self.host_state_map[host]
+            self._applied_capabilities.pop(host, None)
+            self._pool_snapshot = None
+
+    def _get_pool_snapshot(self, context):
+        """Return the (host, pool state) pairs of all active hosts.
+
+        The pool states are the live ones, so that the resources consumed
+        by a scheduling decision are seen by the next request.
+        """
+        self._update_host_state_map(context)
+        if self._pool_snapshot is None:
+            self._pool_snapshot = tuple(
+                (host, pool)
+                for host, state in self.host_state_map.items()
+                for pool in state.pools.values())
+        return self._pool_snapshot
 
     def get_all_host_states(self, context):
         """Returns a dict of all the hosts the HostManager knows about.
@@ -493,33 +551,17 @@ class HostManager(object):
         For example:
           {'192.168.1.100': HostState(), ...}
         """
-
-        self._update_host_state_map(context)
-
-        # build a pool_state map and return that map instead of host_state_map
-        all_pools = {}
-        for host, state in self.host_state_map.items():
-            for key in state.pools:
-                pool = state.pools[key]
-                # use host.pool_name to make sure key is unique
-                pool_key = '.'.join([host, pool.pool_name])
-                all_pools[pool_key] = pool
-
-        return all_pools.values()
+        # Return the pool states instead of host_state_map
+        return [pool for _host, pool in self._get_pool_snapshot(context)]
 
     def get_pools(self, context):
         """Returns a dict of all pools on all hosts HostManager knows about."""
-
-        self._update_host_state_map(context)
-
         all_pools = []
-        for host, state in self.host_state_map.items():
-            for key in state.pools:
-                pool = state.pools[key]
-                # use host.pool_name to make sure key is unique
-                pool_key = vol_utils.append_host(host, pool.pool_name)
-                new_pool = dict(name=pool_key)
-                new_pool.update(dict(capabilities=pool.capabilities))
-                all_pools.append(new_pool)
+        for host, pool in self._get_pool_snapshot(context):
+            # use host.pool_name to make sure key is unique
+            pool_key = vol_utils.append_host(host, pool.pool_name)
+            new_pool = dict(name=pool_key)
+            new_pool.update(dict(capabilities=pool.capabilities))
+            all_pools.append(new_pool)
 
         return all_pools
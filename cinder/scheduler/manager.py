@@ -23,6 +23,7 @@ import eventlet
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_service import periodic_task
 from oslo_utils import excutils
 from oslo_utils import importutils
 import six
@@ -31,7 +32,7 @@ from cinder import context
 from cinder import db
 from cinder import exception
 from cinder import flow_utils
-from cinder.i18n import _, _LE
+from cinder.i18n import _, _LE, _LI
 from cinder import manager
 from cinder import objects
 from cinder import quota
@@ -49,6 +50,7 @@ CONF = cfg.CONF
 CONF.register_opt(scheduler_driver_opt)
 
 QUOTAS = quota.QUOTAS
+CGQUOTAS = quota.CGQUOTAS
 
 LOG = logging.getLogger(__name__)
 
@@ -56,7 +58,7 @@ LOG = logging.getLogger(__name__)
 class SchedulerManager(manager.Manager):
     """Chooses a host to create volumes."""
 
-    RPC_API_VERSION = '1.11'
+    RPC_API_VERSION = '1.12'
 
     target = messaging.Target(version=RPC_API_VERSION)
 
@@ -70,11 +72,25 @@ class SchedulerManager(manager.Manager):
 
     def init_host_with_rpc(self):
         ctxt = context.get_admin_context()
+        if CONF.quota_usage_refresh_async:
+
+            @periodic_task.periodic_task(
+                spacing=CONF.quota_usage_refresh_interval)
+            def refresh_quota_usages(self, ctxt):
+                self._refresh_quota_usages(ctxt)
+
+            self.add_periodic_task(refresh_quota_usages)
         self.request_service_capabilities(ctxt)
 
         eventlet.sleep(CONF.periodic_interval)
         self._startup_delay = False
 
+    def _refresh_quota_usages(self, context):
+        refreshed = (QUOTAS.refresh_usages(context) +
+                     CGQUOTAS.refresh_usages(context))
+        if refreshed:
+            LOG.info(_LI("Refreshed %d quota usages."), refreshed)
+
     def update_service_capabilities(self, context, service_name=None,
                                     host=None, capabilities=None, **kwargs):
         """Process a capability update from a service node."""
@@ -143,6 +159,28 @@ class SchedulerManager(manager.Manager):
         with flow_utils.DynamicLogListener(flow_engine, logger=LOG):
             flow_engine.run()
 
+    def create_volumes(self, context, topic, request_spec_list,
+                       filter_properties_list):
+        """Schedule a batch of volumes created by a single request."""
+        self._wait_for_scheduler()
+
+        request_spec_list = [dict(request_spec)
+                             for request_spec in request_spec_list]
+        filter_properties_list = [dict(filter_properties or {})
+                                  for filter_properties in
+                                  filter_properties_list]
+        try:
+            placements = self.driver.schedule_create_volumes(
+                context, request_spec_list, filter_properties_list)
+        except Exception as e:
+            placements = [e] * len(request_spec_list)
+
+        for request_spec, placement in zip(request_spec_list, placements):
+            if isinstance(placement, Exception):
+                self._set_volume_state_and_notify(
+                    'create_volume', {'volume_state': {'status': 'error'}},
+                    context, placement, request_spec)
+
     def request_service_capabilities(self, context):
         volume_rpcapi.VolumeAPI().publish_service_capabilities(context)
 
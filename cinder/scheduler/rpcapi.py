@@ -44,9 +44,10 @@ class SchedulerAPI(rpc.RPCAPI):
         1.10 - Adds support for sending objects over RPC in retype()
         1.11 - Adds support for sending objects over RPC in
                migrate_volume_to_host()
+        1.12 - Add create_volumes method
     """
 
-    RPC_API_VERSION = '1.11'
+    RPC_API_VERSION = '1.12'
     TOPIC = CONF.scheduler_topic
     BINARY = 'cinder-scheduler'
 
@@ -84,6 +85,27 @@ class SchedulerAPI(rpc.RPCAPI):
         cctxt = self.client.prepare(version=version)
         return cctxt.cast(ctxt, 'create_volume', **msg_args)
 
+    def create_volumes(self, ctxt, topic, volumes, request_spec_list,
+                       filter_properties_list):
+        if not self.client.can_send_version('1.12'):
+            for volume, request_spec, filter_properties in zip(
+                    volumes, request_spec_list, filter_properties_list):
+                self.create_volume(ctxt, topic, volume.id,
+                                   snapshot_id=request_spec['snapshot_id'],
+                                   image_id=request_spec['image_id'],
+                                   request_spec=request_spec,
+                                   filter_properties=filter_properties,
+                                   volume=volume)
+            return
+
+        request_spec_p_list = [jsonutils.to_primitive(request_spec)
+                               for request_spec in request_spec_list]
+        cctxt = self.client.prepare(version='1.12')
+        return cctxt.cast(ctxt, 'create_volumes',
+                          topic=topic,
+                          request_spec_list=request_spec_p_list,
+                          filter_properties_list=filter_properties_list)
+
     def migrate_volume_to_host(self, ctxt, topic, volume_id, host,
                                force_host_copy=False, request_spec=None,
                                filter_properties=None, volume=None):
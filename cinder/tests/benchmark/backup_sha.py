@@ -0,0 +1,84 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Micro-benchmark of the block hashing done by chunked backup drivers.
+
+Reports the hashing throughput of a chunk for several hash block sizes,
+both for a plain loop hashing copied slices on the calling thread and for
+ChunkedBackupDriver._calculate_shas::
+
+    python -m cinder.tests.benchmark.backup_sha --chunk-size-mb 32
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import time
+
+import eventlet
+import six
+
+from cinder.backup import chunkeddriver
+
+
+class _Hasher(object):
+    def __init__(self, sha_block_size_bytes, sha_workers):
+        self.sha_block_size_bytes = sha_block_size_bytes
+        self.sha_workers = sha_workers
+
+
+_calculate_shas = six.get_unbound_function(
+    chunkeddriver.ChunkedBackupDriver._calculate_shas)
+
+
+def _copying_loop(data, block_size):
+    return [hashlib.sha256(data[offset:offset + block_size]).hexdigest()
+            for offset in range(0, len(data), block_size)]
+
+
+def _throughput(func, data, repeat):
+    start = time.time()
+    for _i in range(repeat):
+        func(data)
+    elapsed = time.time() - start
+    return len(data) * repeat / elapsed / 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--chunk-size-mb', type=int, default=32)
+    parser.add_argument('--block-sizes-kb', type=int, nargs='+',
+                        default=[4, 32, 256, 1024])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    eventlet.monkey_patch()
+    data = os.urandom(args.chunk_size_mb * 1024 * 1024)
+    print('%10s %12s %12s' % ('block KiB', 'method', 'GB/s'))
+    for block_kb in args.block_sizes_kb:
+        block_size = block_kb * 1024
+        gbps = _throughput(lambda d: _copying_loop(d, block_size), data,
+                           args.repeat)
+        print('%10d %12s %12.2f' % (block_kb, 'loop', gbps))
+        for workers in args.workers:
+            hasher = _Hasher(block_size, workers)
+            gbps = _throughput(lambda d: _calculate_shas(hasher, d), data,
+                               args.repeat)
+            print('%10d %12s %12.2f' % (block_kb, 'workers=%d' % workers,
+                                        gbps))
+
+
+if __name__ == '__main__':
+    main()
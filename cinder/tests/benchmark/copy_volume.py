@@ -0,0 +1,118 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of the native volume copy engine against dd.
+
+Copies a scratch volume file, part random data and part zeroes, with dd
+run with the flags copy_volume gives it and with BlockCopier for several
+queue depths, both to a plain and to a sparse destination, and reports the
+throughput of each copy::
+
+    python -m cinder.tests.benchmark.copy_volume --size-mb 1024 \\
+        --dir /var/lib/cinder --queue-depths 1 4 16
+
+The files are created in --dir, which should be on the storage to measure:
+the default temporary directory is often a tmpfs, which does not support
+direct I/O.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from oslo_utils import units
+
+from cinder.volume import block_copy
+
+
+def _make_source(path, size_mb, zero_percent):
+    data = os.urandom(units.Mi)
+    zeroes = b'\0' * units.Mi
+    with open(path, 'wb') as f:
+        for i in range(size_mb):
+            f.write(zeroes if i % 100 < zero_percent else data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _dd(src, dest, size_mb, block_size, sparse):
+    with open(os.devnull, 'w') as devnull:
+        flags = []
+        for flag in ('iflag=direct', 'oflag=direct'):
+            if subprocess.call(['dd', 'count=0', 'if=%s' % src,
+                                'of=%s' % dest, flag], stderr=devnull) == 0:
+                flags.append(flag)
+        if sparse:
+            flags.append('conv=sparse')
+        subprocess.check_call(['dd', 'if=%s' % src, 'of=%s' % dest,
+                               'bs=%d' % block_size,
+                               'count=%d' % (size_mb * units.Mi //
+                                             block_size)] + flags,
+                              stderr=devnull)
+
+
+def _native(src, dest, size_mb, block_size, sparse, queue_depth):
+    block_copy.BlockCopier(src, dest, size_mb * units.Mi,
+                           chunk_size=block_size, queue_depth=queue_depth,
+                           sparse=sparse).copy()
+
+
+def _mbps(func, size_mb, dest, *args):
+    if os.path.exists(dest):
+        os.remove(dest)
+    open(dest, 'wb').close()
+    start = time.time()
+    func(*args)
+    return size_mb / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size-mb', type=int, default=1024)
+    parser.add_argument('--block-size-kb', type=int, default=1024)
+    parser.add_argument('--zero-percent', type=int, default=50)
+    parser.add_argument('--queue-depths', type=int, nargs='+',
+                        default=[1, 4, 16])
+    parser.add_argument('--dir', help='directory of the scratch files')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(dir=args.dir)
+    src = os.path.join(tmp_dir, 'src')
+    dest = os.path.join(tmp_dir, 'dest')
+    block_size = args.block_size_kb * units.Ki
+    try:
+        _make_source(src, args.size_mb, args.zero_percent)
+
+        print('%8s %12s %10s' % ('sparse', 'engine', 'MB/s'))
+        for sparse in (False, True):
+            results = [('dd', _mbps(_dd, args.size_mb, dest, src, dest,
+                                    args.size_mb, block_size, sparse))]
+            for depth in args.queue_depths:
+                results.append(('native-%d' % depth,
+                                _mbps(_native, args.size_mb, dest, src, dest,
+                                      args.size_mb, block_size, sparse,
+                                      depth)))
+            for engine, mbps in results:
+                print('%8s %12s %10.1f' % (sparse, engine, mbps))
+    finally:
+        for path in (src, dest):
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark of the volume listing page latency against the table size.
+
+Fills the volumes table of a scratch database, giving every volume a few
+metadata items, and reports the time taken to fetch a page at the end of
+the listing, the deepest one, when paginating by offset, by the id of the
+last item of the previous page, with the collections of the volumes either
+joined or loaded by secondary queries, and by pagination cursor, reading
+either whole volumes or only the columns of the summary listing::
+
+    python -m cinder.tests.benchmark.db_pagination --volumes 10000 100000
+
+Any database URL can be given with --connection, the database must be
+empty as the schema is created by the benchmark.
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+import uuid
+
+from oslo_config import cfg
+
+from cinder import context
+from cinder.db import migration
+from cinder.db.sqlalchemy import api as sqlalchemy_api
+from cinder.db.sqlalchemy import models
+from cinder import utils
+
+
+CONF = cfg.CONF
+METADATA_PER_VOLUME = 3
+INSERT_CHUNK = 5000
+
+
+def _fill(engine, start, stop):
+    created_at = datetime.datetime(2015, 1, 1)
+    for chunk in range(start, stop, INSERT_CHUNK):
+        volumes = []
+        metadata = []
+        for i in range(chunk, min(chunk + INSERT_CHUNK, stop)):
+            volume_id = str(uuid.uuid4())
+            volumes.append({'id': volume_id,
+                            'deleted': False,
+                            'created_at': (created_at +
+                                           datetime.timedelta(seconds=i)),
+                            'project_id': 'project%d' % (i % 10),
+                            'user_id': 'user',
+                            'status': 'available',
+                            'attach_status': 'detached',
+                            'size': 1,
+                            'display_name': 'volume%d' % i})
+            metadata.extend({'volume_id': volume_id,
+                             'deleted': False,
+                             'key': 'key%d' % j,
+                             'value': 'value%d' % j}
+                            for j in range(METADATA_PER_VOLUME))
+        engine.execute(models.Volume.__table__.insert(), volumes)
+        engine.execute(models.VolumeMetadata.__table__.insert(), metadata)
+
+
+def _last_page_marker(count, limit):
+    session = sqlalchemy_api.get_session()
+    query = session.query(models.Volume).order_by(
+        models.Volume.created_at.desc(), models.Volume.id.desc())
+    return query.offset(max(count - limit - 1, 0)).first()
+
+
+def _page_ms(ctxt, repeat, limit, **kwargs):
+    start = time.time()
+    for _i in range(repeat):
+        volumes = sqlalchemy_api.volume_get_all(ctxt, limit=limit, **kwargs)
+        assert len(volumes) == limit
+    return (time.time() - start) * 1000 / repeat
+
+
+def _joined_page_ms(ctxt, repeat, limit, **kwargs):
+    helpers = sqlalchemy_api.PAGINATION_HELPERS
+    list_helpers = helpers[models.Volume]
+    helpers[models.Volume] = ((sqlalchemy_api._volume_get_query,) +
+                              list_helpers[1:])
+    try:
+        return _page_ms(ctxt, repeat, limit, **kwargs)
+    finally:
+        helpers[models.Volume] = list_helpers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--volumes', type=int, nargs='+',
+                        default=[10000, 100000])
+    parser.add_argument('--limit', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--connection',
+                        help='database URL, a temporary SQLite database '
+                             'is used by default')
+    args = parser.parse_args()
+
+    cfg.CONF([], project='cinder', default_config_files=[])
+    path = None
+    if not args.connection:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        args.connection = 'sqlite:///%s' % path
+    CONF.set_override('connection', args.connection, group='database')
+    try:
+        migration.db_sync()
+        engine = sqlalchemy_api.get_engine()
+        ctxt = context.get_admin_context()
+
+        print('%10s %16s %12s' % ('volumes', 'pagination', 'ms/page'))
+        count = 0
+        for size in sorted(args.volumes):
+            _fill(engine, count, size)
+            count = size
+            marker = _last_page_marker(count, args.limit)
+            cursor = utils.encode_pagination_cursor(
+                {'created_at': marker.created_at, 'id': marker.id})
+            results = (
+                ('offset', _page_ms(ctxt, args.repeat, args.limit,
+                                    marker=None,
+                                    offset=count - args.limit)),
+                ('marker-joined', _joined_page_ms(ctxt, args.repeat,
+                                                  args.limit,
+                                                  marker=marker.id)),
+                ('marker', _page_ms(ctxt, args.repeat, args.limit,
+                                    marker=marker.id)),
+                ('cursor', _page_ms(ctxt, args.repeat, args.limit,
+                                    marker=cursor)),
+                ('cursor-summary', _page_ms(ctxt, args.repeat, args.limit,
+                                            marker=cursor,
+                                            columns=['id', 'display_name'])))
+            for mode, elapsed in results:
+                print('%10d %16s %12.2f' % (count, mode, elapsed))
+    finally:
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Micro-benchmark of the scheduler filters over many pools.
+
+Reports the time taken to filter a volume create request with the default
+filters, with the extra specs of the volume type parsed for every pool,
+parsed once per request and cached across requests::
+
+    python -m cinder.tests.benchmark.scheduler_filters --pools 1000
+"""
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from oslo_config import cfg
+from oslo_utils import timeutils
+
+from cinder import context
+from cinder.scheduler.filters import capabilities_filter
+from cinder.scheduler import host_manager
+
+
+def _pools(count):
+    pools = []
+    for i in range(count):
+        capability = {'total_capacity_gb': 10240,
+                      'free_capacity_gb': 1024 + i,
+                      'reserved_percentage': 5,
+                      'thin_provisioning_support': bool(i % 2),
+                      'thick_provisioning_support': not i % 2,
+                      'max_over_subscription_ratio': 2.0,
+                      'QoS_support': bool(i % 3),
+                      'storage_protocol': ('iSCSI', 'FC')[i % 2],
+                      'vendor_name': 'Open Source',
+                      'tier': {'name': ('gold', 'silver', 'bronze')[i % 3]},
+                      'timestamp': timeutils.utcnow()}
+        pool = host_manager.PoolState('host%d@backend' % (i // 10),
+                                      capability, 'pool%d' % (i % 10))
+        pool.update_from_volume_capability(
+            capability, service={'availability_zone': 'nova',
+                                 'disabled': False})
+        pools.append(pool)
+    return pools
+
+
+def _filter_properties():
+    volume_type = {'id': 'fake_type_id',
+                   'updated_at': None,
+                   'extra_specs': {
+                       'storage_protocol': '<in> iSCSI',
+                       'vendor_name': 's== Open Source',
+                       'capabilities:tier:name': '<or> gold <or> silver',
+                       'QoS_support': '<is> True',
+                       'thin_provisioning_support': '<is> True',
+                       'capabilities:total_capacity_gb': '>= 1024'}}
+    return {'context': context.get_admin_context(),
+            'size': 10,
+            'resource_properties': {'availability_zone': 'nova'},
+            'request_spec': {'volume_properties': {'size': 10}},
+            'volume_type': volume_type,
+            'resource_type': volume_type}
+
+
+def _parse_per_pool(filt, resource_type):
+    return capabilities_filter.ExtraSpecsMatcher(
+        resource_type['extra_specs'])
+
+
+def _per_request_ms(manager, pools, repeat, mode):
+    filter_cls = capabilities_filter.CapabilitiesFilter
+    get_matcher = filter_cls.__dict__['_get_matcher']
+    if mode == 'per-pool':
+        filter_cls._get_matcher = _parse_per_pool
+    try:
+        start = time.time()
+        for _i in range(repeat):
+            if mode != 'cached':
+                capabilities_filter._matcher_cache.clear()
+            manager.get_filtered_hosts(pools, _filter_properties())
+        return (time.time() - start) * 1000 / repeat
+    finally:
+        filter_cls._get_matcher = get_matcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--pools', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    cfg.CONF([], project='cinder', default_config_files=[])
+    manager = host_manager.HostManager()
+    print('%10s %12s %12s' % ('pools', 'parsing', 'ms/request'))
+    for count in args.pools:
+        pools = _pools(count)
+        passed = len(manager.get_filtered_hosts(pools, _filter_properties()))
+        for mode in ('per-pool', 'per-request', 'cached'):
+            elapsed = _per_request_ms(manager, pools, args.repeat, mode)
+            print('%10d %12s %12.2f' % (count, mode, elapsed))
+        print('%10d pools passed the filters' % passed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import webob
+
+from cinder.api.contrib import image_volume_cache
+from cinder import context
+from cinder import exception
+from cinder import test
+from cinder.tests.unit.api import fakes
+
+
+@mock.patch('cinder.volume.api.API.warm_image_cache')
+class ImageVolumeCacheAPITest(test.TestCase):
+    def setUp(self):
+        super(ImageVolumeCacheAPITest, self).setUp()
+        self.controller = image_volume_cache.ImageVolumeCacheController()
+        self.ctxt = context.RequestContext('admin', 'fake', True)
+        self.body = {'warm': {'host': 'host@backend#pool',
+                              'image_ids': ['image1', 'image2']}}
+
+    def _warm(self, body, ctxt=None):
+        req = fakes.HTTPRequest.blank('/v2/fake/os-image-volume-cache/warm')
+        req.method = 'POST'
+        req.environ['cinder.context'] = ctxt or self.ctxt
+        return self.controller.warm(req, body)
+
+    def test_warm(self, warm_image_cache):
+        res = self._warm(self.body)
+
+        self.assertEqual(202, res.status_int)
+        warm_image_cache.assert_called_once_with(
+            self.ctxt, 'host@backend#pool', ['image1', 'image2'])
+
+    def test_warm_not_admin(self, warm_image_cache):
+        ctxt = context.RequestContext('fake', 'fake')
+        self.assertRaises(exception.PolicyNotAuthorized,
+                          self._warm, self.body, ctxt)
+        self.assertFalse(warm_image_cache.called)
+
+    def test_warm_invalid_body(self, warm_image_cache):
+        for body in ({},
+                     {'warm': {'image_ids': ['image1']}},
+                     {'warm': {'host': 'host', 'image_ids': []}},
+                     {'warm': {'host': 'host', 'image_ids': 'image1'}},
+                     {'warm': {'host': 'host', 'image_ids': [{}]}}):
+            self.assertRaises(webob.exc.HTTPBadRequest, self._warm, body)
+        self.assertFalse(warm_image_cache.called)
+
+    def test_warm_invalid_host(self, warm_image_cache):
+        warm_image_cache.side_effect = exception.InvalidHost(reason='fake')
+        self.assertRaises(webob.exc.HTTPBadRequest, self._warm, self.body)
+
+    def test_warm_image_not_found(self, warm_image_cache):
+        warm_image_cache.side_effect = exception.ImageNotFound(
+            image_id='image2')
+        self.assertRaises(webob.exc.HTTPNotFound, self._warm, self.body)
@@ -17,7 +17,10 @@
 Test suites for 'common' code used throughout the OpenStack HTTP API.
 """
 
+import datetime
+
 import mock
+from six.moves import urllib
 from testtools import matchers
 import webob
 import webob.exc
@@ -26,6 +29,7 @@ from oslo_config import cfg
 
 from cinder.api import common
 from cinder import test
+from cinder import utils
 
 
 NS = "{http://docs.openstack.org/compute/api/v1.1}"
@@ -534,6 +538,38 @@ class TestCollectionLinks(test.TestCase):
                                  should_link_exist)
 
 
+class PaginationCursorLinkTest(test.TestCase):
+    def setUp(self):
+        super(PaginationCursorLinkTest, self).setUp()
+        self.req = webob.Request.blank('/?limit=1&sort=name:asc')
+        self.req.environ['cinder.context'] = mock.Mock(project_id='fake')
+        self.items = [{'id': 'fake_id', 'display_name': 'vol',
+                       'created_at': datetime.datetime(2015, 10, 1)}]
+        self.builder = common.ViewBuilder()
+        self.builder._pagination_cursor = True
+        self.builder._sort_key_attributes = {'name': 'display_name'}
+
+    def _get_marker(self):
+        links = self.builder._generate_next_link(self.items, 'uuid', self.req,
+                                                 'volumes')
+        query = urllib.parse.urlparse(links[0]['href']).query
+        return urllib.parse.parse_qs(query)['marker'][0]
+
+    def test_next_link_marker_id(self):
+        self.assertEqual('fake_id', self._get_marker())
+
+    def test_next_link_marker_cursor(self):
+        self.flags(osapi_pagination_cursor=True)
+        self.assertEqual({'display_name': 'vol', 'id': 'fake_id',
+                          'created_at': datetime.datetime(2015, 10, 1)},
+                         utils.decode_pagination_cursor(self._get_marker()))
+
+    def test_next_link_marker_cursor_missing_key(self):
+        self.flags(osapi_pagination_cursor=True)
+        del self.items[0]['display_name']
+        self.assertEqual('fake_id', self._get_marker())
+
+
 class LinkPrefixTest(test.TestCase):
     def test_update_link_prefix(self):
         vb = common.ViewBuilder()
@@ -165,7 +165,7 @@ def stub_volume_api_get(self, context, volume_id, viewable_admin_meta=False):
 
 def stub_volume_get_all(context, search_opts=None, marker=None, limit=None,
                         sort_keys=None, sort_dirs=None, filters=None,
-                        viewable_admin_meta=False, offset=None):
+                        viewable_admin_meta=False, offset=None, columns=None):
     return [stub_volume(100, project_id='fake'),
             stub_volume(101, project_id='superfake'),
             stub_volume(102, project_id='superduperfake')]
@@ -174,7 +174,8 @@ def stub_volume_get_all(context, search_opts=None, marker=None, limit=None,
 def stub_volume_get_all_by_project(self, context, marker, limit,
                                    sort_keys=None, sort_dirs=None,
                                    filters=None,
-                                   viewable_admin_meta=False, offset=None):
+                                   viewable_admin_meta=False, offset=None,
+                                   columns=None):
     filters = filters or {}
     return [stub_volume_get(self, context, '1', viewable_admin_meta=True)]
 
@@ -183,10 +184,12 @@ def stub_volume_api_get_all_by_project(self, context, marker, limit,
                                        sort_keys=None, sort_dirs=None,
                                        filters=None,
                                        viewable_admin_meta=False,
-                                       offset=None):
+                                       offset=None, columns=None):
     filters = filters or {}
     vol = stub_volume_get(self, context, '1',
                           viewable_admin_meta=viewable_admin_meta)
+    if columns:
+        return [{column: vol[column] for column in columns}]
     vol_obj = fake_volume.fake_volume_obj(context, **vol)
     return objects.VolumeList(objects=[vol_obj])
 
@@ -17,9 +17,12 @@
 Tests dealing with HTTP rate-limiting.
 """
 
+import os
 from xml.dom import minidom
 
+import fixtures
 from lxml import etree
+import mock
 from oslo_serialization import jsonutils
 import six
 from six.moves import http_client
@@ -564,6 +567,115 @@ class LimiterTest(BaseLimitTestSuite):
         self.assertEqual(expected, results)
 
 
+class SharedLimiterTest(BaseLimitTestSuite):
+
+    """Tests for the `limits.SharedLimiter` class."""
+
+    def setUp(self):
+        super(SharedLimiterTest, self).setUp()
+        self.store = limits.MemoryLimiterStore()
+        self.limiters = [limits.SharedLimiter(TEST_LIMITS, store=self.store)
+                         for x in range(2)]
+
+    def _check(self, limiter, num, verb, url, username=None):
+        return [limiter.check_for_delay(verb, url, username)[0]
+                for x in range(num)]
+
+    def test_store_class(self):
+        limiter = limits.SharedLimiter(
+            TEST_LIMITS, store='cinder.api.v2.limits.MemoryLimiterStore',
+            **{'limits.user0': '(get, *, .*, 4, minute)'})
+        self.assertIsInstance(limiter.store, limits.MemoryLimiterStore)
+        self.assertEqual(4, limiter.levels['user0'][0].value)
+
+    def test_limits_shared(self):
+        """Ensure the 11th PUT is delayed whatever the limiter it hits."""
+        results = []
+        for x in range(5):
+            for limiter in self.limiters:
+                results.extend(self._check(limiter, 1, "PUT", "/anything"))
+        self.assertEqual([None] * 10, results)
+
+        for limiter in self.limiters:
+            self.assertEqual([6.0],
+                             self._check(limiter, 1, "PUT", "/anything"))
+
+    def test_limits_per_user(self):
+        self.assertEqual([None] * 10, self._check(self.limiters[0], 10, "PUT",
+                                                  "/anything", "user0"))
+        self.assertEqual([None] * 10, self._check(self.limiters[1], 10, "PUT",
+                                                  "/anything", "user1"))
+
+    def test_lease(self):
+        limiter = limits.SharedLimiter(TEST_LIMITS, store=self.store,
+                                       lease_fraction=0.5)
+        with mock.patch.object(self.store, 'reserve',
+                               wraps=self.store.reserve) as reserve:
+            self.assertEqual([None] * 5,
+                             self._check(limiter, 5, "PUT", "/anything"))
+            self.assertEqual(1, reserve.call_count)
+
+            # The lease is renewed once used up
+            self.assertEqual([None], self._check(limiter, 1, "PUT", "/"))
+            self.assertEqual(2, reserve.call_count)
+
+            # And after the sync interval, giving back the unused requests
+            self.time += 1.0
+            self.assertEqual([None], self._check(limiter, 1, "PUT", "/"))
+            reserve.assert_called_with(mock.ANY, 60, 6.0, 5, 4, 1.0)
+
+    def test_delayed_request_not_synced(self):
+        limiter = self.limiters[0]
+        self.assertEqual([None], self._check(limiter, 1, "GET", "/delayed"))
+        with mock.patch.object(self.store, 'reserve',
+                               wraps=self.store.reserve) as reserve:
+            self.assertEqual([60.0], self._check(limiter, 1, "GET",
+                                                 "/delayed"))
+            self.time += 0.5
+            self.assertEqual([59.5], self._check(limiter, 1, "GET",
+                                                 "/delayed"))
+            self.assertEqual(1, reserve.call_count)
+
+            self.time += 59.5
+            self.assertEqual([None], self._check(limiter, 1, "GET",
+                                                 "/delayed"))
+            self.assertEqual(2, reserve.call_count)
+
+    def test_memory_store(self):
+        self.assertEqual((10, None, 0),
+                         self.store.reserve('key', 60, 6.0, 20, 0, 0.0))
+        self.assertEqual((0, 6.0, 0),
+                         self.store.reserve('key', 60, 6.0, 1, 0, 0.0))
+        self.assertEqual((1, None, 3),
+                         self.store.reserve('key', 60, 6.0, 1, 4, 0.0))
+        self.assertEqual((2, None, 3),
+                         self.store.reserve('key', 60, 6.0, 2, 0, 12.0))
+
+    def test_file_store(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'buckets.json')
+        stores = [limits.FileLimiterStore(path) for x in range(2)]
+        self.assertEqual((10, None, 0),
+                         stores[0].reserve('key', 60, 6.0, 10, 0, 0.0))
+        self.assertEqual((0, 6.0, 0),
+                         stores[1].reserve('key', 60, 6.0, 1, 0, 0.0))
+        self.assertEqual((1, None, 0),
+                         stores[1].reserve('key', 60, 6.0, 1, 0, 6.0))
+
+    @mock.patch('cinder.db.rate_limit_bucket_reserve',
+                return_value=(1, None, 0))
+    @mock.patch('cinder.db.rate_limit_bucket_purge')
+    def test_db_store_purge(self, purge, reserve):
+        store = limits.DbLimiterStore()
+        for now in (10.0, 20.0, 3610.0):
+            self.assertEqual((1, None, 0),
+                             store.reserve('key', 60, 6.0, 1, 0, now))
+        self.assertEqual([mock.call(store.context, 10.0),
+                          mock.call(store.context, 3610.0)],
+                         purge.call_args_list)
+        self.assertEqual(3, reserve.call_count)
+
+
 class WsgiLimiterTest(BaseLimitTestSuite):
 
     """Tests for `limits.WsgiLimiter` class."""
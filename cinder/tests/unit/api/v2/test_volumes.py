@@ -822,7 +822,7 @@ class VolumeApiTest(test.TestCase):
                                            sort_keys=None, sort_dirs=None,
                                            filters=None,
                                            viewable_admin_meta=False,
-                                           offset=0):
+                                           offset=0, columns=None):
             return [
                 stubs.stub_volume(1, display_name='vol1'),
                 stubs.stub_volume(2, display_name='vol2'),
@@ -1096,7 +1096,7 @@ class VolumeApiTest(test.TestCase):
                                            sort_keys=None, sort_dirs=None,
                                            filters=None,
                                            viewable_admin_meta=False,
-                                           offset=0):
+                                           offset=0, columns=None):
             self.assertTrue(filters['no_migration_targets'])
             self.assertFalse('all_tenants' in filters)
             return [stubs.stub_volume(1, display_name='vol1')]
@@ -1104,7 +1104,8 @@ class VolumeApiTest(test.TestCase):
         def stub_volume_get_all(context, marker, limit,
                                 sort_keys=None, sort_dirs=None,
                                 filters=None,
-                                viewable_admin_meta=False, offset=0):
+                                viewable_admin_meta=False, offset=0,
+                                columns=None):
             return []
         self.stubs.Set(db, 'volume_get_all_by_project',
                        stub_volume_get_all_by_project)
@@ -1123,14 +1124,15 @@ class VolumeApiTest(test.TestCase):
                                             sort_keys=None, sort_dirs=None,
                                             filters=None,
                                             viewable_admin_meta=False,
-                                            offset=0):
+                                            offset=0, columns=None):
             self.assertFalse('no_migration_targets' in filters)
             return [stubs.stub_volume(1, display_name='vol2')]
 
         def stub_volume_get_all2(context, marker, limit,
                                  sort_keys=None, sort_dirs=None,
                                  filters=None,
-                                 viewable_admin_meta=False, offset=0):
+                                 viewable_admin_meta=False, offset=0,
+                                 columns=None):
             return []
         self.stubs.Set(db, 'volume_get_all_by_project',
                        stub_volume_get_all_by_project2)
@@ -1147,13 +1149,14 @@ class VolumeApiTest(test.TestCase):
                                             sort_keys=None, sort_dirs=None,
                                             filters=None,
                                             viewable_admin_meta=False,
-                                            offset=0):
+                                            offset=0, columns=None):
             return []
 
         def stub_volume_get_all3(context, marker, limit,
                                  sort_keys=None, sort_dirs=None,
                                  filters=None,
-                                 viewable_admin_meta=False, offset=0):
+                                 viewable_admin_meta=False, offset=0,
+                                 columns=None):
             self.assertFalse('no_migration_targets' in filters)
             self.assertFalse('all_tenants' in filters)
             return [stubs.stub_volume(1, display_name='vol3')]
@@ -1516,6 +1519,21 @@ class VolumeApiTest(test.TestCase):
             sort_dirs=['desc'], viewable_admin_meta=True,
             sort_keys=['display_name'], filters={}, offset=0)
 
+    @mock.patch('cinder.volume.api.API.get_all')
+    def test_get_volumes_summary_columns(self, get_all):
+        req = mock.MagicMock()
+        ctxt = context.RequestContext('fake', 'fake', auth_token=True)
+        req.environ = {'cinder.context': ctxt}
+        req.params = {'status': 'available'}
+        self.controller._view_builder.summary_list = mock.Mock()
+        self.controller._get_volumes(req, False)
+        get_all.assert_called_once_with(
+            ctxt, None, CONF.osapi_max_limit,
+            sort_keys=['created_at'], sort_dirs=['desc'],
+            filters={'status': 'available'}, offset=0,
+            columns=['id', 'display_name'])
+        req.cache_db_volumes.assert_called_once_with(get_all.return_value)
+
     def test_get_volume_filter_options_using_config(self):
         filter_list = ['name', 'status', 'metadata', 'bootable',
                        'availability_zone']
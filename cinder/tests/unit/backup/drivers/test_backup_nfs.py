@@ -21,6 +21,7 @@ import filecmp
 import hashlib
 import os
 import shutil
+import sys
 import tempfile
 import zlib
 
@@ -387,6 +388,92 @@ class BackupNFSSwiftBasedTestCase(test.TestCase):
         self.assertNotEqual(content1['sha256s'][16], content2['sha256s'][16])
         self.assertNotEqual(content1['sha256s'][20], content2['sha256s'][20])
 
+    def test_backup_delta_changed_extents(self):
+        volume_id = 'b7f2b9e4-4d0a-4c5b-a7a2-0000005e9c11'
+
+        def _fake_generate_object_name_prefix(self, backup):
+            az = 'az_fake'
+            backup_name = '%s_backup_%s' % (az, backup['id'])
+            volume = 'volume_%s' % (backup['volume_id'])
+            prefix = volume + '_' + backup_name
+            return prefix
+
+        self.stubs.Set(nfs.NFSBackupDriver,
+                       '_generate_object_name_prefix',
+                       _fake_generate_object_name_prefix)
+
+        self.flags(backup_file_size=(8 * 1024))
+        self.flags(backup_sha_block_size_bytes=1024)
+
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        self._create_backup_db_entry(volume_id=volume_id,
+                                     container=container_name,
+                                     backup_id=123)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        self.volume_file.seek(16 * 1024 + 100)
+        self.volume_file.write(os.urandom(10))
+        self.volume_file.seek(20 * 1024)
+        self.volume_file.write(os.urandom(1024))
+        self.volume_file.flush()
+
+        self._create_backup_db_entry(volume_id=volume_id,
+                                     container=container_name,
+                                     backup_id=124,
+                                     parent_id=123)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        deltabackup = objects.Backup.get_by_id(self.ctxt, 124)
+        with mock.patch.object(self.volume_file, 'read',
+                               wraps=self.volume_file.read) as mock_read:
+            service.backup(deltabackup, self.volume_file,
+                           changed_extents=[(16 * 1024 + 100, 10),
+                                            (20 * 1024, 1024)])
+        self.assertEqual([mock.call(1024), mock.call(1024)],
+                         mock_read.call_args_list)
+
+        deltabackup = objects.Backup.get_by_id(self.ctxt, 124)
+        content1 = service._read_sha256file(backup)
+        content2 = service._read_sha256file(deltabackup)
+        self.assertEqual(len(content1['sha256s']), len(content2['sha256s']))
+        for index, sha in enumerate(content2['sha256s']):
+            if index in (16, 20):
+                self.assertNotEqual(content1['sha256s'][index], sha)
+            else:
+                self.assertEqual(content1['sha256s'][index], sha)
+
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(deltabackup, volume_id, restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+    def test_calculate_shas(self):
+        self.flags(backup_sha_block_size_bytes=1024)
+        data = os.urandom(10 * 1024 + 100)
+        expected = [hashlib.sha256(data[offset:offset + 1024]).hexdigest()
+                    for offset in range(0, len(data), 1024)]
+        for workers in (1, 3, 4, 20):
+            self.flags(backup_sha_workers=workers)
+            service = nfs.NFSBackupDriver(self.ctxt)
+            self.assertEqual(expected, service._calculate_shas(data))
+
+    def test_changed_regions(self):
+        self.flags(backup_file_size=(8 * 1024))
+        self.flags(backup_sha_block_size_bytes=1024)
+        service = nfs.NFSBackupDriver(self.ctxt)
+
+        regions = service._changed_regions(
+            [(7 * 1024, 2048), (100, 10), (1000, 100), (30 * 1024, 8192)],
+            32 * 1024)
+
+        self.assertEqual([(0, 2048), (7 * 1024, 1024), (8 * 1024, 1024),
+                          (30 * 1024, 2048)],
+                         list(regions))
+
     def test_backup_delta_two_blocks_in_object_change(self):
         volume_id = '5f3f810a-2ff3-4905-aaa3-0000005814ab'
 
@@ -500,6 +587,253 @@ class BackupNFSSwiftBasedTestCase(test.TestCase):
                           service.backup,
                           backup, self.volume_file)
 
+    def test_backup_concurrent_uploads_keep_object_order(self):
+        volume_id = '5d5e3bd8-6e4f-4cd9-9f16-000000a1b3c2'
+
+        self._create_backup_db_entry(volume_id=volume_id)
+        self.flags(backup_compression_algorithm='zlib')
+        self.flags(backup_file_size=1024)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_upload_workers=4)
+        self.flags(backup_pipeline_queue_depth=8)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        backup = objects.Backup.get_by_id(self.ctxt, 123)
+        metadata = service._read_metadata(backup)
+        offsets = [list(obj.values())[0]['offset']
+                   for obj in metadata['objects']]
+        self.assertEqual(list(range(0, 32 * 1024, 1024)), offsets)
+        self.assertEqual(33, backup.object_count)
+
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, volume_id, restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+    def test_backup_concurrent_upload_fail(self):
+        volume_id = '9b0c7ba4-cb44-4b0e-8d5e-000000f2a7d1'
+
+        self._create_backup_db_entry(volume_id=volume_id)
+        self.flags(backup_file_size=1024)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_upload_workers=4)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, 123)
+        self.mock_object(service, 'get_object_writer',
+                         mock.Mock(side_effect=exception.BackupOperationError))
+        self.mock_object(service, '_write_metadata')
+
+        self.assertRaises(exception.BackupOperationError,
+                          service.backup,
+                          backup, self.volume_file)
+        self.assertFalse(service._write_metadata.called)
+
+    def test_backup_deduplication(self):
+        volume_id = 'c2b7e0f4-1a6d-4f43-9d0e-0000003d5e21'
+
+        def _fake_generate_object_name_prefix(self, backup):
+            return 'volume_%s_backup_%s' % (backup['volume_id'],
+                                            backup['id'])
+
+        self.stubs.Set(nfs.NFSBackupDriver,
+                       '_generate_object_name_prefix',
+                       _fake_generate_object_name_prefix)
+        self.flags(backup_deduplication=True)
+        self.flags(backup_file_size=1024)
+        self.flags(backup_sha_block_size_bytes=1024)
+
+        # The second half of the volume repeats the first one.
+        self.volume_file.seek(0)
+        data = self.volume_file.read(16 * 1024)
+        self.volume_file.write(data)
+        self.volume_file.flush()
+
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        container_path = os.path.join(self.temp_dir, container_name)
+
+        def _chunk_objects():
+            return sorted(name for name in os.listdir(container_path)
+                          if name.startswith('dedup-') and
+                          '.ref.' not in name)
+
+        service = nfs.NFSBackupDriver(self.ctxt)
+        get_object_writer = service.get_object_writer
+        self.mock_object(service, 'get_object_writer',
+                         mock.Mock(side_effect=get_object_writer))
+        self.mock_object(service, 'get_container_entries',
+                         mock.Mock(side_effect=service.get_container_entries))
+        for backup_id in (123, 124):
+            self._create_backup_db_entry(volume_id=volume_id,
+                                         container=container_name,
+                                         backup_id=backup_id)
+            self.volume_file.seek(0)
+            backup = objects.Backup.get_by_id(self.ctxt, backup_id)
+            service.backup(backup, self.volume_file)
+        chunks = _chunk_objects()
+        self.assertEqual(16, len(chunks))
+        # Every chunk is written once, by the first backup, and chunks are
+        # looked up without listing the container.
+        written = [args[1] for args, _kwargs in
+                   service.get_object_writer.call_args_list
+                   if args[1] in chunks]
+        self.assertEqual(chunks, sorted(written))
+        self.assertFalse(service.get_container_entries.called)
+
+        backup = objects.Backup.get_by_id(self.ctxt, 123)
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, volume_id, restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+        # Chunks are kept as long as a backup references them.
+        service.delete(backup)
+        self.assertEqual(chunks, _chunk_objects())
+
+        backup = objects.Backup.get_by_id(self.ctxt, 124)
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, volume_id, restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+        # The chunks of a backup taken with deduplication are released
+        # even once it is disabled.
+        self.flags(backup_deduplication=False)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        service.delete(backup)
+        self.assertEqual([], [name for name in os.listdir(container_path)
+                              if name.startswith('dedup-')])
+
+    def test_backup_deduplication_chunk_deleted(self):
+        volume_id = 'c2b7e0f4-1a6d-4f43-9d0e-0000003d5e22'
+        self.flags(backup_deduplication=True)
+        self.flags(backup_file_size=1024)
+        self.flags(backup_sha_block_size_bytes=1024)
+        container_name = self.temp_dir.replace(tempfile.gettempdir() + '/',
+                                               '', 1)
+        container_path = os.path.join(self.temp_dir, container_name)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self._create_backup_db_entry(volume_id=volume_id,
+                                     container=container_name,
+                                     backup_id=123)
+        self.volume_file.seek(0)
+        service.backup(objects.Backup.get_by_id(self.ctxt, 123),
+                       self.volume_file)
+
+        # A deletion which listed the references of a chunk before the
+        # second backup took its own deletes the chunk once it is found.
+        find_dedup_chunk = service._find_dedup_chunk
+
+        def _find_and_delete(container, chunk_name):
+            algorithm = find_dedup_chunk(container, chunk_name)
+            service.delete_object(
+                container, service._dedup_object_name(chunk_name, algorithm))
+            return algorithm
+
+        self.mock_object(service, '_find_dedup_chunk',
+                         mock.Mock(side_effect=_find_and_delete))
+        self._create_backup_db_entry(volume_id=volume_id,
+                                     container=container_name,
+                                     backup_id=124)
+        self.volume_file.seek(0)
+        self.assertRaises(exception.BackupDriverException, service.backup,
+                          objects.Backup.get_by_id(self.ctxt, 124),
+                          self.volume_file)
+        # The failed backup holds no reference on the chunks.
+        self.assertEqual([], [name for name in os.listdir(container_path)
+                              if name.endswith('.ref.124')])
+
+    def test_backup_zero_blocks(self):
+        volume_id = 'a1c9f6d2-3e57-4b8a-9c61-0000007b2e43'
+
+        self._create_backup_db_entry(volume_id=volume_id)
+        self.flags(backup_detect_zeros=True)
+        self.flags(backup_file_size=8 * 1024)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.volume_file.seek(4 * 1024)
+        self.volume_file.write(b'\0' * 8 * 1024)
+        self.volume_file.seek(31 * 1024)
+        self.volume_file.write(b'\0' * 1024)
+        self.volume_file.flush()
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        backup = objects.Backup.get_by_id(self.ctxt, 123)
+        metadata = service._read_metadata(backup)
+        holes = [(obj['offset'], obj['length'])
+                 for entry in metadata['objects']
+                 for obj in entry.values() if obj.get('hole')]
+        self.assertEqual([(4 * 1024, 4 * 1024), (8 * 1024, 4 * 1024),
+                          (31 * 1024, 1024)], holes)
+        self.assertEqual(5, backup.object_count)
+        # Services which don't know about holes refuse to restore it
+        self.assertEqual('1.1.0', metadata['version'])
+        self.assertEqual('1.1.0', service._read_sha256file(backup)['version'])
+
+        # Holes are written over whatever the volume contains...
+        with tempfile.NamedTemporaryFile() as restored_file:
+            restored_file.write(os.urandom(32 * 1024))
+            restored_file.flush()
+            service.restore(backup, volume_id, restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+        # ...unless it is known to read back zeros.
+        self.flags(backup_restore_skip_holes=True)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        with tempfile.NamedTemporaryFile() as restored_file:
+            restored_file.truncate(32 * 1024)
+            self.mock_object(service, '_write_zeros')
+            service.restore(backup, volume_id, restored_file)
+            self.assertFalse(service._write_zeros.called)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+    def test_backup_zero_blocks_disabled(self):
+        volume_id = 'a1c9f6d2-3e57-4b8a-9c61-0000007b2e44'
+
+        self._create_backup_db_entry(volume_id=volume_id)
+        self.flags(backup_file_size=8 * 1024)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.volume_file.seek(4 * 1024)
+        self.volume_file.write(b'\0' * 8 * 1024)
+        self.volume_file.flush()
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        # Zeros are written by default, so that services of earlier
+        # releases can restore the backup.
+        backup = objects.Backup.get_by_id(self.ctxt, 123)
+        metadata = service._read_metadata(backup)
+        self.assertFalse(any(obj.get('hole')
+                             for entry in metadata['objects']
+                             for obj in entry.values()))
+        self.assertEqual(4, backup.object_count)
+        self.assertEqual('1.0.0', metadata['version'])
+
+    def test_backup_version(self):
+        service = nfs.NFSBackupDriver(self.ctxt)
+        data = [{'backup-00001': {'offset': 0, 'length': 1024}}]
+        hole = [{'hole-1024': {'offset': 1024, 'length': 1024,
+                               'hole': True}}]
+        dedup = [{'dedup-sha': {'offset': 2048, 'length': 1024,
+                                'dedup': True}}]
+        self.assertEqual('1.0.0', service._backup_version(data))
+        self.assertEqual('1.1.0', service._backup_version(data + hole))
+        self.assertEqual('1.1.0', service._backup_version(data + dedup))
+        self.assertEqual('1.0.0', service._backup_version(data, '1.0.0'))
+        # Incremental backups of backups with holes can't be restored by
+        # earlier releases either.
+        self.assertEqual('1.1.0', service._backup_version(data, '1.1.0'))
+
     def test_restore_uncompressed(self):
         volume_id = 'b6f39bd5-ad93-474b-8ee4-000000a0d11e'
 
@@ -554,6 +888,56 @@ class BackupNFSSwiftBasedTestCase(test.TestCase):
             self.assertTrue(filecmp.cmp(self.volume_file.name,
                             restored_file.name))
 
+    def test_restore_prefetch_memory_budget(self):
+        volume_id = '0f1b7e1c-29d2-4f5e-a0a3-0000003c5b8e'
+
+        self._create_backup_db_entry(volume_id=volume_id)
+        self.flags(backup_file_size=1024)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_restore_prefetch_depth=8)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        # A budget smaller than one object still restores one at a time.
+        service.restore_memory_budget = 512
+        with tempfile.NamedTemporaryFile() as restored_file:
+            backup = objects.Backup.get_by_id(self.ctxt, 123)
+            service.restore(backup, volume_id, restored_file)
+            self.assertTrue(filecmp.cmp(self.volume_file.name,
+                            restored_file.name))
+
+    @mock.patch('os.pwrite', create=True)
+    def test_restore_pwrite(self, mock_pwrite):
+        volume_id = '7c86ad4b-0a4d-4b8f-a8a7-0000008f31aa'
+
+        self._create_backup_db_entry(volume_id=volume_id)
+        self.flags(backup_file_size=1024)
+        self.flags(backup_sha_block_size_bytes=1024)
+        self.flags(backup_restore_use_pwrite=True)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = objects.Backup.get_by_id(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        written = {}
+
+        def _fake_pwrite(fd, data, offset):
+            written[offset] = bytes(data)
+            return len(data)
+
+        mock_pwrite.side_effect = _fake_pwrite
+        with tempfile.NamedTemporaryFile() as restored_file:
+            backup = objects.Backup.get_by_id(self.ctxt, 123)
+            service.restore(backup, volume_id, restored_file)
+
+        self.volume_file.seek(0)
+        expected = self.volume_file.read()
+        self.assertEqual(32, len(written))
+        for offset, data in written.items():
+            self.assertEqual(expected[offset:offset + 1024], data)
+
     def test_restore_delta(self):
         volume_id = '486249dc-83c6-4a02-8d65-000000d819e7'
 
@@ -621,6 +1005,46 @@ class BackupNFSSwiftBasedTestCase(test.TestCase):
         self.assertEqual(compressor, bz2)
         self.assertRaises(ValueError, service._get_compressor, 'fake')
 
+    def test_get_compressor_level(self):
+        service = nfs.NFSBackupDriver(self.ctxt)
+        data = b'a' * 4096
+        for algorithm, module in (('zlib', zlib), ('bz2', bz2)):
+            compressor = service._get_compressor(algorithm, 1)
+            compressed = compressor.compress(data)
+            self.assertEqual(module.compress(data, 1), compressed)
+            self.assertEqual(data, compressor.decompress(compressed))
+
+    def test_get_compressor_zstd(self):
+        zstandard = mock.Mock()
+        service = nfs.NFSBackupDriver(self.ctxt)
+        with mock.patch.dict(sys.modules, {'zstandard': zstandard}):
+            compressor = service._get_compressor('zstd', 5)
+            compressed = compressor.compress(b'data')
+            compressor.decompress(compressed)
+
+        zstandard.ZstdCompressor.assert_called_once_with(level=5)
+        zstandard.ZstdCompressor.return_value.compress.assert_called_once_with(
+            b'data')
+        zstandard.ZstdDecompressor.return_value.decompress.\
+            assert_called_once_with(compressed)
+
+    def test_get_compressor_lz4(self):
+        lz4 = mock.Mock()
+        service = nfs.NFSBackupDriver(self.ctxt)
+        with mock.patch.dict(sys.modules, {'lz4': lz4,
+                                           'lz4.frame': lz4.frame}):
+            compressor = service._get_compressor('lz4')
+            compressed = compressor.compress(b'data')
+            compressor.decompress(compressed)
+
+        lz4.frame.compress.assert_called_once_with(b'data')
+        lz4.frame.decompress.assert_called_once_with(compressed)
+
+    def test_get_compressor_missing_library(self):
+        service = nfs.NFSBackupDriver(self.ctxt)
+        with mock.patch.dict(sys.modules, {'zstandard': None}):
+            self.assertRaises(ValueError, service._get_compressor, 'zstd')
+
     def create_buffer(self, size):
         # Set up buffer of zeroed bytes
         fake_data = bytearray(size)
@@ -658,3 +1082,29 @@ class BackupNFSSwiftBasedTestCase(test.TestCase):
 
         self.assertEqual('none', result[0])
         self.assertEqual(already_compressed_data, result[1])
+
+    def test_prepare_output_data_adaptive_incompressible(self):
+        self.flags(backup_compression_adaptive=True)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        fake_data = os.urandom(1024 * 1024)
+        self.mock_object(service, 'compressor',
+                         mock.Mock(wraps=service.compressor))
+
+        result = service._prepare_output_data(fake_data)
+
+        self.assertEqual('none', result[0])
+        self.assertEqual(fake_data, result[1])
+        # Only the sample is compressed.
+        service.compressor.compress.assert_called_once_with(mock.ANY)
+        self.assertEqual(64 * 1024,
+                         len(service.compressor.compress.call_args[0][0]))
+
+    def test_prepare_output_data_adaptive_compressible(self):
+        self.flags(backup_compression_adaptive=True)
+        service = nfs.NFSBackupDriver(self.ctxt)
+        fake_data = self.create_buffer(1024 * 1024)
+
+        result = service._prepare_output_data(fake_data)
+
+        self.assertEqual('zlib', result[0])
+        self.assertEqual(bytes(fake_data), zlib.decompress(result[1]))
@@ -64,6 +64,10 @@ class FakeSwiftConnection2(object):
         return fake_header, fake_body
 
     def head_object(self, container, name):
+        object_path = tempfile.gettempdir() + '/' + container + '/' + name
+        if not os.path.exists(object_path):
+            raise swift.ClientException('fake exception',
+                                        http_status=http_client.NOT_FOUND)
         return {'etag': 'fake-md5-sum'}
 
     def get_object(self, container, name):
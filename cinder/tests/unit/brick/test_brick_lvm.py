@@ -353,6 +353,42 @@ class BrickLvmTestCase(test.TestCase):
 
         self.mox.VerifyAll()
 
+    def test_get_thin_delta(self):
+        self.vg.vg_thin_pool = 'fake-vg-pool'
+        thin_delta_out = (
+            '<superblock uuid="" time="2" transaction="3" '
+            'data_block_size="128" nr_data_blocks="0">\n'
+            '  <diff left="1" right="2">\n'
+            '    <same begin="0" length="16"/>\n'
+            '    <different begin="16" length="2"/>\n'
+            '    <right_only begin="18" length="1"/>\n'
+            '    <same begin="19" length="5"/>\n'
+            '    <left_only begin="24" length="1"/>\n'
+            '  </diff>\n'
+            '</superblock>\n')
+
+        def _fake_execute(*cmd, **kwargs):
+            if 'thin_id' in cmd:
+                return ('  %s\n' % (1 if 'fake-vg/snap' in cmd else 2), '')
+            if cmd[0] == 'thin_delta':
+                return (thin_delta_out, '')
+            return ('', '')
+
+        self.vg._execute = mock.Mock(side_effect=_fake_execute)
+
+        extents = self.vg.get_thin_delta('snap', 'volume')
+
+        self.assertEqual([(16 * 64 * 1024, 3 * 64 * 1024),
+                          (24 * 64 * 1024, 64 * 1024)], extents)
+        self.vg._execute.assert_any_call(
+            'thin_delta', '--metadata-snap', '--snap1', '1', '--snap2', '2',
+            '/dev/mapper/fake--vg-fake--vg--pool_tmeta',
+            root_helper='sudo', run_as_root=True)
+        self.vg._execute.assert_called_with(
+            'dmsetup', 'message', '/dev/mapper/fake--vg-fake--vg--pool-tpool',
+            '0', 'release_metadata_snap', root_helper='sudo',
+            run_as_root=True)
+
     def test_get_mirrored_available_capacity(self):
         self.assertEqual(2.0, self.vg.vg_mirror_free_space(1))
 
@@ -18,6 +18,7 @@
 import datetime
 import uuid
 
+import mock
 from oslo_utils import timeutils
 
 from cinder import context
@@ -89,6 +90,32 @@ class PurgeDeletedTest(test.TestCase):
         self.assertEqual(2, rows)
         self.assertEqual(2, meta_rows)
 
+    def test_purge_deleted_rows_batches(self):
+        progress = mock.Mock()
+        with mock.patch('time.sleep') as sleep:
+            purged = db.purge_deleted_rows(self.context, age_in_days=10,
+                                           batch_size=1, batch_sleep=0.5,
+                                           progress=progress)
+        self.assertEqual(8, purged)
+        self.assertEqual(2, self.session.query(self.volumes).count())
+        self.assertEqual(2, self.session.query(self.vm).count())
+        progress.assert_has_calls([mock.call('volume_metadata', 1),
+                                   mock.call('volume_metadata', 2),
+                                   mock.call('volume_metadata', 3),
+                                   mock.call('volume_metadata', 4)])
+        progress.assert_has_calls([mock.call('volumes', 4)])
+        sleep.assert_called_with(0.5)
+
+    def test_purge_deleted_rows_dry_run(self):
+        progress = mock.Mock()
+        purged = db.purge_deleted_rows(self.context, age_in_days=30,
+                                       dry_run=True, progress=progress)
+        self.assertEqual(4, purged)
+        self.assertEqual(6, self.session.query(self.volumes).count())
+        self.assertEqual(6, self.session.query(self.vm).count())
+        progress.assert_any_call('volumes', 2)
+        progress.assert_any_call('volume_metadata', 2)
+
     def test_purge_deleted_rows_bad_args(self):
         # Test with no age argument
         self.assertRaises(TypeError, db.purge_deleted_rows, self.context)
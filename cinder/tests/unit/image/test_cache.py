@@ -18,6 +18,7 @@ import mock
 from oslo_utils import timeutils
 
 from cinder import context as ctxt
+from cinder import exception
 from cinder.image import cache as image_cache
 from cinder import test
 
@@ -30,15 +31,16 @@ class ImageVolumeCacheTestCase(test.TestCase):
         self.mock_volume_api = mock.Mock()
         self.context = ctxt.get_admin_context()
 
-    def _build_cache(self, max_gb=0, max_count=0):
+    def _build_cache(self, max_gb=0, max_count=0, eviction_policy='lru'):
         cache = image_cache.ImageVolumeCache(self.mock_db,
                                              self.mock_volume_api,
                                              max_gb,
-                                             max_count)
+                                             max_count,
+                                             eviction_policy)
         cache.notifier = self.notifier
         return cache
 
-    def _build_entry(self, size=10):
+    def _build_entry(self, size=10, hits=0, inflation=0):
         entry = {
             'id': 1,
             'host': 'test@foo#bar',
@@ -46,10 +48,26 @@ class ImageVolumeCacheTestCase(test.TestCase):
             'image_updated_at': timeutils.utcnow(with_timezone=True),
             'volume_id': '70a599e0-31e7-49b7-b260-868f441e862b',
             'size': size,
-            'last_used': timeutils.utcnow(with_timezone=True)
+            'last_used': timeutils.utcnow(with_timezone=True),
+            'hits': hits,
+            'inflation': inflation,
         }
         return entry
 
+    def _set_entries(self, entries, inflation=0):
+        # The entries are ordered by most recently used to least used.
+        self.mock_db.image_volume_cache_get_all_for_host.return_value = (
+            entries)
+        self.mock_db.image_volume_cache_get_totals_for_host.return_value = {
+            'count': len(entries),
+            'size': sum(entry['size'] for entry in entries),
+            'inflation': inflation,
+        }
+
+    def test_invalid_eviction_policy(self):
+        self.assertRaises(exception.InvalidInput,
+                          self._build_cache, eviction_policy='fifo')
+
     def test_get_by_image_volume(self):
         cache = self._build_cache()
         ret = {'id': 1}
@@ -180,6 +198,54 @@ class ImageVolumeCacheTestCase(test.TestCase):
         self.assertEqual(entry['image_id'], msg['payload']['image_id'])
         self.assertEqual(1, len(self.notifier.notifications))
 
+    def test_has_entry(self):
+        cache = self._build_cache()
+        entry = self._build_entry()
+        other_entry = dict(self._build_entry(), image_id='other')
+        image_meta = {'updated_at': entry['image_updated_at']}
+        self.mock_db.image_volume_cache_get_all_for_host.return_value = [
+            other_entry, entry]
+
+        self.assertTrue(cache.has_entry(self.context, entry['host'],
+                                        entry['image_id'], image_meta))
+        self.assertFalse(cache.has_entry(self.context, entry['host'],
+                                         'missing', image_meta))
+        (self.mock_db.image_volume_cache_get_all_for_host.
+         assert_called_with(self.context, entry['host']))
+        self.assertFalse(
+            self.mock_db.image_volume_cache_get_and_update_last_used.called)
+        self.assertEqual([], self.notifier.notifications)
+
+    def test_has_entry_needs_update(self):
+        cache = self._build_cache()
+        entry = self._build_entry()
+        image_meta = {
+            'updated_at': entry['image_updated_at'] + timedelta(hours=2)
+        }
+        self.mock_db.image_volume_cache_get_all_for_host.return_value = [
+            entry]
+        mock_volume = mock.Mock()
+        self.mock_db.volume_get.return_value = mock_volume
+
+        self.assertFalse(cache.has_entry(self.context, entry['host'],
+                                         entry['image_id'], image_meta))
+        self.mock_volume_api.delete.assert_called_once_with(self.context,
+                                                            mock_volume)
+
+    def test_notify_warm(self):
+        cache = self._build_cache()
+        cache.notify_warm(self.context, 'foo@bar#whatever', 'progress',
+                          image_id='image', result='created', total=2)
+
+        msg = self.notifier.notifications[0]
+        self.assertEqual('image_volume_cache.warm.progress',
+                         msg['event_type'])
+        self.assertEqual('INFO', msg['priority'])
+        self.assertEqual({'host': 'foo@bar#whatever',
+                          'image_id': 'image',
+                          'result': 'created',
+                          'total': 2}, msg['payload'])
+
     def test_create_cache_entry(self):
         cache = self._build_cache()
         entry = self._build_entry()
@@ -218,7 +284,7 @@ class ImageVolumeCacheTestCase(test.TestCase):
     def test_ensure_space_no_entries(self):
         cache = self._build_cache(max_gb=100, max_count=10)
         host = 'foo@bar#whatever'
-        self.mock_db.image_volume_cache_get_all_for_host.return_value = []
+        self._set_entries([])
 
         has_space = cache.ensure_space(self.context, 5, host)
         self.assertTrue(has_space)
@@ -238,7 +304,7 @@ class ImageVolumeCacheTestCase(test.TestCase):
         entries.append(entry2)
         entry3 = self._build_entry(size=10)
         entries.append(entry3)
-        self.mock_db.image_volume_cache_get_all_for_host.return_value = entries
+        self._set_entries(entries)
 
         has_space = cache.ensure_space(self.context, 15, host)
         self.assertTrue(has_space)
@@ -256,7 +322,7 @@ class ImageVolumeCacheTestCase(test.TestCase):
         entries.append(entry1)
         entry2 = self._build_entry(size=5)
         entries.append(entry2)
-        self.mock_db.image_volume_cache_get_all_for_host.return_value = entries
+        self._set_entries(entries)
 
         has_space = cache.ensure_space(self.context, 12, host)
         self.assertTrue(has_space)
@@ -275,7 +341,7 @@ class ImageVolumeCacheTestCase(test.TestCase):
         entries.append(entry2)
         entry3 = self._build_entry(size=12)
         entries.append(entry3)
-        self.mock_db.image_volume_cache_get_all_for_host.return_value = entries
+        self._set_entries(entries)
 
         has_space = cache.ensure_space(self.context, 16, host)
         self.assertTrue(has_space)
@@ -288,9 +354,96 @@ class ImageVolumeCacheTestCase(test.TestCase):
         mock_delete = mock.patch.object(cache, '_delete_image_volume').start()
         host = 'foo@bar#whatever'
 
-        entries = list(self._build_entry(size=25))
-        self.mock_db.image_volume_cache_get_all_for_host.return_value = entries
+        entries = [self._build_entry(size=25)]
+        self._set_entries(entries)
 
         has_space = cache.ensure_space(self.context, 50, host)
         self.assertFalse(has_space)
         mock_delete.assert_not_called()
+
+    def test_ensure_space_not_full(self):
+        cache = self._build_cache(max_gb=30, max_count=10)
+        mock_delete = mock.patch.object(cache, '_delete_image_volume').start()
+        host = 'foo@bar#whatever'
+        self._set_entries([self._build_entry(size=10),
+                           self._build_entry(size=5)])
+
+        has_space = cache.ensure_space(self.context, 15, host)
+        self.assertTrue(has_space)
+        self.assertFalse(
+            self.mock_db.image_volume_cache_get_all_for_host.called)
+        mock_delete.assert_not_called()
+
+    def test_ensure_space_lfu(self):
+        cache = self._build_cache(max_gb=30, max_count=10,
+                                  eviction_policy='lfu')
+        mock_delete = mock.patch.object(cache, '_delete_image_volume').start()
+        host = 'foo@bar#whatever'
+
+        entry1 = self._build_entry(size=10, hits=1)
+        entry2 = self._build_entry(size=5, hits=7)
+        entry3 = self._build_entry(size=10, hits=3)
+        self._set_entries([entry1, entry2, entry3])
+
+        has_space = cache.ensure_space(self.context, 15, host)
+        self.assertTrue(has_space)
+        self.assertEqual(2, mock_delete.call_count)
+        mock_delete.assert_any_call(self.context, entry1)
+        mock_delete.assert_any_call(self.context, entry3)
+        self.assertFalse(self.mock_db.
+                         image_volume_cache_update_inflation_for_host.called)
+
+    def test_ensure_space_gdsf(self):
+        cache = self._build_cache(max_gb=30, max_count=10,
+                                  eviction_policy='gdsf')
+        mock_delete = mock.patch.object(cache, '_delete_image_volume').start()
+        host = 'foo@bar#whatever'
+
+        # Priorities: 2.1, 1.5 and 1.2
+        entry1 = self._build_entry(size=10, hits=0, inflation=2)
+        entry2 = self._build_entry(size=4, hits=1, inflation=1)
+        entry3 = self._build_entry(size=15, hits=2, inflation=1)
+        self._set_entries([entry1, entry2, entry3], inflation=2)
+
+        has_space = cache.ensure_space(self.context, 20, host)
+        self.assertTrue(has_space)
+        self.assertEqual(2, mock_delete.call_count)
+        mock_delete.assert_any_call(self.context, entry3)
+        mock_delete.assert_any_call(self.context, entry2)
+        # The inflation of the host never decreases
+        (self.mock_db.image_volume_cache_update_inflation_for_host.
+         assert_called_once_with(self.context, host, 2))
+
+    def test_ensure_space_delete_fails(self):
+        cache = self._build_cache(max_gb=30, max_count=10)
+        mock_delete = mock.patch.object(cache, '_delete_image_volume').start()
+        host = 'foo@bar#whatever'
+
+        entry1 = self._build_entry(size=10)
+        entry2 = self._build_entry(size=10)
+        entry3 = self._build_entry(size=10)
+        self._set_entries([entry1, entry2, entry3])
+        mock_delete.side_effect = [None, exception.InvalidVolume(reason=''),
+                                   None]
+
+        # The next entry is evicted in place of the one that can't be
+        has_space = cache.ensure_space(self.context, 15, host)
+        self.assertTrue(has_space)
+        self.assertEqual(3, mock_delete.call_count)
+        mock_delete.assert_any_call(self.context, entry3)
+        mock_delete.assert_any_call(self.context, entry2)
+        mock_delete.assert_any_call(self.context, entry1)
+
+    def test_ensure_space_delete_fails_no_entries_left(self):
+        cache = self._build_cache(max_gb=30, max_count=10)
+        mock_delete = mock.patch.object(cache, '_delete_image_volume').start()
+        host = 'foo@bar#whatever'
+
+        entry1 = self._build_entry(size=10)
+        entry2 = self._build_entry(size=10)
+        self._set_entries([entry1, entry2])
+        mock_delete.side_effect = [exception.InvalidVolume(reason=''), None]
+
+        has_space = cache.ensure_space(self.context, 25, host)
+        self.assertFalse(has_space)
+        self.assertEqual(2, mock_delete.call_count)
@@ -0,0 +1,139 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import hashlib
+import os
+
+import fixtures
+import mock
+from oslo_utils import units
+
+from cinder import exception
+from cinder.image import download_cache
+from cinder import test
+
+
+class ImageDownloadCacheTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ImageDownloadCacheTestCase, self).setUp()
+        self.cache_dir = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'cache')
+        self.dest_dir = self.useFixture(fixtures.TempDir()).path
+        self.image_service = mock.Mock()
+        self.image_service.download.side_effect = self._download
+        self.images = {}
+        self.context = mock.sentinel.context
+
+    def _download(self, context, image_id, data):
+        data.write(self.images[image_id])
+
+    def _image_meta(self, image_id, data, checksum=None):
+        self.images[image_id] = data
+        return {'id': image_id,
+                'size': len(data),
+                'checksum': checksum or hashlib.md5(data).hexdigest()}
+
+    def _fetch(self, cache, image_meta, dest='dest'):
+        dest = os.path.join(self.dest_dir, dest)
+        fetched = cache.fetch(self.context, self.image_service,
+                              image_meta['id'], image_meta, dest)
+        return fetched, dest
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_get_cache(self):
+        self.assertIsNone(download_cache.get_cache())
+
+        self.override_config('image_download_cache_dir', self.cache_dir)
+        self.override_config('image_download_cache_max_size_gb', 5)
+        cache = download_cache.get_cache()
+        self.assertEqual(self.cache_dir, cache.path)
+        self.assertEqual(5 * units.Gi, cache.max_size)
+
+    def test_fetch(self):
+        cache = download_cache.ImageDownloadCache(self.cache_dir, 1)
+        image_meta = self._image_meta('image1', b'data1')
+
+        fetched, dest = self._fetch(cache, image_meta)
+        self.assertTrue(fetched)
+        self.assertEqual(b'data1', self._read(dest))
+
+        # The second fetch is served from the cache
+        fetched, dest = self._fetch(cache, image_meta, dest='dest2')
+        self.assertTrue(fetched)
+        self.assertEqual(b'data1', self._read(dest))
+        self.assertEqual(1, self.image_service.download.call_count)
+        self.assertEqual(['image1-' + image_meta['checksum']],
+                         os.listdir(self.cache_dir))
+
+    def test_fetch_cross_device(self):
+        cache = download_cache.ImageDownloadCache(self.cache_dir, 1)
+        image_meta = self._image_meta('image1', b'data1')
+
+        with mock.patch('os.link',
+                        side_effect=OSError(errno.EXDEV, 'cross-device')):
+            fetched, dest = self._fetch(cache, image_meta)
+        self.assertTrue(fetched)
+        self.assertEqual(b'data1', self._read(dest))
+
+    def test_fetch_no_checksum(self):
+        cache = download_cache.ImageDownloadCache(self.cache_dir, 1)
+        image_meta = self._image_meta('image1', b'data1')
+        image_meta['checksum'] = None
+
+        fetched, dest = self._fetch(cache, image_meta)
+        self.assertFalse(fetched)
+        self.assertFalse(self.image_service.download.called)
+        self.assertFalse(os.path.exists(dest))
+
+    def test_fetch_checksum_mismatch(self):
+        cache = download_cache.ImageDownloadCache(self.cache_dir, 1)
+        image_meta = self._image_meta('image1', b'data1',
+                                      checksum='0' * 32)
+
+        self.assertRaises(exception.ImageUnacceptable,
+                          self._fetch, cache, image_meta)
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_fetch_evicts_least_recently_used(self):
+        cache = download_cache.ImageDownloadCache(self.cache_dir, 1)
+        image_meta1 = self._image_meta('image1', b'data1')
+        image_meta2 = self._image_meta('image2', b'data2')
+        image_meta3 = self._image_meta('image3', b'data3')
+        self._fetch(cache, image_meta1)
+        self._fetch(cache, image_meta2)
+        entry1 = os.path.join(self.cache_dir,
+                              'image1-' + image_meta1['checksum'])
+        entry2 = os.path.join(self.cache_dir,
+                              'image2-' + image_meta2['checksum'])
+        # image1 was used after image2
+        os.utime(entry2, (1000, 1000))
+        os.utime(entry1, (2000, 2000))
+
+        cache.max_size = 12
+        fetched, dest = self._fetch(cache, image_meta3)
+        self.assertTrue(fetched)
+        self.assertTrue(os.path.exists(entry1))
+        self.assertFalse(os.path.exists(entry2))
+
+    def test_fetch_too_big(self):
+        cache = download_cache.ImageDownloadCache(self.cache_dir, 1)
+        cache.max_size = 4
+        image_meta = self._image_meta('image1', b'data1')
+
+        fetched, dest = self._fetch(cache, image_meta)
+        self.assertFalse(fetched)
+        self.assertFalse(self.image_service.download.called)
@@ -15,10 +15,16 @@
 
 
 import datetime
+import hashlib
+import os
+import tempfile
+import threading
 
+import eventlet
 import glanceclient.exc
 import mock
 from oslo_config import cfg
+from six.moves import BaseHTTPServer
 
 from cinder import context
 from cinder import exception
@@ -712,6 +718,179 @@ class TestGlanceImageService(test.TestCase):
         self.assertEqual(expected, actual)
 
 
+class _ImageRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serve the image of the server, with ranges if it supports them."""
+
+    def do_GET(self):
+        data = self.server.image_data
+        byte_range = self.headers.get('Range')
+        self.server.ranges_requested.append(byte_range)
+        failures = self.server.failures.get(byte_range)
+        failure = failures.pop(0) if failures else None
+        if failure == 'error':
+            self.send_error(500)
+            return
+        if byte_range and self.server.ranges:
+            start, end = [int(i) for i in
+                          byte_range[len('bytes='):].split('-')]
+            body = data[start:end + 1]
+            if failure == 'short':
+                body = body[:len(body) // 2]
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             'bytes %d-%d/%d' % (start, end, len(data)))
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestGlanceRangedDownload(test.TestCase):
+    """Test downloading images with ranges from a local HTTP server."""
+
+    def setUp(self):
+        super(TestGlanceRangedDownload, self).setUp()
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                _ImageRequestHandler)
+        self.server.image_data = os.urandom(4500)
+        self.server.ranges = True
+        self.server.ranges_requested = []
+        # Failures to serve, in order, by requested range
+        self.server.failures = {}
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.client = glance_stubs.StubGlanceClient()
+        self.stubs.Set(glance, '_create_glance_client',
+                       lambda context, netloc, use_ssl, version: self.client)
+        client_wrapper = glance.GlanceClientWrapper(
+            'fake', '127.0.0.1:%d' % self.server.server_port, False)
+        self.service = glance.GlanceImageService(client=client_wrapper)
+        self.context = context.RequestContext('fake', 'fake',
+                                              auth_token='token')
+        self.stubs.Set(glance, 'DOWNLOAD_RANGE_SIZE', 1000)
+        self.stubs.Set(glance.time, 'sleep', lambda s: None)
+        self.flags(glance_download_connections=3, auth_strategy='noauth')
+
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def _create_image(self, checksum=None):
+        data = self.server.image_data
+        image = self.client.create(
+            name='test image', status='active', is_public=True,
+            size=len(data), checksum=checksum or hashlib.md5(data).hexdigest())
+        return image.id
+
+    def test_download(self):
+        image_id = self._create_image()
+
+        with open(self.path, 'wb') as data:
+            self.service.download(self.context, image_id, data)
+
+        with open(self.path, 'rb') as data:
+            self.assertEqual(self.server.image_data, data.read())
+        self.assertEqual(['bytes=0-0', 'bytes=0-999', 'bytes=1000-1999',
+                          'bytes=2000-2999', 'bytes=3000-3999',
+                          'bytes=4000-4499'],
+                         sorted(self.server.ranges_requested))
+
+    def test_download_ranges_not_supported(self):
+        self.server.ranges = False
+        image_id = self._create_image()
+
+        with open(self.path, 'w') as data:
+            self.service.download(self.context, image_id, data)
+
+        # The stub glance client serves the image
+        with open(self.path, 'r') as data:
+            self.assertEqual('*' * 4500, data.read())
+        self.assertEqual(['bytes=0-0'], self.server.ranges_requested)
+
+    def test_download_checksum_mismatch(self):
+        image_id = self._create_image(checksum='0' * 32)
+
+        with open(self.path, 'wb') as data:
+            self.assertRaises(exception.ImageUnacceptable,
+                              self.service.download, self.context, image_id,
+                              data)
+
+    def test_download_range_retried(self):
+        self.server.failures = {'bytes=1000-1999': ['error'],
+                                'bytes=2000-2999': ['short']}
+        image_id = self._create_image()
+
+        with open(self.path, 'wb') as data:
+            self.service.download(self.context, image_id, data)
+
+        with open(self.path, 'rb') as data:
+            self.assertEqual(self.server.image_data, data.read())
+        # The short range is resumed where it stopped
+        self.assertEqual(2, self.server.ranges_requested.count(
+            'bytes=1000-1999'))
+        self.assertIn('bytes=2500-2999', self.server.ranges_requested)
+
+    def _test_download_range_fails(self, failures):
+        self.flags(glance_num_retries=1)
+        self.server.failures = failures
+        image_id = self._create_image()
+        writes = []
+        real_pwrite = glance._pwrite
+
+        def pwrite(fd, data, offset):
+            writes.append(offset)
+            return real_pwrite(fd, data, offset)
+
+        self.stubs.Set(glance, '_pwrite', pwrite)
+        with open(self.path, 'wb') as data:
+            self.assertRaises(exception.GlanceConnectionFailed,
+                              self.service.download, self.context, image_id,
+                              data)
+        # Every range is stopped before the error is raised
+        written = len(writes)
+        eventlet.sleep(0.1)
+        self.assertEqual(written, len(writes))
+
+    def test_download_range_error(self):
+        self._test_download_range_fails(
+            {'bytes=1000-1999': ['error', 'error']})
+
+    def test_download_range_short_read(self):
+        # The second attempt resumes after the half read by the first one
+        self._test_download_range_fails({'bytes=1000-1999': ['short'],
+                                         'bytes=1500-1999': ['short']})
+
+    @mock.patch.object(glance, 'os',
+                       mock.Mock(spec=['lseek', 'write', 'SEEK_SET']))
+    def test_pwrite_partial(self):
+        # Each write only writes one byte
+        glance.os.write.return_value = 1
+
+        self.assertEqual(3, glance._pwrite(mock.sentinel.fd, b'abc', 2))
+        glance.os.lseek.assert_has_calls(
+            [mock.call(mock.sentinel.fd, offset, glance.os.SEEK_SET)
+             for offset in (2, 3, 4)])
+        self.assertEqual(3, glance.os.write.call_count)
+
+    def test_download_one_connection(self):
+        self.flags(glance_download_connections=1)
+        image_id = self._create_image()
+
+        with open(self.path, 'w') as data:
+            self.service.download(self.context, image_id, data)
+
+        self.assertEqual([], self.server.ranges_requested)
+
+
 class TestGlanceClientVersion(test.TestCase):
     """Tests the version of the glance client generated."""
 
@@ -223,6 +223,59 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         weighed_host = sched._schedule(fake_context, request_spec, {})
         self.assertEqual('host1#lvm1', weighed_host.obj.host)
 
+    def _test_schedule_create_volumes(self, placement):
+        self.flags(scheduler_batch_placement=placement)
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.host_manager.service_states = {
+            'host1': {'total_capacity_gb': 1000,
+                      'free_capacity_gb': 1000,
+                      'reserved_percentage': 0,
+                      'volume_backend_name': 'lvm1',
+                      'timestamp': None},
+            'host2': {'total_capacity_gb': 1000,
+                      'free_capacity_gb': 900,
+                      'reserved_percentage': 0,
+                      'volume_backend_name': 'lvm2',
+                      'timestamp': None},
+        }
+        fake_context = context.RequestContext('user', 'project')
+        request_specs = [{'volume_properties': {'project_id': 1,
+                                                'size': 200},
+                          'volume_type': {'name': 'LVM_iSCSI'},
+                          'volume_id': volume_id}
+                         for volume_id in ('fake-id1', 'fake-id2',
+                                           'fake-id3')]
+        request_specs[2]['volume_properties']['size'] = 1000
+
+        with mock.patch('cinder.db.service_get_all_by_topic') as get_all, \
+                mock.patch.object(sched.host_manager, 'get_all_host_states',
+                                  wraps=sched.host_manager.
+                                  get_all_host_states) as get_host_states, \
+                mock.patch('cinder.scheduler.driver.volume_update_db') \
+                as update_db, \
+                mock.patch.object(sched.volume_rpcapi,
+                                  'create_volume') as create_volume:
+            fakes.mock_host_manager_db_calls(get_all)
+            placements = sched.schedule_create_volumes(
+                fake_context, request_specs, [{}, {}, {}])
+
+        # The two first requests are filtered and weighed together, the
+        # third one can't be placed anywhere.
+        self.assertEqual(2, get_host_states.call_count)
+        self.assertIsInstance(placements[2], exception.NoValidHost)
+        self.assertEqual(2, update_db.call_count)
+        self.assertEqual(2, create_volume.call_count)
+        return placements[:2]
+
+    def test_schedule_create_volumes_spread(self):
+        self.assertEqual(['host1#lvm1', 'host2#lvm2'],
+                         self._test_schedule_create_volumes('spread'))
+
+    def test_schedule_create_volumes_pack(self):
+        self.assertEqual(['host1#lvm1', 'host1#lvm1'],
+                         self._test_schedule_create_volumes('pack'))
+
     def test_max_attempts(self):
         self.flags(scheduler_max_attempts=4)
 
@@ -15,6 +15,8 @@
 Tests For Scheduler Host Filters.
 """
 
+import collections
+
 import mock
 from oslo_serialization import jsonutils
 from requests import exceptions as request_exceptions
@@ -24,6 +26,7 @@ from cinder import context
 from cinder import db
 from cinder import exception
 from cinder.scheduler import filters
+from cinder.scheduler.filters import capabilities_filter
 from cinder import test
 from cinder.tests.unit.scheduler import fakes
 from cinder.tests.unit import utils
@@ -1300,6 +1303,36 @@ class BasicFiltersTestCase(HostFiltersTestCase):
             especs={'capabilities:scope_lv1:opt1': '>= 2'},
             passes=False)
 
+    @mock.patch.object(capabilities_filter, '_matcher_cache',
+                       collections.OrderedDict())
+    @mock.patch.object(filters.extra_specs_ops, 'get_matcher',
+                       wraps=filters.extra_specs_ops.get_matcher)
+    def test_capability_filter_matcher_cached(self, get_matcher):
+        hosts = [fakes.FakeHostState('host%d' % i,
+                                     {'capabilities': {'opt1': i}})
+                 for i in range(4)]
+        resource_type = {'id': 'fake_type_id',
+                         'updated_at': None,
+                         'extra_specs': {'opt1': '>= 2'}}
+
+        def _passing_hosts(resource_type):
+            filt_cls = self.class_map['CapabilitiesFilter']()
+            filter_properties = {'resource_type': resource_type}
+            return [host.host for host in hosts
+                    if filt_cls.host_passes(host, filter_properties)]
+
+        self.assertEqual(['host2', 'host3'], _passing_hosts(resource_type))
+        self.assertEqual(['host2', 'host3'],
+                         _passing_hosts(dict(resource_type)))
+        self.assertEqual(1, get_matcher.call_count)
+
+        # A type updated since is parsed again.
+        resource_type = {'id': 'fake_type_id',
+                         'updated_at': 'fake_updated_at',
+                         'extra_specs': {'opt1': '>= 3'}}
+        self.assertEqual(['host3'], _passing_hosts(resource_type))
+        self.assertEqual(2, get_matcher.call_count)
+
     def test_json_filter_passes(self):
         filt_cls = self.class_map['JsonFilter']()
         filter_properties = {'resource_type': {'memory_mb': 1024,
@@ -254,6 +254,10 @@ class HostManagerTestCase(test.TestCase):
                           provisioned_capacity_gb=9300),
         }
 
+        # Read the services on every request, as the second test changes
+        # them.
+        self.flags(scheduler_service_refresh_interval=0)
+
         # First test: service_is_up is always True, host5 is disabled,
         # host4 has no capabilities
         self.host_manager.service_states = service_states
@@ -306,6 +310,65 @@ class HostManagerTestCase(test.TestCase):
             test_service.TestService._compare(self, volume_node,
                                               host_state_map[host].service)
 
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    @mock.patch('cinder.utils.service_is_up')
+    def test_get_all_host_states_cached(self, _mock_service_is_up,
+                                        _mock_service_get_all_by_topic):
+        context = 'fake_context'
+        services = [
+            dict(id=1, host='host1', topic='volume', disabled=False,
+                 availability_zone='zone1', updated_at=timeutils.utcnow()),
+            dict(id=2, host='host2', topic='volume', disabled=False,
+                 availability_zone='zone1', updated_at=timeutils.utcnow()),
+        ]
+        _mock_service_get_all_by_topic.return_value = services
+        _mock_service_is_up.return_value = True
+        self.host_manager.update_service_capabilities(
+            'volume', 'host1', dict(volume_backend_name='AAA',
+                                    total_capacity_gb=512,
+                                    free_capacity_gb=200, timestamp=None))
+
+        pools = self.host_manager.get_all_host_states(context)
+        self.assertEqual(1, len(pools))
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+
+        # Requests reuse the services read and the pool states.
+        with mock.patch.object(self.host_manager.host_state_map['host1'],
+                               'update_from_volume_capability') as update:
+            self.assertEqual(pools,
+                             self.host_manager.get_all_host_states(context))
+            self.assertFalse(update.called)
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+
+        # Capabilities of a known service are applied without reading the
+        # services again.
+        self.host_manager.update_service_capabilities(
+            'volume', 'host1', dict(volume_backend_name='AAA',
+                                    total_capacity_gb=512,
+                                    free_capacity_gb=100, timestamp=None))
+        pools = self.host_manager.get_all_host_states(context)
+        self.assertEqual(100, pools[0].free_capacity_gb)
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+
+        # Those of an unknown one have the services read again.
+        services.append(dict(id=3, host='host3', topic='volume',
+                             disabled=False, availability_zone='zone1',
+                             updated_at=timeutils.utcnow()))
+        self.host_manager.update_service_capabilities(
+            'volume', 'host3', dict(volume_backend_name='CCC',
+                                    total_capacity_gb=512,
+                                    free_capacity_gb=300, timestamp=None))
+        pools = self.host_manager.get_all_host_states(context)
+        self.assertEqual(2, len(pools))
+        self.assertEqual(2, _mock_service_get_all_by_topic.call_count)
+
+        # Services going down are noticed without reading them again.
+        _mock_service_is_up.side_effect = lambda service: (
+            service.host != 'host1')
+        pools = self.host_manager.get_all_host_states(context)
+        self.assertEqual(['host3#CCC'], [pool.host for pool in pools])
+        self.assertEqual(2, _mock_service_get_all_by_topic.call_count)
+
     @mock.patch('cinder.db.service_get_all_by_topic')
     @mock.patch('cinder.utils.service_is_up')
     def test_get_pools(self, _mock_service_is_up,
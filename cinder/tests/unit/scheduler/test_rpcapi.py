@@ -118,6 +118,43 @@ class SchedulerRpcAPITestCase(test.TestCase):
                                  version='1.2')
         can_send_version.assert_called_once_with('1.9')
 
+    @mock.patch('oslo_messaging.RPCClient.can_send_version',
+                return_value=True)
+    def test_create_volumes(self, can_send_version):
+        self._test_scheduler_api('create_volumes',
+                                 rpc_method='cast',
+                                 topic='topic',
+                                 volumes=['volume1', 'volume2'],
+                                 request_spec_list=['fake_request_spec1',
+                                                    'fake_request_spec2'],
+                                 filter_properties_list=['fake_properties1',
+                                                         'fake_properties2'],
+                                 version='1.12')
+        can_send_version.assert_called_once_with('1.12')
+
+    @mock.patch('oslo_messaging.RPCClient.can_send_version',
+                return_value=False)
+    @mock.patch('cinder.scheduler.rpcapi.SchedulerAPI.create_volume')
+    def test_create_volumes_old(self, create_volume, can_send_version):
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        volumes = [mock.Mock(id='volume1'), mock.Mock(id='volume2')]
+        request_specs = [{'snapshot_id': None, 'image_id': 'image1'},
+                         {'snapshot_id': 'snapshot2', 'image_id': None}]
+        scheduler_rpcapi.SchedulerAPI().create_volumes(
+            ctxt, 'topic', volumes, request_specs,
+            ['fake_properties1', 'fake_properties2'])
+
+        can_send_version.assert_called_once_with('1.12')
+        create_volume.assert_has_calls([
+            mock.call(ctxt, 'topic', 'volume1', snapshot_id=None,
+                      image_id='image1', request_spec=request_specs[0],
+                      filter_properties='fake_properties1',
+                      volume=volumes[0]),
+            mock.call(ctxt, 'topic', 'volume2', snapshot_id='snapshot2',
+                      image_id=None, request_spec=request_specs[1],
+                      filter_properties='fake_properties2',
+                      volume=volumes[1])])
+
     @mock.patch('oslo_messaging.RPCClient.can_send_version',
                 return_value=True)
     def test_migrate_volume_to_host(self, can_send_version):
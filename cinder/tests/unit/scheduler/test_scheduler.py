@@ -116,6 +116,25 @@ class SchedulerManagerTestCase(test.TestCase):
         _mock_sched_create.assert_called_once_with(self.context, request_spec,
                                                    {})
 
+    @mock.patch('cinder.scheduler.driver.Scheduler.schedule_create_volume')
+    @mock.patch('cinder.db.volume_update')
+    def test_create_volumes_puts_failed_volumes_in_error_state(
+            self, _mock_volume_update, _mock_sched_create):
+        _mock_sched_create.side_effect = ['host1',
+                                          exception.NoValidHost(reason="")]
+        topic = 'fake_topic'
+        request_specs = [{'volume_id': 'fake-id1'},
+                         {'volume_id': 'fake-id2'}]
+
+        self.manager.create_volumes(self.context, topic, request_specs,
+                                    [{}, None])
+        _mock_sched_create.assert_has_calls([
+            mock.call(self.context, request_specs[0], {}),
+            mock.call(self.context, request_specs[1], {})])
+        _mock_volume_update.assert_called_once_with(self.context,
+                                                    'fake-id2',
+                                                    {'status': 'error'})
+
     @mock.patch('cinder.scheduler.driver.Scheduler.schedule_create_volume')
     @mock.patch('eventlet.sleep')
     def test_create_volume_no_delay(self, _mock_sleep, _mock_sched_create):
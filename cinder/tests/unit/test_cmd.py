@@ -393,6 +393,105 @@ class TestCinderManageCmd(test.TestCase):
         with mock.patch('sys.stdout', new=six.StringIO()):
             self.assertRaises(exception.InvalidInput, db_cmds.sync, 1)
 
+    @mock.patch('cinder.db.purge_deleted_rows')
+    @mock.patch('cinder.context.get_admin_context')
+    def test_db_commands_purge(self, get_admin_context, purge_deleted_rows):
+        def _purge(ctxt, age_in_days, batch_size, batch_sleep, dry_run,
+                   progress):
+            progress('volumes', 3)
+            return 3
+
+        purge_deleted_rows.side_effect = _purge
+        db_cmds = cinder_manage.DbCommands()
+        with mock.patch('sys.stdout', new=six.StringIO()) as fake_out:
+            db_cmds.purge(30, 100, 0.5, True)
+
+        purge_deleted_rows.assert_called_once_with(
+            get_admin_context.return_value, 30, batch_size=100,
+            batch_sleep=0.5, dry_run=True, progress=mock.ANY)
+        self.assertEqual('volumes: 3 rows would be purged\n'
+                         'total: 3 rows would be purged\n',
+                         fake_out.getvalue())
+
+    def test_db_commands_purge_bad_batch_size(self):
+        db_cmds = cinder_manage.DbCommands()
+        with mock.patch('sys.stdout', new=six.StringIO()):
+            self.assertRaises(SystemExit, db_cmds.purge, 30, 0)
+
+    @mock.patch('cinder.db.usage_counters_verify', return_value=[])
+    @mock.patch('cinder.context.get_admin_context')
+    def test_db_commands_usage_counters(self, get_admin_context, verify):
+        db_cmds = cinder_manage.DbCommands()
+        with mock.patch('sys.stdout', new=six.StringIO()) as fake_out:
+            db_cmds.usage_counters('project1')
+
+        verify.assert_called_once_with(get_admin_context.return_value,
+                                       'project1')
+        self.assertEqual('The usage counters are correct.\n',
+                         fake_out.getvalue())
+
+    @mock.patch('cinder.db.usage_counters_verify')
+    @mock.patch('cinder.context.get_admin_context')
+    def test_db_commands_usage_counters_incorrect(self, get_admin_context,
+                                                  verify):
+        verify.return_value = [{'project_id': 'project1',
+                                'resource': 'volumes',
+                                'volume_type_id': '',
+                                'in_use': 2,
+                                'gigabytes': 3,
+                                'actual_in_use': 1,
+                                'actual_gigabytes': 1}]
+        db_cmds = cinder_manage.DbCommands()
+        with mock.patch('sys.stdout', new=six.StringIO()) as fake_out:
+            self.assertRaises(SystemExit, db_cmds.usage_counters)
+
+        self.assertIn('2/3G', fake_out.getvalue())
+        self.assertIn('1/1G', fake_out.getvalue())
+
+    @mock.patch('cinder.db.usage_counters_rebuild')
+    @mock.patch('cinder.context.get_admin_context')
+    def test_db_commands_usage_counters_rebuild(self, get_admin_context,
+                                                rebuild):
+        rebuild.return_value = [{'project_id': 'project1',
+                                 'resource': 'snapshots',
+                                 'volume_type_id': 'type1',
+                                 'in_use': 0,
+                                 'gigabytes': 0,
+                                 'actual_in_use': 1,
+                                 'actual_gigabytes': 10}]
+        db_cmds = cinder_manage.DbCommands()
+        with mock.patch('sys.stdout', new=six.StringIO()) as fake_out:
+            db_cmds.usage_counters(rebuild=True)
+
+        rebuild.assert_called_once_with(get_admin_context.return_value,
+                                        None)
+        self.assertIn('1 usage counters rebuilt.', fake_out.getvalue())
+
+    @mock.patch('cinder.rpc.initialized', return_value=True)
+    @mock.patch('cinder.volume.api.API.warm_image_cache')
+    @mock.patch('cinder.context.get_admin_context')
+    def test_image_cache_commands_warm(self, get_admin_context,
+                                       warm_image_cache, rpc_initialized):
+        image_cache_cmds = cinder_manage.ImageCacheCommands()
+        with mock.patch('sys.stdout', new=six.StringIO()):
+            self.assertIsNone(image_cache_cmds.warm('host@backend#pool',
+                                                    ['image1', 'image2']))
+
+        warm_image_cache.assert_called_once_with(
+            get_admin_context.return_value, 'host@backend#pool',
+            ['image1', 'image2'])
+
+    @mock.patch('cinder.rpc.initialized', return_value=True)
+    @mock.patch('cinder.volume.api.API.warm_image_cache')
+    @mock.patch('cinder.context.get_admin_context')
+    def test_image_cache_commands_warm_invalid_host(self, get_admin_context,
+                                                    warm_image_cache,
+                                                    rpc_initialized):
+        warm_image_cache.side_effect = exception.InvalidHost(reason='fake')
+        image_cache_cmds = cinder_manage.ImageCacheCommands()
+        with mock.patch('sys.stdout', new=six.StringIO()):
+            self.assertEqual(2, image_cache_cmds.warm('host', ['image1']))
+
     @mock.patch('cinder.version.version_string')
     def test_versions_commands_list(self, version_string):
         version_cmds = cinder_manage.VersionCommands()
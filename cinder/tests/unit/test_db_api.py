@@ -26,9 +26,11 @@ from cinder.api import common
 from cinder import context
 from cinder import db
 from cinder.db.sqlalchemy import api as sqlalchemy_api
+from cinder.db.sqlalchemy import models
 from cinder import exception
 from cinder import quota
 from cinder import test
+from cinder import utils
 
 CONF = cfg.CONF
 
@@ -426,6 +428,52 @@ class DBAPIVolumeTestCase(BaseTest):
         self._assertEqualListsOfObjects(volumes[2:], db.volume_get_all(
                                         self.ctxt, 2, 2, ['id'], ['asc']))
 
+    def test_volume_get_all_cursor_passed(self):
+        volumes = [
+            db.volume_create(self.ctxt, {'id': 1}),
+            db.volume_create(self.ctxt, {'id': 2}),
+            db.volume_create(self.ctxt, {'id': 3}),
+            db.volume_create(self.ctxt, {'id': 4}),
+        ]
+        cursor = utils.encode_pagination_cursor(
+            {'id': volumes[1]['id'], 'created_at': volumes[1]['created_at']})
+
+        self._assertEqualListsOfObjects(volumes[2:], db.volume_get_all(
+                                        self.ctxt, cursor, 2, ['id'], ['asc']))
+
+    def test_volume_get_all_cursor_sort_mismatch(self):
+        cursor = utils.encode_pagination_cursor({'id': '1'})
+        self.assertRaises(exception.InvalidInput, db.volume_get_all,
+                          self.ctxt, cursor, 2, ['id'], ['asc'])
+
+    def test_volume_get_all_columns(self):
+        created_at = datetime.datetime(2015, 10, 1)
+        volumes = [db.volume_create(self.ctxt, {
+            'display_name': 'vol%d' % i, 'project_id': 'project',
+            'created_at': created_at + datetime.timedelta(seconds=i)})
+            for i in range(3)]
+        db.volume_metadata_update(self.ctxt, volumes[0]['id'],
+                                  {'key': 'value'}, False)
+        expected = [{'id': volume['id'], 'display_name': volume.display_name,
+                     'created_at': volume.created_at}
+                    for volume in volumes]
+
+        self.assertEqual(expected, db.volume_get_all(
+            self.ctxt, None, None, ['created_at'], ['asc'],
+            columns=['id', 'display_name']))
+        self.assertEqual(expected[2:], db.volume_get_all_by_project(
+            self.ctxt, 'project', volumes[1]['id'], None, ['created_at'],
+            ['asc'], columns=['id', 'display_name']))
+        self.assertEqual(expected[:1], db.volume_get_all(
+            self.ctxt, None, None, ['created_at'], ['asc'],
+            filters={'metadata': {'key': 'value'}},
+            columns=['id', 'display_name']))
+
+    def test_volume_get_all_invalid_columns(self):
+        for column in ('volume_metadata', 'name', 'invalid'):
+            self.assertRaises(exception.InvalidInput, db.volume_get_all,
+                              self.ctxt, None, None, columns=['id', column])
+
     def test_volume_get_all_by_host(self):
         volumes = []
         for i in range(3):
@@ -1684,6 +1732,23 @@ class DBAPIReservationTestCase(BaseTest):
                              self.ctxt,
                              'project1'))
 
+    def test_reservation_expire_batches(self):
+        _quota_reserve(self.ctxt, 'project1')
+        _quota_reserve(self.ctxt, 'project2')
+        with mock.patch('time.sleep') as sleep:
+            self.assertEqual(4, db.reservation_expire(self.ctxt,
+                                                      batch_size=3,
+                                                      batch_sleep=1))
+        sleep.assert_called_once_with(1)
+
+        expected = {'gigabytes': {'reserved': 0, 'in_use': 0},
+                    'volumes': {'reserved': 0, 'in_use': 0}}
+        for project_id in ('project1', 'project2'):
+            expected['project_id'] = project_id
+            self.assertEqual(expected,
+                             db.quota_usage_get_all_by_project(self.ctxt,
+                                                               project_id))
+
 
 class DBAPIQuotaClassTestCase(BaseTest):
 
@@ -1788,6 +1853,29 @@ class DBAPIQuotaTestCase(BaseTest):
                           'volumes': {'reserved': 1, 'in_use': 0}},
                          quota_usage)
 
+    def test_quota_usage_refresh(self):
+        _quota_reserve(self.ctxt, 'project1')
+        db.volume_create(self.ctxt, {'project_id': 'project1', 'size': 5})
+        sqlalchemy_api.model_query(self.ctxt, models.QuotaUsage).\
+            filter_by(project_id='project1', resource='volumes').\
+            update({'until_refresh': 0})
+        resources = {
+            'volumes': quota.ReservableResource('volumes', '_sync_volumes'),
+            'gigabytes': quota.ReservableResource('gigabytes',
+                                                  '_sync_gigabytes')}
+
+        self.assertEqual(1, db.quota_usage_refresh(self.ctxt, resources,
+                                                   None, 0))
+
+        # Only the usage due for a refresh was counted again.
+        self.assertEqual({'project_id': 'project1',
+                          'gigabytes': {'reserved': 2, 'in_use': 0},
+                          'volumes': {'reserved': 1, 'in_use': 1}},
+                         db.quota_usage_get_all_by_project(self.ctxt,
+                                                           'project1'))
+        self.assertEqual(0, db.quota_usage_refresh(self.ctxt, resources,
+                                                   None, 0))
+
     def test_quota_destroy(self):
         db.quota_create(self.ctxt, 'project1', 'resource1', 41)
         self.assertIsNone(db.quota_destroy(self.ctxt, 'project1',
@@ -2310,7 +2398,197 @@ class DBAPIImageVolumeCacheEntryTestCase(BaseTest):
         for entry in entries:
             db.image_volume_cache_delete(self.ctxt, entry['volume_id'])
 
+    def test_cache_entry_get_totals_for_host(self):
+        host = 'abc@123#poolz'
+        image_updated_at = datetime.datetime.utcnow()
+        totals = db.image_volume_cache_get_totals_for_host(self.ctxt, host)
+        self.assertEqual({'host': host, 'count': 0, 'size': 0,
+                          'inflation': 0}, totals)
+
+        for i in range(0, 3):
+            db.image_volume_cache_create(self.ctxt, host, 'image-' + str(i),
+                                         image_updated_at, 'vol-' + str(i),
+                                         i + 1)
+        db.image_volume_cache_create(self.ctxt, 'someOtherHost',
+                                     'image-12345', image_updated_at,
+                                     'vol-1234', 10)
+        totals = db.image_volume_cache_get_totals_for_host(self.ctxt, host)
+        self.assertEqual(3, totals['count'])
+        self.assertEqual(6, totals['size'])
+
+        db.image_volume_cache_delete(self.ctxt, 'vol-1')
+        db.image_volume_cache_delete(self.ctxt, 'vol-1')
+        totals = db.image_volume_cache_get_totals_for_host(self.ctxt, host)
+        self.assertEqual(2, totals['count'])
+        self.assertEqual(4, totals['size'])
+        totals = db.image_volume_cache_get_totals_for_host(self.ctxt,
+                                                           'someOtherHost')
+        self.assertEqual(1, totals['count'])
+        self.assertEqual(10, totals['size'])
+
+    def test_cache_entry_hits_and_inflation(self):
+        host = 'abc@123#poolz'
+        image_id = 'c06764d7-54b0-4471-acce-62e79452a38b'
+        image_updated_at = datetime.datetime.utcnow()
+        entry = db.image_volume_cache_create(self.ctxt, host, image_id,
+                                             image_updated_at, 'vol-1', 6)
+        self.assertEqual(0, entry['hits'])
+        self.assertEqual(0, entry['inflation'])
+
+        db.image_volume_cache_update_inflation_for_host(self.ctxt, host, 2.5)
+        # The inflation of a host never decreases
+        db.image_volume_cache_update_inflation_for_host(self.ctxt, host, 1.5)
+        totals = db.image_volume_cache_get_totals_for_host(self.ctxt, host)
+        self.assertEqual(2.5, totals['inflation'])
+
+        entry = db.image_volume_cache_get_and_update_last_used(self.ctxt,
+                                                               image_id,
+                                                               host)
+        self.assertEqual(1, entry['hits'])
+        self.assertEqual(2.5, entry['inflation'])
+        entry = db.image_volume_cache_create(self.ctxt, host, 'image-2',
+                                             image_updated_at, 'vol-2', 6)
+        self.assertEqual(2.5, entry['inflation'])
+
     def test_cache_entry_get_all_for_host_none(self):
         host = 'abc@123#poolz'
         entries = db.image_volume_cache_get_all_for_host(self.ctxt, host)
         self.assertEqual([], entries)
+
+
+class DBAPIRateLimitBucketTestCase(BaseTest):
+
+    def test_rate_limit_bucket_reserve(self):
+        self.assertEqual((10, None, 0),
+                         db.rate_limit_bucket_reserve(self.ctxt, 'key', 60,
+                                                      6.0, 20, 0, 0.0))
+        self.assertEqual((0, 6.0, 0),
+                         db.rate_limit_bucket_reserve(self.ctxt, 'key', 60,
+                                                      6.0, 1, 0, 0.0))
+        self.assertEqual((1, None, 0),
+                         db.rate_limit_bucket_reserve(self.ctxt, 'key', 60,
+                                                      6.0, 1, 0, 6.0))
+
+    def test_rate_limit_bucket_reserve_returned(self):
+        db.rate_limit_bucket_reserve(self.ctxt, 'key', 60, 6.0, 10, 0, 0.0)
+        self.assertEqual((1, None, 3),
+                         db.rate_limit_bucket_reserve(self.ctxt, 'key', 60,
+                                                      6.0, 1, 4, 0.0))
+
+    def test_rate_limit_bucket_reserve_keys(self):
+        db.rate_limit_bucket_reserve(self.ctxt, 'key1', 60, 6.0, 10, 0, 0.0)
+        self.assertEqual((10, None, 0),
+                         db.rate_limit_bucket_reserve(self.ctxt, 'key2', 60,
+                                                      6.0, 10, 0, 0.0))
+
+    def test_rate_limit_bucket_purge(self):
+        db.rate_limit_bucket_reserve(self.ctxt, 'key1', 60, 6.0, 1, 0, 0.0)
+        db.rate_limit_bucket_reserve(self.ctxt, 'key2', 60, 6.0, 2, 0, 0.0)
+        # The bucket of key1 is empty after 6 seconds, key2's after 12
+        self.assertEqual(1, db.rate_limit_bucket_purge(self.ctxt, 6.0))
+        session = sqlalchemy_api.get_session()
+        self.assertEqual(['key2'], [
+            bucket.key for bucket in
+            session.query(models.RateLimitBucket)])
+
+
+class DBAPIUsageCounterTestCase(BaseTest):
+
+    def _usage(self, project_id='project1', volume_type_id=None):
+        return {'volumes': db.volume_data_get_for_project(self.ctxt,
+                                                          project_id),
+                'volumes_type': sqlalchemy_api._volume_data_get_for_project(
+                    self.ctxt, project_id, volume_type_id=volume_type_id),
+                'snapshots': db.snapshot_data_get_for_project(
+                    self.ctxt, project_id, volume_type_id=volume_type_id),
+                'backups': sqlalchemy_api._backup_data_get_for_project(
+                    self.ctxt, project_id)}
+
+    def test_volume_counters(self):
+        volume = db.volume_create(self.ctxt, {'project_id': 'project1',
+                                              'volume_type_id': 'type1',
+                                              'size': 1})
+        db.volume_create(self.ctxt, {'project_id': 'project1', 'size': 2})
+        usage = self._usage(volume_type_id='type1')
+        self.assertEqual((2, 3), usage['volumes'])
+        self.assertEqual((1, 1), usage['volumes_type'])
+
+        db.volume_update(self.ctxt, volume.id, {'size': 5})
+        usage = self._usage(volume_type_id='type1')
+        self.assertEqual((2, 7), usage['volumes'])
+        self.assertEqual((1, 5), usage['volumes_type'])
+
+        db.volume_update(self.ctxt, volume.id, {'volume_type_id': 'type2'})
+        self.assertEqual((0, 0), self._usage(volume_type_id='type1')[
+            'volumes_type'])
+        self.assertEqual((1, 5), self._usage(volume_type_id='type2')[
+            'volumes_type'])
+
+        db.volume_destroy(self.ctxt, volume.id)
+        db.volume_destroy(self.ctxt, volume.id)
+        self.assertEqual((1, 2), self._usage()['volumes'])
+        self.assertEqual([], db.usage_counters_verify(self.ctxt))
+
+    def test_volume_counters_transfer(self):
+        volume = db.volume_create(self.ctxt, {'project_id': 'project1',
+                                              'status': 'available',
+                                              'size': 1})
+        transfer = db.transfer_create(self.ctxt, {'volume_id': volume.id,
+                                                  'display_name': 'transfer',
+                                                  'salt': 'salt',
+                                                  'crypt_hash': 'hash'})
+        db.transfer_accept(self.ctxt, transfer.id, 'user2', 'project2')
+        self.assertEqual((0, 0), self._usage()['volumes'])
+        self.assertEqual((1, 1), self._usage('project2')['volumes'])
+
+    def test_snapshot_and_backup_counters(self):
+        db.volume_create(self.ctxt, {'id': 1, 'project_id': 'project1',
+                                     'size': 4})
+        snapshot = db.snapshot_create(self.ctxt, {'volume_id': 1,
+                                                  'project_id': 'project1',
+                                                  'volume_type_id': 'type1',
+                                                  'volume_size': 4})
+        backup = db.backup_create(self.ctxt, {'volume_id': 1,
+                                              'project_id': 'project1',
+                                              'size': 4})
+        usage = self._usage(volume_type_id='type1')
+        self.assertEqual((1, 4), usage['snapshots'])
+        self.assertEqual((1, 4), usage['backups'])
+
+        db.snapshot_destroy(self.ctxt, snapshot.id)
+        db.backup_destroy(self.ctxt, backup.id)
+        usage = self._usage(volume_type_id='type1')
+        self.assertEqual((0, 0), usage['snapshots'])
+        self.assertEqual((0, 0), usage['backups'])
+
+    def test_usage_counters_rebuild(self):
+        db.volume_create(self.ctxt, {'project_id': 'project1', 'size': 1})
+        db.volume_create(self.ctxt, {'project_id': 'project2', 'size': 2})
+        session = sqlalchemy_api.get_session()
+        with session.begin():
+            session.query(models.UsageCounter).\
+                filter_by(project_id='project1').\
+                update({'in_use': 3, 'gigabytes': 10})
+
+        expected = [{'project_id': 'project1',
+                     'resource': 'volumes',
+                     'volume_type_id': '',
+                     'in_use': 3,
+                     'gigabytes': 10,
+                     'actual_in_use': 1,
+                     'actual_gigabytes': 1}]
+        self.assertEqual(expected, db.usage_counters_verify(self.ctxt))
+        self.assertEqual([], db.usage_counters_verify(self.ctxt,
+                                                      'project2'))
+        self.assertEqual(expected, db.usage_counters_rebuild(self.ctxt))
+        self.assertEqual([], db.usage_counters_verify(self.ctxt))
+        self.assertEqual((1, 1), self._usage()['volumes'])
+
+    def test_usage_counters_rebuild_missing(self):
+        db.volume_create(self.ctxt, {'project_id': 'project1', 'size': 1})
+        session = sqlalchemy_api.get_session()
+        with session.begin():
+            session.query(models.UsageCounter).delete()
+
+        self.assertEqual(1, len(db.usage_counters_rebuild(self.ctxt)))
+        self.assertEqual((1, 1), self._usage()['volumes'])
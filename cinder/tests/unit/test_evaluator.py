@@ -13,6 +13,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
+import mock
+
 from cinder import exception
 from cinder.scheduler.evaluator import evaluator
 from cinder import test
@@ -137,3 +141,29 @@ class EvaluatorTestCase(test.TestCase):
         self.assertRaises(exception.EvaluatorParseException,
                           evaluator.evaluate,
                           "7 / 0")
+
+    def test_compiled_expression_reused(self):
+        expression = "stats.iops * 2 + 1"
+        first = evaluator.evaluate(expression, stats={'iops': 10})
+        with mock.patch.object(evaluator._parser, 'parseString') as parse:
+            second = evaluator.evaluate(expression, stats={'iops': 20})
+            self.assertFalse(parse.called)
+        self.assertEqual(21, first)
+        self.assertEqual(41, second)
+
+    def test_bad_expression_cached(self):
+        self.assertRaises(exception.EvaluatorParseException,
+                          evaluator.evaluate, "1 +* 1")
+        with mock.patch.object(evaluator._parser, 'parseString') as parse:
+            self.assertRaises(exception.EvaluatorParseException,
+                              evaluator.evaluate, "1 +* 1")
+            self.assertFalse(parse.called)
+
+    @mock.patch.object(evaluator, '_CACHE_SIZE', 2)
+    @mock.patch.object(evaluator, '_cache', collections.OrderedDict())
+    def test_cache_lru(self):
+        evaluator.evaluate("1 + 1")
+        evaluator.evaluate("1 + 2")
+        evaluator.evaluate("1 + 1")
+        evaluator.evaluate("1 + 3")
+        self.assertEqual(["1 + 1", "1 + 3"], list(evaluator._cache))
@@ -16,10 +16,13 @@
 """Unit tests for image utils."""
 
 import math
+import os
+import tempfile
 
 import mock
 from oslo_concurrency import processutils
 from oslo_utils import units
+import six
 
 from cinder import exception
 from cinder.image import image_utils
@@ -272,6 +275,139 @@ class TestFetch(test.TestCase):
             .assert_called_once_with(None, None, None))
 
 
+class TestFetchCached(test.TestCase):
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.download_cache.get_cache')
+    def test_cached(self, mock_get_cache, mock_fetch):
+        ctxt = mock.sentinel.context
+        image_service = mock.sentinel.image_service
+        image_id = mock.sentinel.image_id
+        image_meta = {'checksum': mock.sentinel.checksum}
+        cache = mock_get_cache.return_value
+        cache.fetch.return_value = True
+
+        image_utils.fetch_cached(ctxt, image_service, image_id, 'test_path',
+                                 image_meta=image_meta)
+
+        cache.fetch.assert_called_once_with(ctxt, image_service, image_id,
+                                            image_meta, 'test_path')
+        self.assertFalse(mock_fetch.called)
+
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.download_cache.get_cache')
+    def test_not_cached(self, mock_get_cache, mock_fetch):
+        ctxt = mock.sentinel.context
+        image_service = mock.sentinel.image_service
+        image_id = mock.sentinel.image_id
+        cache = mock_get_cache.return_value
+        cache.fetch.return_value = False
+
+        image_utils.fetch_cached(ctxt, image_service, image_id, 'test_path',
+                                 mock.sentinel.user_id,
+                                 mock.sentinel.project_id,
+                                 image_meta={})
+
+        self.assertFalse(cache.fetch.called)
+        mock_fetch.assert_called_once_with(ctxt, image_service, image_id,
+                                           'test_path', mock.sentinel.user_id,
+                                           mock.sentinel.project_id)
+
+
+class TestRawImageWriter(test.TestCase):
+    def setUp(self):
+        super(TestRawImageWriter, self).setUp()
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        self.fd = os.open(self.path, os.O_WRONLY)
+        self.addCleanup(os.close, self.fd)
+
+    @mock.patch('cinder.image.image_utils.RAW_IMAGE_WRITE_SIZE', 1024)
+    @mock.patch('cinder.image.image_utils.RAW_IMAGE_HEADER_SIZE', 512)
+    def test_write(self):
+        data = b''.join(six.int2byte(i % 256) for i in range(5000))
+        writer = image_utils.RawImageWriter(mock.sentinel.image_id, self.fd)
+
+        lengths = []
+
+        def write(fd, data):
+            lengths.append(len(data))
+            return os_write(fd, data)
+
+        os_write = os.write
+        with mock.patch('os.write', side_effect=write), \
+                mock.patch.object(image_utils.tpool, 'execute',
+                                  side_effect=lambda f, *a: f(*a)) as execute:
+            for i in range(0, len(data), 300):
+                writer.write(data[i:i + 300])
+            # The data is written in multiples of the write size
+            self.assertEqual([1024] * 4, lengths)
+            writer.close()
+
+        # The writes and the final sync run in native threads
+        self.assertEqual(6, execute.call_count)
+        execute.assert_called_with(os.fsync, self.fd)
+        self.assertEqual(len(data), writer.size)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(data, f.read())
+
+    def test_not_raw(self):
+        writer = image_utils.RawImageWriter(mock.sentinel.image_id, self.fd)
+        writer.write(b'QFI\xfb' + b'\0' * 60)
+
+        self.assertRaises(exception.ImageNotRaw, writer.close)
+        self.assertEqual(0, os.path.getsize(self.path))
+
+    def test_too_big(self):
+        writer = image_utils.RawImageWriter(mock.sentinel.image_id, self.fd,
+                                            max_size=units.Mi)
+
+        self.assertRaises(exception.ImageUnacceptable, writer.write,
+                          b'\0' * (4 * units.Mi))
+
+    def test_probe_image_format(self):
+        self.assertIsNone(image_utils.probe_image_format(b'\0' * 512))
+        self.assertEqual('vmdk', image_utils.probe_image_format(
+            b'# Disk DescriptorFile\n'))
+        self.assertEqual('vdi', image_utils.probe_image_format(
+            b'\0' * 0x40 + b'\x7f\x10\xda\xbe'))
+
+
+class TestFetchRawToVolume(test.TestCase):
+    def _download(self, context, image_id, data):
+        data.write(b'\0' * 1024)
+
+    @mock.patch('cinder.image.image_utils.utils.temporary_chown')
+    @mock.patch('os.access', return_value=True)
+    def test_defaults(self, mock_access, mock_chown):
+        fd, dest = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, dest)
+        image_service = mock.Mock()
+        image_service.download.side_effect = self._download
+
+        image_utils.fetch_raw_to_volume(mock.sentinel.context, image_service,
+                                        mock.sentinel.image_id, dest, size=1)
+
+        self.assertEqual(1024, os.path.getsize(dest))
+        self.assertFalse(mock_chown.called)
+
+    @mock.patch('cinder.image.image_utils.utils.temporary_chown')
+    @mock.patch('os.access', return_value=False)
+    def test_not_writable(self, mock_access, mock_chown):
+        fd, dest = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, dest)
+        image_service = mock.Mock()
+        image_service.download.side_effect = self._download
+
+        image_utils.fetch_raw_to_volume(mock.sentinel.context, image_service,
+                                        mock.sentinel.image_id, dest)
+
+        mock_chown.assert_called_once_with(dest)
+        self.assertEqual(1024, os.path.getsize(dest))
+
+
 class TestVerifyImage(test.TestCase):
     @mock.patch('cinder.image.image_utils.qemu_img_info')
     @mock.patch('cinder.image.image_utils.fileutils')
@@ -423,6 +559,15 @@ class TestTemporaryDir(test.TestCase):
 
 
 class TestUploadVolume(test.TestCase):
+    def _assert_uploaded(self, image_service, ctxt, image_id, image_file):
+        image_service.update.assert_called_once_with(ctxt, image_id, {},
+                                                     mock.ANY)
+        reader = image_service.update.call_args[0][3]
+        self.assertIsInstance(reader, image_utils.ImageUploadReader)
+        self.assertEqual(image_file, reader.image_file)
+        self.assertEqual('image_upload.end',
+                         self.notifier.notifications[-1]['event_type'])
+
     @mock.patch('cinder.image.image_utils.CONF')
     @mock.patch('six.moves.builtins.open')
     @mock.patch('cinder.image.image_utils.qemu_img_info')
@@ -453,9 +598,8 @@ class TestUploadVolume(test.TestCase):
         mock_info.assert_called_with(temp_file, run_as_root=True)
         self.assertEqual(2, mock_info.call_count)
         mock_open.assert_called_once_with(temp_file, 'rb')
-        image_service.update.assert_called_once_with(
-            ctxt, image_meta['id'], {},
-            mock_open.return_value.__enter__.return_value)
+        self._assert_uploaded(image_service, ctxt, image_meta['id'],
+                              mock_open.return_value.__enter__.return_value)
 
     @mock.patch('cinder.image.image_utils.utils.temporary_chown')
     @mock.patch('cinder.image.image_utils.CONF')
@@ -482,9 +626,8 @@ class TestUploadVolume(test.TestCase):
         self.assertFalse(mock_info.called)
         mock_chown.assert_called_once_with(volume_path)
         mock_open.assert_called_once_with(volume_path)
-        image_service.update.assert_called_once_with(
-            ctxt, image_meta['id'], {},
-            mock_open.return_value.__enter__.return_value)
+        self._assert_uploaded(image_service, ctxt, image_meta['id'],
+                              mock_open.return_value.__enter__.return_value)
 
     @mock.patch('cinder.image.image_utils.utils.temporary_chown')
     @mock.patch('cinder.image.image_utils.CONF')
@@ -510,9 +653,8 @@ class TestUploadVolume(test.TestCase):
         self.assertFalse(mock_convert.called)
         self.assertFalse(mock_info.called)
         mock_open.assert_called_once_with(volume_path, 'rb')
-        image_service.update.assert_called_once_with(
-            ctxt, image_meta['id'], {},
-            mock_open.return_value.__enter__.return_value)
+        self._assert_uploaded(image_service, ctxt, image_meta['id'],
+                              mock_open.return_value.__enter__.return_value)
 
     @mock.patch('cinder.image.image_utils.CONF')
     @mock.patch('six.moves.builtins.open')
@@ -545,6 +687,52 @@ class TestUploadVolume(test.TestCase):
         self.assertFalse(image_service.update.called)
 
 
+class TestImageUploadReader(test.TestCase):
+    @mock.patch('cinder.image.image_utils.UPLOAD_CHUNK_SIZE', 1000)
+    def test_read(self):
+        data = os.urandom(5500)
+        reader = image_utils.ImageUploadReader(mock.sentinel.context,
+                                               'test_id', six.BytesIO(data))
+
+        chunks = []
+        for chunk in iter(lambda: reader.read(333), b''):
+            chunks.append(chunk)
+        reader.close()
+
+        self.assertEqual(data, b''.join(chunks))
+        self.assertEqual(5500, reader.size)
+
+    @mock.patch('cinder.image.image_utils.UPLOAD_PROGRESS_INTERVAL', 0)
+    def test_read_all_and_notify(self):
+        data = os.urandom(5500)
+        image_file = six.BytesIO(data)
+        reader = image_utils.ImageUploadReader(mock.sentinel.context,
+                                               'test_id', image_file)
+
+        # Other file methods are passed to the file
+        self.assertEqual(0, reader.tell())
+        self.assertEqual(data, reader.read())
+        self.assertEqual(b'', reader.read())
+        reader.close()
+        reader.notify('end')
+
+        events = [msg['event_type'] for msg in self.notifier.notifications]
+        self.assertEqual('image_upload.progress', events[0])
+        self.assertEqual('image_upload.end', events[-1])
+        payload = self.notifier.notifications[-1]['payload']
+        self.assertEqual('test_id', payload['image_id'])
+        self.assertEqual(5500, payload['size'])
+
+    def test_read_error(self):
+        image_file = mock.Mock()
+        image_file.read.side_effect = IOError()
+        reader = image_utils.ImageUploadReader(mock.sentinel.context,
+                                               'test_id', image_file)
+
+        self.assertRaises(IOError, reader.read, 100)
+        reader.close()
+
+
 class TestFetchToVhd(test.TestCase):
     @mock.patch('cinder.image.image_utils.fetch_to_volume_format')
     def test_defaults(self, mock_fetch_to):
@@ -1156,6 +1344,128 @@ class TestFetchToVolumeFormat(test.TestCase):
         mock_convert.assert_called_once_with(tmp, dest, volume_format,
                                              run_as_root=run_as_root)
 
+    @mock.patch('cinder.image.image_utils.fetch_raw_to_volume')
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    @mock.patch('cinder.image.image_utils.temporary_file')
+    @mock.patch('cinder.image.image_utils.CONF')
+    def test_stream_raw(self, mock_conf, mock_temp, mock_info, mock_fetch,
+                        mock_convert, mock_fetch_raw):
+        ctxt = mock.sentinel.context
+        image_service = mock.Mock(temp_images=None)
+        image_service.show.return_value = {'disk_format': 'raw',
+                                           'container_format': 'bare',
+                                           'size': units.Gi}
+        image_id = mock.sentinel.image_id
+        dest = mock.sentinel.dest
+        mock_conf.image_stream_raw_images = True
+
+        output = image_utils.fetch_to_volume_format(
+            ctxt, image_service, image_id, dest, 'raw',
+            mock.sentinel.blocksize, size=1)
+
+        self.assertIsNone(output)
+        mock_fetch_raw.assert_called_once_with(ctxt, image_service, image_id,
+                                               dest, size=1)
+        self.assertFalse(mock_temp.called)
+        self.assertFalse(mock_fetch.called)
+        self.assertFalse(mock_convert.called)
+
+    @mock.patch('cinder.image.image_utils.fetch_raw_to_volume')
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.is_xenserver_image',
+                return_value=False)
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    @mock.patch('cinder.image.image_utils.temporary_file')
+    @mock.patch('cinder.image.image_utils.CONF')
+    def test_stream_raw_not_raw(self, mock_conf, mock_temp, mock_info,
+                                mock_fetch, mock_is_xen, mock_convert,
+                                mock_fetch_raw):
+        ctxt = mock.sentinel.context
+        image_service = mock.Mock(temp_images=None)
+        image_service.show.return_value = {'disk_format': 'raw',
+                                           'container_format': 'bare',
+                                           'size': units.Gi}
+        image_id = mock.sentinel.image_id
+        dest = mock.sentinel.dest
+        mock_conf.image_stream_raw_images = True
+        mock_fetch_raw.side_effect = exception.ImageNotRaw(
+            image_id=image_id, image_format='qcow2')
+
+        data = mock_info.return_value
+        data.file_format = 'raw'
+        data.backing_file = None
+        data.virtual_size = 1234
+        tmp = mock_temp.return_value.__enter__.return_value
+
+        output = image_utils.fetch_to_volume_format(
+            ctxt, image_service, image_id, dest, 'raw',
+            mock.sentinel.blocksize)
+
+        self.assertIsNone(output)
+        mock_fetch.assert_called_once_with(ctxt, image_service, image_id,
+                                           tmp, None, None)
+        mock_convert.assert_called_once_with(tmp, dest, 'raw',
+                                             run_as_root=True)
+
+    @mock.patch('cinder.volume.throttling.Throttle.get_default',
+                return_value=throttling.Throttle(['fake_throttle']))
+    @mock.patch('cinder.image.image_utils.fetch_raw_to_volume')
+    @mock.patch('cinder.image.image_utils.convert_image')
+    @mock.patch('cinder.image.image_utils.is_xenserver_image',
+                return_value=False)
+    @mock.patch('cinder.image.image_utils.fetch')
+    @mock.patch('cinder.image.image_utils.qemu_img_info')
+    @mock.patch('cinder.image.image_utils.temporary_file')
+    @mock.patch('cinder.image.image_utils.CONF')
+    def test_stream_raw_throttled(self, mock_conf, mock_temp, mock_info,
+                                  mock_fetch, mock_is_xen, mock_convert,
+                                  mock_fetch_raw, mock_throttle):
+        ctxt = mock.sentinel.context
+        image_service = mock.Mock(temp_images=None)
+        image_service.show.return_value = {'disk_format': 'raw',
+                                           'container_format': 'bare',
+                                           'size': units.Gi}
+        image_id = mock.sentinel.image_id
+        dest = mock.sentinel.dest
+        mock_conf.image_stream_raw_images = True
+
+        data = mock_info.return_value
+        data.file_format = 'raw'
+        data.backing_file = None
+        data.virtual_size = 1234
+        tmp = mock_temp.return_value.__enter__.return_value
+
+        output = image_utils.fetch_to_volume_format(
+            ctxt, image_service, image_id, dest, 'raw',
+            mock.sentinel.blocksize)
+
+        self.assertIsNone(output)
+        # The image is converted, with the throttling of the conversion
+        self.assertFalse(mock_fetch_raw.called)
+        mock_fetch.assert_called_once_with(ctxt, image_service, image_id,
+                                           tmp, None, None)
+        mock_convert.assert_called_once_with(tmp, dest, 'raw',
+                                             run_as_root=True)
+
+    @mock.patch('cinder.image.image_utils.fetch_raw_to_volume')
+    @mock.patch('cinder.image.image_utils.CONF')
+    def test_stream_raw_size_error(self, mock_conf, mock_fetch_raw):
+        image_service = mock.Mock(temp_images=None)
+        image_service.show.return_value = {'disk_format': 'raw',
+                                           'container_format': 'bare',
+                                           'size': 2 * units.Gi}
+        mock_conf.image_stream_raw_images = True
+
+        self.assertRaises(exception.ImageUnacceptable,
+                          image_utils.fetch_to_volume_format,
+                          mock.sentinel.context, image_service,
+                          mock.sentinel.image_id, mock.sentinel.dest, 'raw',
+                          mock.sentinel.blocksize, size=1)
+        self.assertFalse(mock_fetch_raw.called)
+
 
 class TestXenserverUtils(test.TestCase):
     @mock.patch('cinder.image.image_utils.is_xenserver_format')
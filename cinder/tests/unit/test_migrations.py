@@ -19,6 +19,7 @@ properly both upgrading and downgrading, and that no data loss occurs
 if possible.
 """
 
+import datetime
 import os
 import uuid
 
@@ -28,6 +29,7 @@ from oslo_db.sqlalchemy import test_base
 from oslo_db.sqlalchemy import test_migrations
 from oslo_db.sqlalchemy import utils as db_utils
 import sqlalchemy
+from sqlalchemy.dialects import postgresql
 
 from cinder.db import migration
 import cinder.db.sqlalchemy.migrate_repo
@@ -40,6 +42,7 @@ class MigrationsMixin(test_migrations.WalkVersionsMixin):
     TIME_TYPE = sqlalchemy.types.DATETIME
     INTEGER_TYPE = sqlalchemy.types.INTEGER
     VARCHAR_TYPE = sqlalchemy.types.VARCHAR
+    DOUBLE_TYPE = sqlalchemy.types.Float
 
     @property
     def INIT_VERSION(self):
@@ -725,6 +728,87 @@ class MigrationsMixin(test_migrations.WalkVersionsMixin):
         self.assertIsInstance(volume_type_projects.c.id.type,
                               self.INTEGER_TYPE)
 
+    def _check_064(self, engine, data):
+        """Test that adding the pagination indexes works correctly."""
+        for table_name in ('volumes', 'snapshots', 'backups'):
+            table = db_utils.get_table(engine, table_name)
+            index_name = '%s_deleted_created_at_id_idx' % table_name
+            index_columns = []
+            for idx in table.indexes:
+                if idx.name == index_name:
+                    index_columns = idx.columns.keys()
+                    break
+
+            self.assertEqual(['deleted', 'created_at', 'id'], index_columns)
+
+    def _check_065(self, engine, data):
+        """Test adding rate_limit_buckets table."""
+        self.assertTrue(engine.dialect.has_table(engine.connect(),
+                                                 'rate_limit_buckets'))
+        buckets = db_utils.get_table(engine, 'rate_limit_buckets')
+        self.assertIsInstance(buckets.c.key.type, self.VARCHAR_TYPE)
+        self.assertIsInstance(buckets.c.water_level.type, self.DOUBLE_TYPE)
+        self.assertIsInstance(buckets.c.last_leak.type, self.DOUBLE_TYPE)
+
+    def _pre_upgrade_066(self, engine):
+        volumes = db_utils.get_table(engine, 'volumes')
+        for volume_type_id, size, deleted in ((None, 1, False),
+                                              (None, 2, False),
+                                              ('type066', 4, False),
+                                              (None, 8, True)):
+            volumes.insert().values(id=str(uuid.uuid4()),
+                                    project_id='project066',
+                                    volume_type_id=volume_type_id,
+                                    size=size,
+                                    deleted=deleted).execute()
+
+    def _check_066(self, engine, data):
+        """Test adding usage_counters table."""
+        self.assertTrue(engine.dialect.has_table(engine.connect(),
+                                                 'usage_counters'))
+        counters = db_utils.get_table(engine, 'usage_counters')
+        self.assertIsInstance(counters.c.project_id.type,
+                              self.VARCHAR_TYPE)
+        self.assertIsInstance(counters.c.in_use.type, self.INTEGER_TYPE)
+        self.assertIsInstance(counters.c.gigabytes.type, self.INTEGER_TYPE)
+
+        rows = counters.select().\
+            where(counters.c.project_id == 'project066').\
+            execute().fetchall()
+        usage = {(row['resource'], row['volume_type_id']):
+                 (row['in_use'], row['gigabytes']) for row in rows}
+        self.assertEqual({('volumes', ''): (2, 3),
+                          ('volumes', 'type066'): (1, 4)}, usage)
+
+    def _pre_upgrade_067(self, engine):
+        entries = db_utils.get_table(engine, 'image_volume_cache_entries')
+        for size in (1, 2, 4):
+            entries.insert().values(host='host067',
+                                    image_id=str(uuid.uuid4()),
+                                    image_updated_at=datetime.datetime.now(),
+                                    volume_id=str(uuid.uuid4()),
+                                    size=size).execute()
+
+    def _check_067(self, engine, data):
+        """Test adding image_volume_cache_hosts table."""
+        entries = db_utils.get_table(engine, 'image_volume_cache_entries')
+        self.assertIsInstance(entries.c.hits.type, self.INTEGER_TYPE)
+        self.assertIsInstance(entries.c.inflation.type, self.DOUBLE_TYPE)
+
+        self.assertTrue(engine.dialect.has_table(engine.connect(),
+                                                 'image_volume_cache_hosts'))
+        hosts = db_utils.get_table(engine, 'image_volume_cache_hosts')
+        self.assertIsInstance(hosts.c.host.type, self.VARCHAR_TYPE)
+        self.assertIsInstance(hosts.c.count.type, self.INTEGER_TYPE)
+        self.assertIsInstance(hosts.c.size.type, self.INTEGER_TYPE)
+        self.assertIsInstance(hosts.c.inflation.type, self.DOUBLE_TYPE)
+
+        row = hosts.select().\
+            where(hosts.c.host == 'host067').\
+            execute().first()
+        self.assertEqual(3, row['count'])
+        self.assertEqual(7, row['size'])
+
     def test_walk_versions(self):
         self.walk_versions(False, False)
 
@@ -738,6 +822,7 @@ class TestMysqlMigrations(test_base.MySQLOpportunisticTestCase,
                           MigrationsMixin):
 
     BOOL_TYPE = sqlalchemy.dialects.mysql.TINYINT
+    DOUBLE_TYPE = sqlalchemy.dialects.mysql.DOUBLE
 
     def test_mysql_innodb(self):
         """Test that table creation on mysql only builds InnoDB tables."""
@@ -767,3 +852,4 @@ class TestMysqlMigrations(test_base.MySQLOpportunisticTestCase,
 class TestPostgresqlMigrations(test_base.PostgreSQLOpportunisticTestCase,
                                MigrationsMixin):
     TIME_TYPE = sqlalchemy.types.TIMESTAMP
+    DOUBLE_TYPE = postgresql.DOUBLE_PRECISION
@@ -1316,7 +1316,8 @@ class DbQuotaDriverTestCase(test.TestCase):
 
     def _stub_quota_reserve(self):
         def fake_quota_reserve(context, resources, quotas, deltas, expire,
-                               until_refresh, max_age, project_id=None):
+                               until_refresh, max_age, project_id=None,
+                               async_refresh=False):
             self.calls.append(('quota_reserve', expire, until_refresh,
                                max_age))
             return ['resv-1', 'resv-2', 'resv-3']
@@ -1433,6 +1434,9 @@ class FakeSession(object):
     def __exit__(self, exc_type, exc_value, exc_traceback):
         return False
 
+    def execute(self, *args, **kwargs):
+        pass
+
 
 class FakeUsage(sqa_models.QuotaUsage):
     def save(self, *args, **kwargs):
@@ -1478,7 +1482,8 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         def fake_get_session():
             return FakeSession()
 
-        def fake_get_quota_usages(context, session, project_id):
+        def fake_get_quota_usages(context, session, project_id,
+                                  resources=None):
             return self.usages.copy()
 
         def fake_quota_usage_create(context, project_id, resource, in_use,
@@ -1677,6 +1682,49 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
                                        usage_id=self.usages['gigabytes'],
                                        delta=2 * 1024), ])
 
+    def test_quota_reserve_until_refresh_async(self):
+        self.init_usage('test_project', 'volumes', 3, 0, until_refresh=1)
+        self.init_usage('test_project', 'gigabytes', 3, 0, until_refresh=1)
+        context = FakeContext('test_project', 'test_class')
+        quotas = dict(volumes=5, gigabytes=10 * 1024, )
+        deltas = dict(volumes=2, gigabytes=2 * 1024, )
+        for _i in range(2):
+            sqa_api.quota_reserve(context, self.resources, quotas, deltas,
+                                  self.expire, 5, 0, async_refresh=True)
+
+        # The usages stay flagged for quota_usage_refresh.
+        self.assertEqual(set(), self.sync_called)
+        self.compare_usage(self.usages, [dict(resource='volumes',
+                                              project_id='test_project',
+                                              in_use=3,
+                                              reserved=4,
+                                              until_refresh=0),
+                                         dict(resource='gigabytes',
+                                              project_id='test_project',
+                                              in_use=3,
+                                              reserved=4 * 1024,
+                                              until_refresh=0), ])
+
+    def test_quota_reserve_negative_in_use_async(self):
+        self.init_usage('test_project', 'volumes', -1, 0, until_refresh=1)
+        self.init_usage('test_project', 'gigabytes', -1, 0, until_refresh=1)
+        context = FakeContext('test_project', 'test_class')
+        quotas = dict(volumes=5,
+                      gigabytes=10 * 1024, )
+        deltas = dict(volumes=2,
+                      gigabytes=2 * 1024, )
+        sqa_api.quota_reserve(context, self.resources, quotas, deltas,
+                              self.expire, 5, 0, async_refresh=True)
+
+        # A desync is still healed before checking the quotas.
+        self.assertEqual(set(['volumes', 'gigabytes']), self.sync_called)
+        self.compare_usage(self.usages, [dict(resource='volumes',
+                                              in_use=2,
+                                              until_refresh=5),
+                                         dict(resource='gigabytes',
+                                              in_use=2,
+                                              until_refresh=5), ])
+
     def test_quota_reserve_max_age(self):
         max_age = 3600
         record_created = (timeutils.utcnow() -
@@ -377,6 +377,35 @@ class RBDTestCase(test.TestCase):
         proxy.create_snap.assert_called_with(*args)
         proxy.protect_snap.assert_called_with(*args)
 
+    @common_mocks
+    def test_get_changed_extents(self):
+        proxy = self.mock_proxy.return_value
+        proxy.__enter__.return_value = proxy
+        proxy.size.return_value = 4 * units.Mi
+
+        def _fake_diff_iterate(offset, length, from_snapshot, iterate_cb):
+            iterate_cb(0, units.Mi, True)
+            iterate_cb(3 * units.Mi, units.Mi, False)
+
+        proxy.diff_iterate.side_effect = _fake_diff_iterate
+        volume = dict(self.volume, id='fake-volume-id')
+        snapshot = dict(self.snapshot, volume_id='fake-volume-id')
+
+        extents = self.driver.get_changed_extents(None, snapshot, volume)
+
+        self.assertEqual([(0, units.Mi), (3 * units.Mi, units.Mi)], extents)
+        proxy.diff_iterate.assert_called_once_with(
+            0, 4 * units.Mi, str(self.snapshot_name), mock.ANY)
+
+    @common_mocks
+    def test_get_changed_extents_other_device(self):
+        volume = dict(self.volume, id='fake-volume-id')
+        snapshot = dict(self.snapshot, volume_id='other-volume-id')
+
+        self.assertIsNone(
+            self.driver.get_changed_extents(None, snapshot, volume))
+        self.assertFalse(self.mock_proxy.called)
+
     @common_mocks
     def test_delete_snapshot(self):
         proxy = self.mock_proxy.return_value
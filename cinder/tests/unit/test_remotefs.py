@@ -295,6 +295,53 @@ class RemoteFsSnapDriverTestCase(test.TestCase):
                                                  external=False)
             self.assertEqual(mock.sentinel.ret_val, ret_val)
 
+    def test_get_changed_extents(self):
+        snap_file = os.path.basename(self._FAKE_SNAPSHOT_PATH)
+        later_file = self._FAKE_VOLUME_NAME + '.later-snap'
+        snapshot = dict(self._FAKE_SNAPSHOT,
+                        volume_id=self._FAKE_VOLUME_ID)
+        self._driver._local_path_volume_info = mock.Mock(
+            return_value=mock.sentinel.fake_info_path)
+        self._driver._read_info_file = mock.Mock(
+            return_value={'active': later_file,
+                          self._FAKE_SNAPSHOT_ID: snap_file,
+                          'later-snap': later_file})
+        self._driver._local_volume_dir = mock.Mock(
+            return_value=self._FAKE_MNT_POINT)
+        self._driver._get_backing_chain_for_path = mock.Mock(
+            return_value=[{'filename': later_file},
+                          {'filename': snap_file},
+                          {'filename': self._FAKE_VOLUME_NAME}])
+        self._driver._execute.return_value = (
+            '[{"start": 0, "length": 65536, "depth": 2, "zero": false,'
+            '  "data": true},'
+            ' {"start": 65536, "length": 65536, "depth": 1, "zero": false,'
+            '  "data": true},'
+            ' {"start": 131072, "length": 65536, "depth": 0, "zero": true,'
+            '  "data": false},'
+            ' {"start": 196608, "length": 65536, "depth": 2, "zero": true,'
+            '  "data": false}]', '')
+
+        extents = self._driver.get_changed_extents(
+            self._FAKE_CONTEXT, snapshot, self._FAKE_VOLUME)
+
+        self.assertEqual([(65536, 131072)], extents)
+        self._driver._execute.assert_called_once_with(
+            'qemu-img', 'map', '--output=json',
+            os.path.join(self._FAKE_MNT_POINT, later_file),
+            run_as_root=self._driver._execute_as_root)
+
+    def test_get_changed_extents_deleted_snapshot(self):
+        snapshot = dict(self._FAKE_SNAPSHOT,
+                        volume_id=self._FAKE_VOLUME_ID)
+        self._driver._local_path_volume_info = mock.Mock(
+            return_value=mock.sentinel.fake_info_path)
+        self._driver._read_info_file = mock.Mock(
+            return_value={'active': self._FAKE_VOLUME_NAME})
+
+        self.assertIsNone(self._driver.get_changed_extents(
+            self._FAKE_CONTEXT, snapshot, self._FAKE_VOLUME))
+
     def test_locked_volume_id_operation(self):
         mock_volume = {'id': self._FAKE_VOLUME_ID}
 
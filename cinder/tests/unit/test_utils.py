@@ -945,6 +945,30 @@ class InvalidFilterTestCase(test.TestCase):
         self.assertEqual(allowed_search_options, tuple(sorted(filters.keys())))
 
 
+class PaginationCursorTestCase(test.TestCase):
+    def test_encode_decode(self):
+        values = {'id': 'fake_id',
+                  'size': 1,
+                  'display_name': None,
+                  'created_at': datetime.datetime(2015, 10, 1, 12, 30, 5,
+                                                  123456)}
+        cursor = utils.encode_pagination_cursor(values)
+        self.assertTrue(cursor.startswith(utils.PAGINATION_CURSOR_PREFIX))
+        self.assertNotIn('=', cursor)
+        self.assertEqual(values, utils.decode_pagination_cursor(cursor))
+
+    def test_decode_not_a_cursor(self):
+        self.assertIsNone(utils.decode_pagination_cursor(
+            '5b3c4a8e-2d45-4e4a-9b0b-f1f2c9a5a1c7'))
+        self.assertIsNone(utils.decode_pagination_cursor(None))
+
+    def test_decode_invalid_cursor(self):
+        for token in ('!!', 'bm90IGpzb24', 'WzFd', 'eyJhIjogeyJiIjogMX19'):
+            self.assertRaises(exception.InvalidInput,
+                              utils.decode_pagination_cursor,
+                              utils.PAGINATION_CURSOR_PREFIX + token)
+
+
 class IsBlkDeviceTestCase(test.TestCase):
     @mock.patch('stat.S_ISBLK', return_value=True)
     @mock.patch('os.stat')
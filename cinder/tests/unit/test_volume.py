@@ -7762,6 +7762,132 @@ class ImageVolumeCacheTestCase(BaseVolumeTestCase):
                                                        volume['id'])
         self.assertIsNone(entry)
 
+    @mock.patch.object(volume_rpcapi.VolumeAPI, 'warm_image_cache')
+    def test_api_warm_image_cache(self, warm_image_cache):
+        image_id = 'c905cedb-7281-47e4-8a62-f26bc5fc4c77'
+        db.service_create(self.context, {'host': 'host@backend',
+                                         'topic': CONF.volume_topic,
+                                         'binary': 'cinder-volume'})
+        volume_api = cinder.volume.api.API()
+
+        volume_api.warm_image_cache(self.context, 'host@backend#pool',
+                                    [image_id])
+        warm_image_cache.assert_called_once_with(
+            self.context, 'host@backend#pool', [image_id])
+
+        self.assertRaises(exception.InvalidHost,
+                          volume_api.warm_image_cache, self.context,
+                          'other@backend#pool', [image_id])
+        self.assertRaises(exception.ImageNotFound,
+                          volume_api.warm_image_cache, self.context,
+                          'host@backend#pool', ['missing'])
+        self.assertEqual(1, warm_image_cache.call_count)
+
+    @mock.patch.object(vol_manager.VolumeManager, '_add_to_threadpool')
+    @mock.patch('cinder.context.get_internal_tenant_context')
+    def test_warm_image_cache(self, get_internal_context, add_to_threadpool):
+        self.volume.image_volume_cache = mock.Mock()
+        self.volume.warm_image_cache(self.context, ['image1'], pool='pool')
+
+        add_to_threadpool.assert_called_once_with(
+            self.volume._warm_image_cache, self.context,
+            get_internal_context.return_value,
+            volutils.append_host(self.volume.host, 'pool'), ['image1'])
+
+    @mock.patch.object(vol_manager.VolumeManager, '_add_to_threadpool')
+    def test_warm_image_cache_disabled(self, add_to_threadpool):
+        self.volume.image_volume_cache = None
+        self.volume.warm_image_cache(self.context, ['image1'])
+        self.assertFalse(add_to_threadpool.called)
+
+    @mock.patch.object(vol_manager.VolumeManager, '_warm_image_cache_entry')
+    def test_warm_image_cache_progress(self, warm_image_cache_entry):
+        cache = self.volume.image_volume_cache = mock.Mock()
+        results = {'image1': 'cached', 'image2': 'created'}
+
+        def _warm(ctxt, cache_ctxt, host, image_id):
+            if image_id not in results:
+                raise exception.ImageNotFound(image_id=image_id)
+            return results[image_id]
+
+        warm_image_cache_entry.side_effect = _warm
+        image_ids = ['image1', 'image2', 'image3']
+        self.volume._warm_image_cache(self.context, mock.sentinel.cache_ctxt,
+                                      'host#pool', image_ids)
+
+        self.assertEqual(3, warm_image_cache_entry.call_count)
+        events = [call[0][2] for call in cache.notify_warm.call_args_list]
+        self.assertEqual(['start', 'progress', 'progress', 'progress',
+                          'end'], events)
+        cache.notify_warm.assert_called_with(
+            self.context, 'host#pool', 'end', image_ids=image_ids, total=3,
+            cached=1, created=1, failed=1)
+
+    @mock.patch('cinder.image.glance.get_remote_image_service')
+    def test_warm_image_cache_entry_cached(self, get_image_service):
+        image_service = mock.Mock()
+        get_image_service.return_value = (image_service, 'image1')
+        cache = self.volume.image_volume_cache = mock.Mock()
+        cache.has_entry.return_value = True
+
+        self.assertEqual('cached', self.volume._warm_image_cache_entry(
+            self.context, self.context, 'host#pool', 'image1'))
+        cache.has_entry.assert_called_once_with(
+            self.context, 'host#pool', 'image1',
+            image_service.show.return_value)
+        self.assertFalse(cache.create_cache_entry.called)
+
+    @mock.patch.object(image_utils, 'qemu_img_info')
+    @mock.patch.object(image_utils.TemporaryImages, 'fetch')
+    @mock.patch('cinder.image.glance.get_remote_image_service')
+    def _warm_image_cache_entry(self, get_image_service, fetch,
+                                qemu_img_info):
+        image_service = mock.Mock()
+        get_image_service.return_value = (image_service, 'image1')
+        qemu_img_info.return_value = mock.Mock(
+            virtual_size=int(1.5 * units.Gi))
+        cache = self.volume.image_volume_cache = mock.Mock()
+        cache.has_entry.return_value = False
+
+        def _create_volume(ctxt, volume_id, allow_reschedule, volume):
+            volume.status = 'available'
+            volume.save()
+
+        with mock.patch.object(self.volume, 'create_volume',
+                               side_effect=_create_volume):
+            return self.volume._warm_image_cache_entry(
+                self.context, self.context, 'host#pool', 'image1')
+
+    def test_warm_image_cache_entry_created(self):
+        with mock.patch.object(self.volume.driver,
+                               'copy_image_to_volume') as copy_image_to_volume:
+            self.assertEqual('created', self._warm_image_cache_entry())
+
+        cache = self.volume.image_volume_cache
+        image_volume = cache.create_cache_entry.call_args[0][1]
+        self.assertEqual('host#pool', image_volume.host)
+        self.assertEqual(2, image_volume.size)
+        self.assertEqual('available', image_volume.status)
+        copy_image_to_volume.assert_called_once_with(
+            self.context, image_volume, mock.ANY, 'image1')
+        cache.ensure_space.assert_called_once_with(self.context, 2,
+                                                   'host#pool')
+
+    @mock.patch.object(vol_manager.VolumeManager, 'delete_volume')
+    def test_warm_image_cache_entry_failed(self, delete_volume):
+        with mock.patch.object(self.volume.driver,
+                               'copy_image_to_volume') as copy_image_to_volume:
+            copy_image_to_volume.side_effect = exception.ImageCopyFailure(
+                reason='fake')
+            self.assertRaises(exception.ImageCopyFailure,
+                              self._warm_image_cache_entry)
+
+        image_volume = copy_image_to_volume.call_args[0][1]
+        delete_volume.assert_called_once_with(self.context, image_volume.id,
+                                              volume=image_volume)
+        self.assertFalse(
+            self.volume.image_volume_cache.create_cache_entry.called)
+
 
 @ddt.ddt
 class DiscardFlagTestCase(BaseVolumeTestCase):
@@ -0,0 +1,122 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the in-process volume copy."""
+
+import errno
+import io
+import os
+
+import fixtures
+import mock
+from oslo_utils import units
+
+from cinder import exception
+from cinder import test
+from cinder.volume import block_copy
+
+
+class BlockCopierTestCase(test.TestCase):
+
+    def setUp(self):
+        super(BlockCopierTestCase, self).setUp()
+        tmp_dir = self.useFixture(fixtures.TempDir()).path
+        self.src = os.path.join(tmp_dir, 'src')
+        self.dest = os.path.join(tmp_dir, 'dest')
+        # Random data around a zeroed run, and zeroes at the end
+        self.data = bytearray(os.urandom(4 * units.Mi))
+        self.data[units.Mi:2 * units.Mi + 4 * units.Ki] = (
+            bytearray(units.Mi + 4 * units.Ki))
+        self.data[-units.Mi:] = bytearray(units.Mi)
+        self._write(self.src, self.data)
+        self._write(self.dest, b'x' * 8 * units.Mi)
+
+    def _write(self, path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _copy(self, src, dest, size, **kwargs):
+        copier = block_copy.BlockCopier(src, dest, size, **kwargs)
+        self.assertEqual(len(self.data), copier.copy())
+        return copier
+
+    def test_aligned_buffer(self):
+        buf = block_copy._aligned_buffer(units.Mi)
+        self.assertEqual(units.Mi, len(buf))
+        buf[0:1] = b'a'
+
+    def test_copy(self):
+        progress = mock.Mock()
+        copier = self._copy(self.src, self.dest, len(self.data),
+                            progress=progress)
+        self.assertEqual(bytes(self.data), self._read(self.dest))
+        self.assertEqual(0, copier.skipped)
+        self.assertEqual(4, progress.call_count)
+        progress.assert_called_with(len(self.data), len(self.data))
+
+    def test_copy_queue_depth(self):
+        copier = self._copy(self.src, self.dest, len(self.data),
+                            chunk_size=512 * units.Ki, queue_depth=3)
+        self.assertEqual(3, copier.queue_depth)
+        self.assertEqual(bytes(self.data), self._read(self.dest))
+
+    def test_copy_source_shorter_than_size(self):
+        self._copy(self.src, self.dest, 2 * len(self.data), queue_depth=3)
+        self.assertEqual(bytes(self.data), self._read(self.dest))
+
+    def test_copy_sparse(self):
+        copier = self._copy(self.src, self.dest, len(self.data),
+                            queue_depth=2, sparse=True)
+        self.assertEqual(bytes(self.data), self._read(self.dest))
+        # Whole blocks are skipped, the zeroes written with the data of
+        # the first block of the third chunk aren't.
+        self.assertEqual(2 * units.Mi, copier.skipped)
+
+    def test_copy_unaligned_chunks(self):
+        self._copy(self.src, self.dest, len(self.data),
+                   chunk_size=units.Mi - 1)
+        self.assertEqual(bytes(self.data), self._read(self.dest))
+
+    def test_copy_without_direct_io(self):
+        real_open = os.open
+
+        def fake_open(path, flags, *args):
+            if flags & block_copy.O_DIRECT:
+                raise OSError(errno.EINVAL, 'Invalid argument')
+            return real_open(path, flags, *args)
+
+        with mock.patch('os.open', side_effect=fake_open):
+            self._copy(self.src, self.dest, len(self.data), queue_depth=2,
+                       sync=True)
+        self.assertEqual(bytes(self.data), self._read(self.dest))
+
+    def test_copy_handles(self):
+        dest = io.BytesIO()
+        copier = self._copy(io.BytesIO(self.data), dest, len(self.data),
+                            queue_depth=4, sparse=True)
+        self.assertEqual(1, copier.queue_depth)
+        self.assertEqual(0, copier.skipped)
+        self.assertEqual(bytes(self.data), dest.getvalue())
+
+    @mock.patch('cinder.utils.temporary_chown')
+    def test_copy_function(self, mock_chown):
+        block_copy.copy(self.src, self.dest, len(self.data), queue_depth=2)
+        self.assertEqual(bytes(self.data), self._read(self.dest))
+        self.assertFalse(mock_chown.called)
+
+    def test_copy_function_error(self):
+        self.assertRaises(exception.DeviceUnavailable, block_copy.copy,
+                          self.src, self.dest + '.missing', len(self.data))
@@ -575,6 +575,18 @@ class VolumeRpcAPITestCase(test.TestCase):
                               discover=True,
                               version='1.29')
 
+    def test_warm_image_cache(self):
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        rpcapi = volume_rpcapi.VolumeAPI()
+        with mock.patch.object(rpcapi.client, 'prepare') as prepare:
+            rpcapi.warm_image_cache(ctxt, 'fake_host@backend#pool',
+                                    ['image1'])
+
+        prepare.assert_called_once_with(server='fake_host@backend',
+                                        version='1.38')
+        prepare.return_value.cast.assert_called_once_with(
+            ctxt, 'warm_image_cache', image_ids=['image1'], pool='pool')
+
     def test_remove_export(self):
         self._test_volume_api('remove_export',
                               rpc_method='cast',
@@ -681,6 +681,76 @@ class CopyVolumeTestCase(test.TestCase):
         mock_transfer.assert_called_once_with(mock.ANY, mock.ANY,
                                               1073741824, mock.ANY)
 
+    @mock.patch('cinder.volume.block_copy.copy')
+    @mock.patch('cinder.utils.execute')
+    def test_copy_volume_native(self, mock_exec, mock_copy):
+        self.override_config('volume_copy_engine', 'native')
+        self.override_config('volume_copy_queue_depth', 8)
+        progress = mock.Mock()
+        output = volume_utils.copy_volume('/dev/zero', '/dev/null', 1024,
+                                          '4M', sync=True, sparse=True,
+                                          progress=progress)
+        self.assertIsNone(output)
+        self.assertFalse(mock_exec.called)
+        mock_copy.assert_called_once_with('/dev/zero', '/dev/null',
+                                          1073741824, chunk_size=4194304,
+                                          queue_depth=8, sparse=True,
+                                          sync=True, progress=progress)
+
+    @mock.patch('os.access', return_value=True)
+    @mock.patch('cinder.volume.block_copy.copy')
+    def test_copy_volume_native_handles(self, mock_copy, mock_access):
+        self.override_config('volume_copy_engine', 'native')
+        handle = io.RawIOBase()
+        output = volume_utils.copy_volume('/foo/bar', handle, 1024, '1M')
+        self.assertIsNone(output)
+        mock_copy.assert_called_once_with('/foo/bar', handle, 1073741824,
+                                          chunk_size=1048576, queue_depth=4,
+                                          sparse=False, sync=False,
+                                          progress=None)
+
+    @mock.patch('cinder.volume.utils._calculate_count',
+                return_value=(1234, 5678))
+    @mock.patch('cinder.volume.utils.check_for_odirect_support',
+                return_value=False)
+    @mock.patch('cinder.volume.block_copy.copy')
+    @mock.patch('cinder.utils.execute')
+    def test_copy_volume_native_throttled(self, mock_exec, mock_copy,
+                                          mock_support, mock_count):
+        self.override_config('volume_copy_engine', 'native')
+        fake_throttle = throttling.Throttle(['fake_throttle'])
+        progress = mock.Mock()
+        output = volume_utils.copy_volume('/dev/zero', '/dev/null', 1024, 1,
+                                          throttle=fake_throttle,
+                                          progress=progress)
+        self.assertIsNone(output)
+        self.assertFalse(mock_copy.called)
+        mock_exec.assert_called_once_with('fake_throttle', 'dd',
+                                          'if=/dev/zero',
+                                          'of=/dev/null', 'count=5678',
+                                          'bs=1234', run_as_root=True)
+        progress.assert_called_once_with(1073741824, 1073741824)
+
+    @mock.patch('cinder.volume.utils._calculate_count',
+                return_value=(1234, 5678))
+    @mock.patch('cinder.volume.utils.check_for_odirect_support',
+                return_value=False)
+    @mock.patch('os.access', side_effect=lambda path, mode: path != '/dev/sdb')
+    @mock.patch('cinder.utils.temporary_chown')
+    @mock.patch('cinder.volume.block_copy.copy')
+    @mock.patch('cinder.utils.execute')
+    def test_copy_volume_native_not_accessible(self, mock_exec, mock_copy,
+                                               mock_chown, mock_access,
+                                               mock_support, mock_count):
+        self.override_config('volume_copy_engine', 'native')
+        output = volume_utils.copy_volume('/dev/zero', '/dev/sdb', 1024, 1)
+        self.assertIsNone(output)
+        self.assertFalse(mock_copy.called)
+        self.assertFalse(mock_chown.called)
+        mock_exec.assert_called_once_with('dd', 'if=/dev/zero',
+                                          'of=/dev/sdb', 'count=5678',
+                                          'bs=1234', run_as_root=True)
+
 
 class VolumeUtilsTestCase(test.TestCase):
     def test_null_safe_str(self):
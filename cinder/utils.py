@@ -19,6 +19,7 @@
 
 
 import abc
+import base64
 import contextlib
 import datetime
 import functools
@@ -46,6 +47,7 @@ from oslo_concurrency import lockutils
 from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 from oslo_utils import encodeutils
 from oslo_utils import excutils
 from oslo_utils import importutils
@@ -65,6 +67,7 @@ PERFECT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
 VALID_TRACE_FLAGS = {'method', 'api'}
 TRACE_METHOD = False
 TRACE_API = False
+PAGINATION_CURSOR_PREFIX = 'c1.'
 
 synchronized = lockutils.synchronized_with_prefix('cinder-')
 
@@ -1031,3 +1034,85 @@ def calculate_virtual_free_capacity(total_capacity,
         # account the reserved space.
         free = free_capacity - math.floor(total * reserved)
     return free
+
+
+def encode_pagination_cursor(values):
+    """Encode the sort key values of the last item of a page.
+
+    The resulting token is opaque to API users, who pass it back as the
+    marker of the next page.  It lets the database seek past those values
+    directly instead of loading the marker row first.
+
+    :param values: dict of sort key to the value of the last item
+    :returns: the pagination cursor string
+    """
+    data = {}
+    for key, value in values.items():
+        if isinstance(value, datetime.datetime):
+            value = {'datetime': value.strftime(PERFECT_TIME_FORMAT)}
+        data[key] = value
+    token = base64.urlsafe_b64encode(
+        jsonutils.dumps(data, sort_keys=True).encode('utf-8'))
+    return PAGINATION_CURSOR_PREFIX + token.decode('ascii').rstrip('=')
+
+
+def decode_pagination_cursor(marker):
+    """Decode a pagination cursor built by encode_pagination_cursor.
+
+    :param marker: the pagination marker given by the API user
+    :returns: dict of sort key to value, or None if the marker is not a
+              pagination cursor, e.g. the id of the last item
+    :raises InvalidInput: if the marker is a malformed cursor
+    """
+    if (not isinstance(marker, six.string_types) or
+            not marker.startswith(PAGINATION_CURSOR_PREFIX)):
+        return None
+    token = marker[len(PAGINATION_CURSOR_PREFIX):]
+    token += '=' * (-len(token) % 4)
+    try:
+        data = jsonutils.loads(
+            base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        values = {}
+        for key, value in data.items():
+            if isinstance(value, dict):
+                value = datetime.datetime.strptime(value['datetime'],
+                                                   PERFECT_TIME_FORMAT)
+            values[key] = value
+    except (AttributeError, KeyError, TypeError, ValueError):
+        msg = _('Invalid pagination marker %s.') % marker
+        raise exception.InvalidInput(reason=msg)
+    return values
+
+
+def leaky_bucket_reserve(water_level, last_leak, capacity, request_value,
+                         requested, returned, now):
+    """Reserve requests from a leaky bucket rate limit.
+
+    The bucket leaks one unit per second and holds up to capacity units,
+    every request adds request_value units to it.  Requests reserved earlier
+    and not used are given back to the bucket.
+
+    :param water_level: units in the bucket when it last leaked
+    :param last_leak: time the bucket last leaked, None if it is new
+    :param capacity: number of units the bucket holds
+    :param request_value: units added to the bucket by a request
+    :param requested: number of requests to reserve
+    :param returned: number of requests reserved earlier and not used
+    :param now: current time
+    :returns: tuple of the new water level, the number of requests granted,
+              the delay before one more request fits in the bucket if none
+              could be granted or None, and the number of requests still
+              available
+    """
+    if last_leak is not None:
+        water_level -= now - last_leak
+    water_level = max(water_level - returned * request_value, 0)
+    # Allow for rounding errors, e.g. 60 / (60 / 7) * 7 < 60
+    available = int(math.floor((capacity - water_level) / request_value +
+                               1e-9))
+    granted = min(requested, max(available, 0))
+    water_level += granted * request_value
+    delay = None
+    if requested and not granted:
+        delay = water_level + request_value - capacity
+    return water_level, granted, delay, max(available - granted, 0)
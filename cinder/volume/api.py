@@ -232,7 +232,8 @@ class API(base.Base):
                availability_zone=None, source_volume=None,
                scheduler_hints=None,
                source_replica=None, consistencygroup=None,
-               cgsnapshot=None, multiattach=False, source_cg=None):
+               cgsnapshot=None, multiattach=False, source_cg=None,
+               scheduler_batch=None):
 
         check_policy(context, 'create')
 
@@ -335,7 +336,8 @@ class API(base.Base):
                                                  availability_zones,
                                                  create_what,
                                                  sched_rpcapi,
-                                                 volume_rpcapi)
+                                                 volume_rpcapi,
+                                                 scheduler_batch)
         except Exception:
             msg = _('Failed to create api volume flow.')
             LOG.exception(msg)
@@ -350,6 +352,34 @@ class API(base.Base):
             LOG.info(_LI("Volume created successfully."), resource=vref)
             return vref
 
+    def create_volumes(self, context, count, size, name, description,
+                       **kwargs):
+        """Create several identical volumes, scheduling them together.
+
+        Volumes are created one by one as by create(), the ones that need
+        the scheduler to pick their host are then sent to it in a single
+        request so they are filtered and weighed once.
+
+        :returns: The list of volumes created. If creating one fails, the
+                  volumes created before it are still scheduled and the
+                  error is raised.
+        """
+        scheduler_batch = []
+        volumes = []
+        try:
+            for _i in range(count):
+                volumes.append(self.create(context, size, name, description,
+                                           scheduler_batch=scheduler_batch,
+                                           **kwargs))
+        finally:
+            if scheduler_batch:
+                batch_volumes, request_specs, filter_properties = zip(
+                    *scheduler_batch)
+                self.scheduler_rpcapi.create_volumes(
+                    context, CONF.volume_topic, list(batch_volumes),
+                    list(request_specs), list(filter_properties))
+        return volumes
+
     @wrap_check_policy
     def delete(self, context, volume, force=False, unmanage_only=False):
         if context.is_admin and context.project_id != volume.project_id:
@@ -470,7 +500,14 @@ class API(base.Base):
 
     def get_all(self, context, marker=None, limit=None, sort_keys=None,
                 sort_dirs=None, filters=None, viewable_admin_meta=False,
-                offset=None):
+                offset=None, columns=None):
+        """Get the volumes matching the filters.
+
+        :param columns: if given, only these volume columns and the sort keys
+                        are read and the volumes are returned as a list of
+                        dicts, instead of Volume objects with all their
+                        related data
+        """
         check_policy(context, 'get_all')
 
         if filters is None:
@@ -501,18 +538,32 @@ class API(base.Base):
         if context.is_admin and allTenants:
             # Need to remove all_tenants to pass the filtering below.
             del filters['all_tenants']
-            volumes = objects.VolumeList.get_all(context, marker, limit,
+            if columns:
+                volumes = self.db.volume_get_all(context, marker, limit,
                                                  sort_keys=sort_keys,
                                                  sort_dirs=sort_dirs,
                                                  filters=filters,
-                                                 offset=offset)
+                                                 offset=offset,
+                                                 columns=columns)
+            else:
+                volumes = objects.VolumeList.get_all(context, marker, limit,
+                                                     sort_keys=sort_keys,
+                                                     sort_dirs=sort_dirs,
+                                                     filters=filters,
+                                                     offset=offset)
         else:
             if viewable_admin_meta:
                 context = context.elevated()
-            volumes = objects.VolumeList.get_all_by_project(
-                context, context.project_id, marker, limit,
-                sort_keys=sort_keys, sort_dirs=sort_dirs, filters=filters,
-                offset=offset)
+            if columns:
+                volumes = self.db.volume_get_all_by_project(
+                    context, context.project_id, marker, limit,
+                    sort_keys=sort_keys, sort_dirs=sort_dirs,
+                    filters=filters, offset=offset, columns=columns)
+            else:
+                volumes = objects.VolumeList.get_all_by_project(
+                    context, context.project_id, marker, limit,
+                    sort_keys=sort_keys, sort_dirs=sort_dirs,
+                    filters=filters, offset=offset)
 
         LOG.info(_LI("Get all volumes completed successfully."))
         return volumes
@@ -1591,6 +1642,32 @@ class API(base.Base):
     # WRT quotas, do they count against normal quotas or not?  For
     # now they're a special resource, so no.
 
+    def warm_image_cache(self, context, host, image_ids):
+        """Create the image-volume cache entries of images on a backend.
+
+        The entries are created in the background by the volume service of
+        host, for its pool if host is given as host@backend#pool.
+        """
+        elevated = context.elevated()
+        services = objects.ServiceList.get_all_by_topic(
+            elevated, CONF.volume_topic, disabled=False)
+        svc_host = volume_utils.extract_host(host, 'backend')
+        if not any(utils.service_is_up(service) and service.host == svc_host
+                   for service in services):
+            msg = _('No available service named %s') % host
+            LOG.error(msg)
+            raise exception.InvalidHost(reason=msg)
+
+        # Fail early on unknown images, they are downloaded with the same
+        # context by the volume service.
+        for image_id in image_ids:
+            self.image_service.show(context, image_id)
+
+        LOG.info(_LI("Warming the image-volume cache of host %(host)s with "
+                     "images %(image_ids)s."),
+                 {'host': host, 'image_ids': image_ids})
+        self.volume_rpcapi.warm_image_cache(context, host, image_ids)
+
     @wrap_check_policy
     @valid_replication_volume
     def enable_replication(self, ctxt, volume):
@@ -0,0 +1,334 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-process copy of volume data.
+
+BlockCopier copies volumes without running dd: the chunks of the volume are
+read and written by a pool of green threads, each handing the I/O of a whole
+chunk to a native thread, so that up to queue_depth chunks are in flight at
+once.  When both ends are paths each green thread opens its own descriptors
+of the volumes, with O_DIRECT when the file system supports it, and works
+with a buffer aligned for direct I/O.
+
+Chunks are split in blocks of SPARSE_BLOCK_SIZE when the destination is
+sparse and the runs of zeroed blocks are skipped instead of being written.
+"""
+
+import ctypes
+import errno
+import fcntl
+import io
+import os
+import stat
+
+import eventlet
+from eventlet import tpool
+from oslo_log import log as logging
+from oslo_utils import excutils
+from oslo_utils import timeutils
+from oslo_utils import units
+import six
+
+from cinder import exception
+from cinder.i18n import _, _LE, _LI
+
+
+LOG = logging.getLogger(__name__)
+
+DIRECT_IO_ALIGNMENT = 4 * units.Ki
+SPARSE_BLOCK_SIZE = 64 * units.Ki
+PROGRESS_LOG_PERCENT = 10
+O_DIRECT = getattr(os, 'O_DIRECT', 0)
+
+
+def _aligned_buffer(size):
+    """Return a memoryview of size bytes aligned for direct I/O."""
+    buf = bytearray(size + DIRECT_IO_ALIGNMENT)
+    address = ctypes.addressof(ctypes.c_char.from_buffer(buf))
+    offset = -address % DIRECT_IO_ALIGNMENT
+    return memoryview(buf)[offset:offset + size]
+
+
+def _open(path, flags, direct):
+    """Open path, with O_DIRECT if asked and supported.
+
+    Returns the file descriptor and whether it uses direct I/O.
+    """
+    if direct and O_DIRECT:
+        try:
+            return os.open(path, flags | O_DIRECT), True
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+    return os.open(path, flags), False
+
+
+def _clear_direct(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~O_DIRECT)
+
+
+class _PathEnd(object):
+    """One end of a copy opened from a path, read or written by offset."""
+
+    seekable = True
+
+    def __init__(self, path, flags, direct):
+        self.path = path
+        fd, self.direct = _open(path, flags, direct)
+        self.file = io.FileIO(fd, 'r' if flags == os.O_RDONLY else 'w')
+        self.is_file = stat.S_ISREG(os.fstat(fd).st_mode)
+
+    def readinto(self, offset, view):
+        self.file.seek(offset)
+        read = 0
+        while read < len(view):
+            n = self.file.readinto(view[read:])
+            if not n:
+                break
+            read += n
+        return read
+
+    def write(self, offset, view):
+        if self.direct and len(view) % DIRECT_IO_ALIGNMENT:
+            # The tail of a source which is not a multiple of the
+            # alignment can't be written with direct I/O.
+            _clear_direct(self.file.fileno())
+            self.direct = False
+        self.file.seek(offset)
+        written = 0
+        while written < len(view):
+            written += self.file.write(view[written:])
+
+    def truncate(self, size):
+        if self.is_file and os.fstat(self.file.fileno()).st_size < size:
+            self.file.truncate(size)
+
+    def sync(self):
+        if self.direct:
+            return
+        try:
+            os.fsync(self.file.fileno())
+        except OSError as e:
+            # Character devices such as /dev/null can't be synced.
+            if e.errno != errno.EINVAL:
+                raise
+
+    def close(self):
+        self.file.close()
+
+
+class _HandleEnd(object):
+    """One end of a copy given as a file handle, used sequentially."""
+
+    seekable = False
+    direct = False
+
+    def __init__(self, handle):
+        self.handle = handle
+
+    def readinto(self, offset, view):
+        read = 0
+        while read < len(view):
+            data = self.handle.read(len(view) - read)
+            if not data:
+                break
+            view[read:read + len(data)] = data
+            read += len(data)
+        return read
+
+    def write(self, offset, view):
+        self.handle.write(view.tobytes())
+
+    def truncate(self, size):
+        pass
+
+    def sync(self):
+        self.handle.flush()
+
+    def close(self):
+        pass
+
+
+class BlockCopier(object):
+    """Copy size bytes from src to dest.
+
+    src and dest are paths or file handles.  Handles can only be read and
+    written sequentially, so a copy involving one runs a single chunk at a
+    time, without direct I/O.
+
+    progress is called from the calling green thread with the bytes copied
+    so far and size each time a chunk completes.
+    """
+
+    def __init__(self, src, dest, size, chunk_size=units.Mi, queue_depth=1,
+                 sparse=False, sync=False, progress=None):
+        self.src = src
+        self.dest = dest
+        self.size = size
+        self.chunk_size = chunk_size
+        self.by_path = (isinstance(src, six.string_types) and
+                        isinstance(dest, six.string_types))
+        self.queue_depth = max(1, queue_depth) if self.by_path else 1
+        self.sparse = sparse
+        self.sync = sync
+        self.progress = progress
+        self.direct = chunk_size % DIRECT_IO_ALIGNMENT == 0
+        self.copied = 0
+        self.skipped = 0
+        self.end = 0
+        self._failed = False
+        self._next_log_percent = PROGRESS_LOG_PERCENT
+        self._zeroes = bytes(bytearray(SPARSE_BLOCK_SIZE))
+
+    def _open(self, path, flags):
+        if not isinstance(path, six.string_types):
+            return _HandleEnd(path)
+        return _PathEnd(path, flags, self.direct and self.by_path)
+
+    def _zero_runs(self, view):
+        """Yield the (start, end, zeroed) runs of the blocks of view."""
+        start = 0
+        zeroed = None
+        for offset in range(0, len(view), SPARSE_BLOCK_SIZE):
+            # Comparing the bytes of a block is much faster than comparing
+            # the items of the memoryviews.
+            block = view[offset:offset + SPARSE_BLOCK_SIZE].tobytes()
+            is_zero = block == self._zeroes[:len(block)]
+            if zeroed is not None and is_zero != zeroed:
+                yield start, offset, zeroed
+                start = offset
+            zeroed = is_zero
+        if zeroed is not None:
+            yield start, len(view), zeroed
+
+    def _copy_chunk(self, src, dest, buf, offset):
+        """Copy the chunk at offset, runs in a native thread.
+
+        Returns the number of bytes read and of zeroed bytes skipped.
+        """
+        length = min(self.chunk_size, self.size - offset)
+        view = buf[:length]
+        read = src.readinto(offset, view)
+        view = view[:read]
+        if not (self.sparse and dest.seekable):
+            if read:
+                dest.write(offset, view)
+            return read, 0
+
+        skipped = 0
+        for start, end, zeroed in self._zero_runs(view):
+            if zeroed:
+                skipped += end - start
+            else:
+                dest.write(offset + start, view[start:end])
+        return read, skipped
+
+    def _report(self):
+        if self.progress:
+            self.progress(self.copied, self.size)
+        percent = self.copied * 100 // self.size
+        if percent >= self._next_log_percent:
+            LOG.debug("Copied %(percent)d%% of %(src)s to %(dest)s.",
+                      {'percent': percent, 'src': self.src,
+                       'dest': self.dest})
+            self._next_log_percent = (
+                (percent // PROGRESS_LOG_PERCENT + 1) * PROGRESS_LOG_PERCENT)
+
+    def _worker(self, chunks):
+        src = self._open(self.src, os.O_RDONLY)
+        try:
+            dest = self._open(self.dest, os.O_WRONLY)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                src.close()
+        try:
+            buf = _aligned_buffer(self.chunk_size)
+            for offset in chunks:
+                if self._failed:
+                    return
+                read, skipped = tpool.execute(self._copy_chunk, src, dest,
+                                              buf, offset)
+                self.copied += read
+                self.skipped += skipped
+                if read:
+                    self.end = max(self.end, offset + read)
+                self._report()
+                if read < min(self.chunk_size, self.size - offset):
+                    # End of the source
+                    break
+            if self.sparse:
+                # Zeroes skipped at the end of a file must still extend it,
+                # the last worker to finish has seen the whole copy.
+                dest.truncate(self.end)
+            if self.sync:
+                tpool.execute(dest.sync)
+        except Exception:
+            self._failed = True
+            raise
+        finally:
+            src.close()
+            dest.close()
+
+    def copy(self):
+        """Copy the volume, returns the number of bytes copied."""
+        if isinstance(self.dest, six.string_types):
+            # Like dd, empty a destination file before writing to it, the
+            # zeroes skipped in it then read back as zeroes.
+            self._open(self.dest, os.O_WRONLY | os.O_TRUNC).close()
+
+        # Each worker takes the next chunk to copy from the shared iterator.
+        chunks = iter(range(0, self.size, self.chunk_size))
+        if self.queue_depth == 1:
+            self._worker(chunks)
+            return self.copied
+
+        pool = eventlet.GreenPool(self.queue_depth)
+        workers = [pool.spawn(self._worker, chunks)
+                   for _i in range(self.queue_depth)]
+        errors = []
+        for worker in workers:
+            try:
+                worker.wait()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        return self.copied
+
+
+def copy(src, dest, size, chunk_size=units.Mi, queue_depth=1, sparse=False,
+         sync=False, progress=None):
+    """Copy size bytes from src to dest with a BlockCopier.
+
+    The paths are opened by the user of the process, which must be able to
+    read src and write dest.
+    """
+    copier = BlockCopier(src, dest, size, chunk_size=chunk_size,
+                         queue_depth=queue_depth, sparse=sparse, sync=sync,
+                         progress=progress)
+    start_time = timeutils.utcnow()
+    try:
+        copier.copy()
+    except (IOError, OSError) as e:
+        LOG.error(_LE("Failed to copy volume from %(src)s to %(dest)s: "
+                      "%(error)s"),
+                  {'src': src, 'dest': dest, 'error': e})
+        raise exception.DeviceUnavailable(
+            _("Failed to copy volume: %s") % e)
+    duration = max(1, timeutils.delta_seconds(start_time, timeutils.utcnow()))
+
+    size_in_m = float(copier.copied) / units.Mi
+    LOG.info(_LI("Volume copy %(size_in_m).2f MB at %(mbps).2f MB/s "
+                 "(%(skipped).2f MB of zeroes skipped)."),
+             {'size_in_m': size_in_m, 'mbps': size_in_m / duration,
+              'skipped': float(copier.skipped) / units.Mi})
@@ -125,6 +125,20 @@ volume_opts = [
                default=0,
                help='The upper limit of bandwidth of volume copy. '
                     '0 => unlimited'),
+    cfg.StrOpt('volume_copy_engine',
+               default='dd',
+               choices=['dd', 'native'],
+               help='How volumes are copied and cleared: by running dd, or '
+                    'native to copy them in the volume service with '
+                    'queued direct I/O. Copies throttled with blkio cgroups '
+                    'or run with ionice, and volumes the service user can\'t '
+                    'open, always use dd.'),
+    cfg.IntOpt('volume_copy_queue_depth',
+               default=4,
+               min=1,
+               help='Number of chunks of volume_dd_blocksize read and '
+                    'written concurrently by the native volume copy '
+                    'engine.'),
     cfg.StrOpt('iscsi_write_cache',
                default='on',
                choices=['on', 'off'],
@@ -247,6 +261,18 @@ volume_opts = [
                default=0,
                help='Max number of entries allowed in the image volume cache. '
                     '0 => unlimited.'),
+    cfg.StrOpt('image_volume_cache_eviction_policy',
+               default='lru',
+               choices=['lru', 'lfu', 'gdsf'],
+               help='Policy used to choose the entries evicted from the '
+                    'image volume cache when it is full: the least recently '
+                    'used (lru), the least frequently used (lfu) or the '
+                    'lowest Greedy-Dual-Size-Frequency priority (gdsf), '
+                    'which prefers to evict large and seldom used entries.'),
+    cfg.IntOpt('image_volume_cache_warm_concurrency',
+               default=2,
+               help='Number of images downloaded at the same time when '
+                    'warming the image volume cache of this backend.'),
     cfg.BoolOpt('report_discard_supported',
                 default=False,
                 help='Report to clients of Cinder that the backend supports '
@@ -1081,6 +1107,58 @@ class BaseVD(object):
     def backup_use_temp_snapshot(self):
         return False
 
+    def get_changed_extents(self, context, snapshot, device):
+        """Return the extents of a device that changed since a snapshot.
+
+        Used to back up only the data written since the snapshot the parent
+        backup was taken from.
+
+        :param context: the context of the caller
+        :param snapshot: snapshot the changes are relative to
+        :param device: volume or snapshot of the same volume being backed up
+        :returns: list of (offset, length) tuples in bytes, or None if the
+                  driver can't tell what changed
+        """
+        return None
+
+    def _get_backup_changed_extents(self, context, backup, backup_service,
+                                    device):
+        """Return the extents changed since the parent backup, if known."""
+        if not backup.parent_id or not getattr(
+                backup_service, 'support_changed_extents', False):
+            return None
+        try:
+            parent_backup = objects.Backup.get_by_id(context,
+                                                     backup.parent_id)
+            if not parent_backup.snapshot_id:
+                return None
+            snapshot = objects.Snapshot.get_by_id(context,
+                                                  parent_backup.snapshot_id)
+            if snapshot.status != 'available':
+                return None
+            changed_extents = self.get_changed_extents(context, snapshot,
+                                                       device)
+        except Exception:
+            # Reading the whole volume is always an option, so don't fail
+            # the backup because the changes couldn't be determined.
+            LOG.warning(_LW('Unable to get the extents changed since backup '
+                            '%(parent)s, reading the whole device.'),
+                        {'parent': backup.parent_id}, exc_info=True)
+            return None
+        if changed_extents is not None:
+            LOG.debug('%(count)d extents changed since backup %(parent)s.',
+                      {'count': len(changed_extents),
+                       'parent': backup.parent_id})
+        return changed_extents
+
+    def _backup_file(self, backup_service, backup, volume_file,
+                     changed_extents=None):
+        if changed_extents is None:
+            backup_service.backup(backup, volume_file)
+        else:
+            backup_service.backup(backup, volume_file,
+                                  changed_extents=changed_extents)
+
     def backup_volume(self, context, backup, backup_service):
         """Create a new backup from an existing volume."""
         # NOTE(xyang): _backup_volume_temp_snapshot and
@@ -1203,6 +1281,8 @@ class BaseVD(object):
         enforce_multipath = self.configuration.enforce_multipath_for_image_xfer
         properties = utils.brick_get_connector_properties(use_multipath,
                                                           enforce_multipath)
+        changed_extents = self._get_backup_changed_extents(
+            context, backup, backup_service, device)
         if is_snapshot:
             attach_info, device = self._attach_snapshot(context, device,
                                                         properties)
@@ -1215,11 +1295,13 @@ class BaseVD(object):
             # Secure network file systems will not chown files.
             if self.secure_file_operations_enabled():
                 with open(device_path) as device_file:
-                    backup_service.backup(backup, device_file)
+                    self._backup_file(backup_service, backup, device_file,
+                                      changed_extents)
             else:
                 with utils.temporary_chown(device_path):
                     with open(device_path) as device_file:
-                        backup_service.backup(backup, device_file)
+                        self._backup_file(backup_service, backup,
+                                          device_file, changed_extents)
 
         finally:
             if is_snapshot:
@@ -515,6 +515,17 @@ class LVMVolumeDriver(driver.VolumeDriver):
                     image_service):
         return None, False
 
+    def get_changed_extents(self, context, snapshot, device):
+        """Return the extents changed since a snapshot using thin_delta."""
+        if self.configuration.lvm_type != 'thin':
+            return None
+        if isinstance(device, objects.Snapshot):
+            name = self._escape_snapshot(device['name'])
+        else:
+            name = device['name']
+        return self.vg.get_thin_delta(self._escape_snapshot(snapshot['name']),
+                                      name)
+
     def backup_volume(self, context, backup, backup_service):
         """Create a new backup from an existing volume."""
         volume = self.db.volume_get(context, backup.volume_id)
@@ -522,9 +533,11 @@ class LVMVolumeDriver(driver.VolumeDriver):
         if backup.snapshot_id:
             snapshot = objects.Snapshot.get_by_id(context, backup.snapshot_id)
         temp_snapshot = None
+        device = volume
         # NOTE(xyang): If it is to backup from snapshot, back it up
         # directly. No need to clean it up.
         if snapshot:
+            device = snapshot
             volume_path = self.local_path(snapshot)
         else:
             # NOTE(xyang): If it is not to backup from snapshot, check volume
@@ -537,14 +550,18 @@ class LVMVolumeDriver(driver.VolumeDriver):
                 temp_snapshot = self._create_temp_snapshot(context, volume)
                 backup.temp_snapshot_id = temp_snapshot.id
                 backup.save()
+                device = temp_snapshot
                 volume_path = self.local_path(temp_snapshot)
             else:
                 volume_path = self.local_path(volume)
 
         try:
+            changed_extents = self._get_backup_changed_extents(
+                context, backup, backup_service, device)
             with utils.temporary_chown(volume_path):
                 with open(volume_path) as volume_file:
-                    backup_service.backup(backup, volume_file)
+                    self._backup_file(backup_service, backup, volume_file,
+                                      changed_extents)
         finally:
             if temp_snapshot:
                 self._delete_temp_snapshot(context, temp_snapshot)
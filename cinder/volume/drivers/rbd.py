@@ -946,9 +946,30 @@ class RBDDriver(driver.TransferVD, driver.ExtendVD,
                                       image_meta, tmp_file)
         os.unlink(tmp_file)
 
+    def get_changed_extents(self, context, snapshot, device):
+        """Return the extents changed since a snapshot using diff_iterate."""
+        # Only the volume itself has the snapshot in its history.
+        if device['id'] != snapshot['volume_id']:
+            return None
+
+        extents = []
+
+        def _iterate_cb(offset, length, exists):
+            extents.append((offset, length))
+
+        with RBDVolumeProxy(self, device['name'],
+                            self.configuration.rbd_pool,
+                            read_only=True) as rbd_image:
+            rbd_image.diff_iterate(0, rbd_image.size(),
+                                   utils.convert_str(snapshot['name']),
+                                   _iterate_cb)
+        return extents
+
     def backup_volume(self, context, backup, backup_service):
         """Create a new backup from an existing volume."""
         volume = self.db.volume_get(context, backup['volume_id'])
+        changed_extents = self._get_backup_changed_extents(
+            context, backup, backup_service, volume)
 
         with RBDVolumeProxy(self, volume['name'],
                             self.configuration.rbd_pool) as rbd_image:
@@ -956,7 +977,7 @@ class RBDDriver(driver.TransferVD, driver.ExtendVD,
                                         self.configuration.rbd_user,
                                         self.configuration.rbd_ceph_conf)
             rbd_fd = RBDImageIOWrapper(rbd_meta)
-            backup_service.backup(backup, rbd_fd)
+            self._backup_file(backup_service, backup, rbd_fd, changed_extents)
 
         LOG.debug("volume backup complete.")
 
@@ -766,6 +766,46 @@ class RemoteFSSnapDriver(RemoteFSDriver, driver.SnapshotVD):
 
         return output
 
+    def get_changed_extents(self, context, snapshot, device):
+        """Return the extents changed since a snapshot.
+
+        Data written after a snapshot lands in the qcow2 overlay created for
+        it or in overlays created later on, so the changed extents are the
+        ones allocated at or above that overlay in the active image's
+        backing chain.
+        """
+        if device['id'] != snapshot['volume_id']:
+            return None
+
+        volume = snapshot['volume']
+        info_path = self._local_path_volume_info(volume)
+        snap_info = self._read_info_file(info_path, empty_if_missing=True)
+        snap_file = snap_info.get(snapshot['id'])
+        if snap_file is None:
+            return None
+
+        active_path = os.path.join(self._local_volume_dir(volume),
+                                   snap_info['active'])
+        chain = [entry['filename'] for entry in
+                 self._get_backing_chain_for_path(volume, active_path)]
+        if snap_file not in chain:
+            return None
+        max_depth = chain.index(snap_file)
+
+        out, _err = self._execute('qemu-img', 'map', '--output=json',
+                                  active_path,
+                                  run_as_root=self._execute_as_root)
+        extents = []
+        for entry in json.loads(out):
+            if entry['depth'] > max_depth:
+                continue
+            offset, length = entry['start'], entry['length']
+            if extents and extents[-1][0] + extents[-1][1] == offset:
+                extents[-1] = (extents[-1][0], extents[-1][1] + length)
+            else:
+                extents.append((offset, length))
+        return extents
+
     def _get_hash_str(self, base_str):
         """Return a string that represents hash of base_str.
 
@@ -37,8 +37,10 @@ intact.
 """
 
 
+import math
 import time
 
+from eventlet import greenpool
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging as messaging
@@ -60,6 +62,7 @@ from cinder import flow_utils
 from cinder.i18n import _, _LE, _LI, _LW
 from cinder.image import cache as image_cache
 from cinder.image import glance
+from cinder.image import image_utils
 from cinder import manager
 from cinder import objects
 from cinder.objects import fields
@@ -204,7 +207,7 @@ def locked_snapshot_operation(f):
 class VolumeManager(manager.SchedulerDependentManager):
     """Manages attachable block storage devices."""
 
-    RPC_API_VERSION = '1.37'
+    RPC_API_VERSION = '1.38'
 
     target = messaging.Target(version=RPC_API_VERSION)
 
@@ -265,12 +268,15 @@ class VolumeManager(manager.SchedulerDependentManager):
                 'image_volume_cache_max_size_gb')
             max_cache_entries = self.driver.configuration.safe_get(
                 'image_volume_cache_max_count')
+            eviction_policy = self.driver.configuration.safe_get(
+                'image_volume_cache_eviction_policy')
 
             self.image_volume_cache = image_cache.ImageVolumeCache(
                 self.db,
                 cinder_volume.API(),
                 max_cache_size,
-                max_cache_entries
+                max_cache_entries,
+                eviction_policy or 'lru'
             )
             LOG.info(_LI('Image-volume cache enabled for host %(host)s.'),
                      {'host': self.host})
@@ -1093,6 +1099,127 @@ class VolumeManager(manager.SchedulerDependentManager):
             if image_volume:
                 self.delete_volume(ctx, image_volume.id)
 
+    def _warm_image_cache(self, ctxt, cache_ctxt, host, image_ids):
+        cache = self.image_volume_cache
+        progress = {'total': len(image_ids),
+                    'cached': 0,
+                    'created': 0,
+                    'failed': 0}
+        cache.notify_warm(ctxt, host, 'start', image_ids=image_ids,
+                          **progress)
+
+        def _warm(image_id):
+            try:
+                result = self._warm_image_cache_entry(ctxt, cache_ctxt, host,
+                                                      image_id)
+            except Exception:
+                LOG.exception(_LE('Failed to warm the image-volume cache of '
+                                  'host %(host)s with image %(image_id)s.'),
+                              {'host': host, 'image_id': image_id})
+                result = 'failed'
+            progress[result] += 1
+            LOG.info(_LI('Image %(image_id)s %(result)s in the image-volume '
+                         'cache of host %(host)s (%(done)d/%(total)d).'),
+                     {'image_id': image_id, 'result': result, 'host': host,
+                      'done': (progress['cached'] + progress['created'] +
+                               progress['failed']),
+                      'total': progress['total']})
+            cache.notify_warm(ctxt, host, 'progress', image_id=image_id,
+                              result=result, **progress)
+
+        concurrency = self.driver.configuration.safe_get(
+            'image_volume_cache_warm_concurrency') or 1
+        pool = greenpool.GreenPool(concurrency)
+        for image_id in image_ids:
+            pool.spawn_n(_warm, image_id)
+        pool.waitall()
+        cache.notify_warm(ctxt, host, 'end', image_ids=image_ids, **progress)
+
+    def _warm_image_cache_entry(self, ctxt, cache_ctxt, host, image_id):
+        """Create the image-volume cache entry of an image if missing.
+
+        The image is downloaded with ctxt, the image-volume is owned by the
+        internal tenant of cache_ctxt.
+        :returns: 'cached' if the image already was in the cache, 'created'
+                  if its entry was created or 'failed' if there is no space
+                  for it.
+        """
+        image_service, image_id = glance.get_remote_image_service(ctxt,
+                                                                  image_id)
+        image_meta = image_service.show(ctxt, image_id)
+        if self.image_volume_cache.has_entry(cache_ctxt, host, image_id,
+                                             image_meta):
+            return 'cached'
+
+        with image_utils.TemporaryImages.fetch(image_service, ctxt,
+                                               image_id) as tmp_image:
+            data = image_utils.qemu_img_info(tmp_image)
+            size = max(int(math.ceil(float(data.virtual_size) / units.Gi)), 1)
+            if not self.image_volume_cache.ensure_space(cache_ctxt, size,
+                                                        host):
+                LOG.warning(_LW('Unable to ensure space for image-volume in '
+                                'cache. Will skip creating entry for image '
+                                '%(image)s on host %(host)s.'),
+                            {'image': image_id, 'host': host})
+                return 'failed'
+
+            image_volume = self._create_image_volume(cache_ctxt, host, size,
+                                                     image_id)
+            try:
+                self.create_volume(cache_ctxt, image_volume.id,
+                                   allow_reschedule=False,
+                                   volume=image_volume)
+                image_volume.refresh()
+                if image_volume.status != 'available':
+                    raise exception.InvalidVolume(
+                        _('Volume is not available.'))
+
+                image_volume.status = 'downloading'
+                image_volume.save()
+                self.driver.copy_image_to_volume(ctxt, image_volume,
+                                                 image_service, image_id)
+                image_volume.status = 'available'
+                image_volume.save()
+                self.db.volume_admin_metadata_update(cache_ctxt.elevated(),
+                                                     image_volume.id,
+                                                     {'readonly': 'True'},
+                                                     False)
+                self.image_volume_cache.create_cache_entry(cache_ctxt,
+                                                           image_volume,
+                                                           image_id,
+                                                           image_meta)
+            except Exception:
+                with excutils.save_and_reraise_exception():
+                    try:
+                        self.delete_volume(cache_ctxt, image_volume.id,
+                                           volume=image_volume)
+                    except exception.CinderException:
+                        LOG.exception(_LE('Could not delete the image volume '
+                                          '%(id)s.'), {'id': image_volume.id})
+        return 'created'
+
+    def _create_image_volume(self, ctx, host, size, image_id):
+        """Create the database entry of a new image-volume on host."""
+        reservations = QUOTAS.reserve(ctx, volumes=1, gigabytes=size)
+        try:
+            image_volume = objects.Volume(
+                context=ctx,
+                host=host,
+                size=size,
+                user_id=ctx.user_id,
+                project_id=ctx.project_id,
+                availability_zone=CONF.storage_availability_zone,
+                attach_status='detached',
+                status='creating',
+                display_name='image-%s' % image_id)
+            image_volume.create()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                QUOTAS.rollback(ctx, reservations)
+
+        QUOTAS.commit(ctx, reservations, project_id=ctx.project_id)
+        return image_volume
+
     def _clone_image_volume(self, ctx, volume, image_meta):
         volume_type_id = volume.get('volume_type_id')
         reserve_opts = {'volumes': 1, 'gigabytes': volume.size}
@@ -3493,3 +3620,28 @@ class VolumeManager(manager.SchedulerDependentManager):
         capabilities = self.driver.capabilities
         LOG.debug("Obtained capabilities list: %s.", capabilities)
         return capabilities
+
+    def warm_image_cache(self, ctxt, image_ids, pool=None):
+        """Create the image-volume cache entries of images in the background.
+
+        The entries are created for the given pool of this backend, or for
+        its default pool.
+        """
+        if not self.image_volume_cache:
+            LOG.warning(_LW('Image-volume cache disabled for host %(host)s, '
+                            'not warming it.'), {'host': self.host})
+            return
+
+        cache_ctxt = context.get_internal_tenant_context()
+        if not cache_ctxt:
+            LOG.warning(_LW('Unable to get Cinder internal context, not '
+                            'warming the image-volume cache.'))
+            return
+
+        if not pool:
+            pool = (self.driver.configuration.safe_get(
+                'volume_backend_name') or vol_utils.extract_host(
+                    self.host, 'pool', True))
+        host = vol_utils.append_host(self.host, pool)
+        self._add_to_threadpool(self._warm_image_cache, ctxt, cache_ctxt,
+                                host, image_ids)
@@ -85,9 +85,10 @@ class VolumeAPI(rpc.RPCAPI):
                migrate_volume_completion(), and update_migrated_volume().
         1.37 - Adds old_reservations parameter to retype to support quota
                checks in the API.
+        1.38 - Adds warm_image_cache.
     """
 
-    RPC_API_VERSION = '1.37'
+    RPC_API_VERSION = '1.38'
     TOPIC = CONF.volume_topic
     BINARY = 'cinder-volume'
 
@@ -326,3 +327,8 @@ class VolumeAPI(rpc.RPCAPI):
     def get_capabilities(self, ctxt, host, discover):
         cctxt = self._get_cctxt(host, '1.29')
         return cctxt.call(ctxt, 'get_capabilities', discover=discover)
+
+    def warm_image_cache(self, ctxt, host, image_ids):
+        cctxt = self._get_cctxt(host, '1.38')
+        cctxt.cast(ctxt, 'warm_image_cache', image_ids=image_ids,
+                   pool=utils.extract_host(host, 'pool'))